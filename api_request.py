@@ -0,0 +1,96 @@
+"""HTTP-клиент Bot API с метриками и раздельными потоками запросов.
+
+Ответы пользователям (interactive) и массовые отправки — рассылки итогов,
+выгрузки (bulk) — идут через разные InstrumentedRequest, то есть через
+разные пулы соединений: рассылка не может занять все соединения и
+задержать ответы. Кроме того, массовый запрос пропускает вперед
+интерактивные, которые выполняются в этот момент (TrafficPriority).
+"""
+import asyncio
+import time
+from typing import Optional
+
+from telegram.request import HTTPXRequest
+
+from metrics import API_BULK_DEFERRED, API_ERRORS, API_REQUESTS, API_SECONDS
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Сколько (сек) массовый запрос ждет завершения интерактивных, прежде чем пойти все равно
+BULK_MAX_DEFER = 0.05
+
+
+class TrafficPriority:
+    """Общий для обоих потоков учет интерактивных запросов в работе.
+
+    Массовый запрос перед отправкой ждет, пока интерактивные закончатся, но не
+    дольше max_defer, поэтому рассылка уступает ответам и при этом не
+    останавливается при постоянном потоке пользователей.
+    """
+
+    def __init__(self, max_defer: float = BULK_MAX_DEFER):
+        self.max_defer = max_defer
+        self.interactive = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        # Создается в работающем event loop при первом запросе
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            self._idle.set()
+        return self._idle
+
+    def interactive_started(self):
+        self.interactive += 1
+        self._event().clear()
+
+    def interactive_finished(self):
+        self.interactive -= 1
+        if not self.interactive:
+            self._event().set()
+
+    async def bulk_turn(self):
+        """Дожидается очереди массового запроса"""
+        if not self.interactive:
+            return
+        API_BULK_DEFERRED.inc()
+        try:
+            await asyncio.wait_for(self._event().wait(), self.max_defer)
+        except asyncio.TimeoutError:
+            pass
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который записывает метрики каждого запроса к Bot API.
+
+    lane — поток запросов (INTERACTIVE или BULK); с общим priority массовые
+    запросы уступают интерактивным.
+    """
+
+    def __init__(self, *args, lane: str = INTERACTIVE, priority: Optional[TrafficPriority] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lane = lane
+        self.priority = priority
+
+    async def do_request(self, url: str, method: str, request_data=None, **timeouts):
+        api_method = url.rsplit("/", 1)[-1]
+        API_REQUESTS.labels(self.lane, api_method).inc()
+        interactive = self.priority is not None and self.lane == INTERACTIVE
+        if self.priority is not None and self.lane == BULK:
+            await self.priority.bulk_turn()
+        elif interactive:
+            self.priority.interactive_started()
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            API_ERRORS.labels(self.lane, api_method, type(e).__name__).inc()
+            raise
+        finally:
+            API_SECONDS.labels(self.lane, api_method).observe(time.perf_counter() - started)
+            if interactive:
+                self.priority.interactive_finished()
+        if code >= 400:
+            API_ERRORS.labels(self.lane, api_method, str(code)).inc()
+        return code, payload
@@ -0,0 +1,71 @@
+"""Сравнение последовательной рассылки (старый цикл в lottery) и Broadcaster на FakeBotApi.
+
+Лимиты FakeBotApi как у Telegram: 30 сообщений в секунду всего и одно в секунду в чат.
+
+Запуск: python benchmarks/bench_broadcast.py --participants 300 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot  # noqa: E402
+from telegram.error import RetryAfter  # noqa: E402
+
+from broadcast import Broadcaster, BroadcastMessage  # noqa: E402
+from benchmarks.fake_api import FakeBotApi, fake_bot  # noqa: E402
+
+
+def make_messages(count: int):
+    return [
+        BroadcastMessage(chat_id=1000 + i, text=f"🎲 **Жеребе нәтижесі!** #{i}", parse_mode="Markdown")
+        for i in range(count)
+    ]
+
+
+def telegram_limits(latency: float) -> FakeBotApi:
+    return FakeBotApi(latency=latency, jitter=0.02, global_limit=30, per_chat_limit=1)
+
+
+async def sequential(bot: Bot, messages):
+    """Старый цикл: по одному сообщению, 429 приводит к потере сообщения"""
+    sent = 0
+    for message in messages:
+        try:
+            await bot.send_message(chat_id=message.chat_id, text=message.text, parse_mode=message.parse_mode)
+            sent += 1
+        except RetryAfter:
+            pass
+    return sent
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--participants", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, default=25.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = make_messages(args.participants)
+
+    api = telegram_limits(args.latency)
+    bot = await fake_bot(api)
+    started = time.perf_counter()
+    sent = await sequential(bot, messages)
+    sequential_time = time.perf_counter() - started
+    print(f"sequential:  {sequential_time:7.2f}s  sent={sent}/{len(messages)}  429={api.rejected}")
+
+    api = telegram_limits(args.latency)
+    broadcaster = Broadcaster(await fake_bot(api), global_rate=args.rate, concurrency=args.concurrency)
+    result = await broadcaster.run(messages)
+    print(f"broadcaster: {result.elapsed:7.2f}s  sent={result.sent}/{result.total}  "
+          f"429={api.rejected}  retries={result.retries}")
+    print(f"speedup: x{sequential_time / result.elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""Массовый импорт участников: bulk_import против add_participant на каждую строку.
+
+Создает CSV на --rows синтетических участников (с долей ошибочных строк)
+и для каждого режима хранения замеряет разбор с проверкой, запись импорта
+одной операцией (import_participants + ожидание записи на диск) и, для
+сравнения, добавление тех же участников по одному через add_participant.
+
+Запуск: python benchmarks/bench_import.py --rows 100000 --storage journal json sqlite
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import make_record  # noqa: E402
+from bulk_import import read_file  # noqa: E402
+
+FIELDS = ("user_id", "username", "name", "desired_book", "comment")
+
+
+def make_csv(path: str, rows: int, bad: float, seed: int):
+    """CSV как из анкеты; доля bad строк с пустым именем или слишком коротким названием книги"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for i in range(rows):
+            record = make_record(1_000_000 + i, rng)
+            if rng.random() < bad:
+                record[rng.choice(["name", "desired_book"])] = "x"
+            writer.writerow(record)
+
+
+def run(book_bot, storage: str, path: str, args) -> dict:
+    os.chdir(tempfile.mkdtemp(prefix=f"import_{storage}_"))
+    book_bot.STORAGE_MODE = storage
+    result = {}
+
+    started = time.perf_counter()
+    report = read_file(path)
+    result["parse"] = time.perf_counter() - started
+    result["valid"] = len(report.records)
+    result["errors"] = len(report.errors)
+
+    bot_data = book_bot.create_bot_data()
+    started = time.perf_counter()
+    bot_data.import_participants(report.records)
+    asyncio.run(bot_data.flush())
+    result["import"] = time.perf_counter() - started
+    bot_data.close()
+
+    # Те же участники по одному в пустое мероприятие
+    os.chdir(tempfile.mkdtemp(prefix=f"add_{storage}_"))
+    bot_data = book_bot.create_bot_data()
+    records = report.records[:args.add_rows]
+    started = time.perf_counter()
+    for record in records:
+        bot_data.add_participant(record["user_id"], record["username"], record["name"],
+                                 record["desired_book"], record["comment"])
+    asyncio.run(bot_data.flush())
+    elapsed = time.perf_counter() - started
+    bot_data.close()
+    # Пересчет на все строки, если по одному добавлялась только часть
+    result["add_each"] = elapsed * len(report.records) / max(1, len(records))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--bad", type=float, default=0.01, help="доля ошибочных строк")
+    parser.add_argument("--storage", nargs="+", default=["journal", "json", "sqlite"],
+                        choices=["json", "journal", "sqlite"])
+    parser.add_argument("--add-rows", type=int, default=20_000,
+                        help="сколько строк добавлять по одному (время пересчитывается на все)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_import_"))
+    import book_bot
+    book_bot.METRICS_PORT = 0
+
+    path = os.path.abspath("participants.csv")
+    make_csv(path, args.rows, args.bad, args.seed)
+    print(f"rows={args.rows} file={os.path.getsize(path) / 1e6:.1f}MB")
+    print(f"{'storage':<8} {'valid':>7} {'errors':>6} {'parse,s':>8} {'import,s':>9} {'rows/s':>8} {'add_each,s':>11}")
+    for storage in args.storage:
+        r = run(book_bot, storage, path, args)
+        total = r["parse"] + r["import"]
+        print(f"{storage:<8} {r['valid']:>7} {r['errors']:>6} {r['parse']:>8.2f} {r['import']:>9.2f} "
+              f"{args.rows / total:>8.0f} {r['add_each']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Задержка ответов пользователям во время рассылки: общий пул соединений против раздельных.
+
+Бот ходит по HTTP в FakeTelegramServer с задержкой сети. Пока Broadcaster
+рассылает итоги жеребьевки, «пользователь» каждые --probe-interval секунд
+получает ответ send_message, и замеряется его задержка. Три прогона:
+    idle      — без рассылки (базовая задержка)
+    shared    — рассылка и ответы через один пул (как раньше в main)
+    separate  — раздельные пулы interactive/bulk и приоритет ответов (как сейчас в main)
+
+Запуск: python benchmarks/bench_lanes.py --messages 3000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram import Bot  # noqa: E402
+
+from api_request import BULK, INTERACTIVE, InstrumentedRequest, TrafficPriority  # noqa: E402
+from benchmarks.fake_api import FAKE_TOKEN, FakeTelegramServer  # noqa: E402
+from benchmarks.load_registrations import percentile  # noqa: E402
+from broadcast import Broadcaster, BroadcastMessage  # noqa: E402
+
+PROBE_CHAT_ID = 1
+
+
+class ServerThread:
+    """FakeTelegramServer в своем потоке и event loop, чтобы не делить процессор цикла с ботом"""
+
+    def __init__(self, latency: float):
+        self.server = FakeTelegramServer(latency=latency)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> FakeTelegramServer:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        return self.server
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def make_bot(server: FakeTelegramServer, pool_size: int, lane: str = INTERACTIVE,
+             priority: TrafficPriority = None) -> Bot:
+    request = InstrumentedRequest(
+        lane=lane, priority=priority, connection_pool_size=pool_size,
+        connect_timeout=30.0, read_timeout=30.0, write_timeout=30.0, pool_timeout=30.0
+    )
+    return Bot(FAKE_TOKEN, base_url=server.base_url, request=request)
+
+
+async def probe(bot: Bot, interval: float, done: asyncio.Event) -> list:
+    """Отправляет ответы пользователю, пока не закончится рассылка; задержка каждого"""
+    latencies = []
+    while not done.is_set():
+        started = time.perf_counter()
+        await bot.send_message(chat_id=PROBE_CHAT_ID, text="Қандай кітапты оқығыңыз келеді?")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(mode: str, args) -> dict:
+    with ServerThread(args.latency) as server:
+        return await run_bots(server, mode, args)
+
+
+async def run_bots(server: FakeTelegramServer, mode: str, args) -> dict:
+    if mode == "separate":
+        priority = TrafficPriority()
+        interactive = make_bot(server, args.interactive_pool, INTERACTIVE, priority)
+        bulk = make_bot(server, args.bulk_pool, BULK, priority)
+    else:
+        interactive = bulk = make_bot(server, args.bulk_pool)
+    bots = {interactive, bulk}
+    for bot in bots:
+        await bot.initialize()
+
+    done = asyncio.Event()
+    prober = asyncio.create_task(probe(interactive, args.probe_interval, done))
+    started = time.perf_counter()
+    sent = 0
+    if mode == "idle":
+        await asyncio.sleep(args.idle)
+    else:
+        messages = [BroadcastMessage(chat_id=1000 + i, text=f"Сообщение {i}") for i in range(args.messages)]
+        broadcaster = Broadcaster(bulk, global_rate=args.rate, concurrency=args.concurrency)
+        result = await broadcaster.run(messages)
+        sent = result.sent
+    elapsed = time.perf_counter() - started
+    done.set()
+    latencies = await prober
+
+    for bot in bots:
+        await bot.shutdown()
+    return {
+        "probes": len(latencies),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies, default=0.0),
+        "sent": sent,
+        "send_rate": sent / elapsed if sent else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=3000, help="сообщений в рассылке")
+    parser.add_argument("--rate", type=float, default=10_000.0, help="лимит рассылки, сообщений/сек")
+    parser.add_argument("--concurrency", type=int, default=128, help="одновременных отправок рассылки")
+    parser.add_argument("--bulk-pool", type=int, default=32, help="пул рассылки (и общий пул в shared)")
+    parser.add_argument("--interactive-pool", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка сети на запрос, сек")
+    parser.add_argument("--probe-interval", type=float, default=0.02, help="пауза между ответами, сек")
+    parser.add_argument("--idle", type=float, default=2.0, help="длительность прогона без рассылки, сек")
+    args = parser.parse_args()
+
+    print(f"{'mode':<9} {'probes':>7} {'p50,ms':>8} {'p99,ms':>8} {'max,ms':>8} {'sent':>6} {'send/s':>7}")
+    for mode in ("idle", "shared", "separate"):
+        stats = await run(mode, args)
+        print(f"{mode:<9} {stats['probes']:>7} {stats['p50'] * 1000:>8.0f} {stats['p99'] * 1000:>8.0f} "
+              f"{stats['max'] * 1000:>8.0f} {stats['sent']:>6} {stats['send_rate']:>7.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
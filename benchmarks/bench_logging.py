@@ -0,0 +1,112 @@
+"""Задержка event loop во время волны ошибок: синхронный StreamHandler против очереди logs.py.
+
+Имитируется рассылка, в которой каждый запрос падает с TimedOut и пишет
+ошибку в лог, а поток вывода медленный (--write-delay на запись, как
+забитый pipe или диск). Параллельно тикер каждые 5 мс замеряет, насколько
+event loop опаздывает. Режимы:
+    sync   — logging.StreamHandler, как было с basicConfig
+    queue  — setup_logging: очередь, фоновый поток, ограничение повторов
+
+Запуск: python benchmarks/bench_logging.py --errors 20000 --write-delay 0.0002
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram.error import TimedOut  # noqa: E402
+
+import logs  # noqa: E402
+from benchmarks.load_registrations import percentile  # noqa: E402
+
+TICK = 0.005
+
+
+class SlowStream:
+    """Поток вывода, каждая запись в который занимает delay секунд"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text: str):
+        time.sleep(self.delay)
+        self.writes += 1
+
+    def flush(self):
+        pass
+
+
+async def ticker(done: asyncio.Event) -> list:
+    """Опоздания event loop относительно запланированных тиков"""
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not done.is_set():
+        planned = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - planned)
+    return lags
+
+
+async def storm(logger: logging.Logger, errors: int, concurrency: int):
+    async def send(chat_id: int):
+        await asyncio.sleep(0)
+        logger.error("Не удалось отправить сообщение пользователю %s: %s", chat_id, TimedOut())
+
+    for start in range(0, errors, concurrency):
+        await asyncio.gather(*(send(chat_id) for chat_id in range(start, min(errors, start + concurrency))))
+
+
+async def run(mode: str, args) -> dict:
+    stream = SlowStream(args.write_delay)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if mode == "sync":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(logs.TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        logs.setup_logging(repeat_limit=args.repeat_limit, stream=stream)
+
+    done = asyncio.Event()
+    lags = asyncio.create_task(ticker(done))
+    started = time.perf_counter()
+    await storm(logging.getLogger("broadcast"), args.errors, args.concurrency)
+    elapsed = time.perf_counter() - started
+    done.set()
+    lags = await lags
+    if mode == "queue":
+        logs.stop_logging()
+    return {
+        "elapsed": elapsed,
+        "p50": percentile(lags, 0.50),
+        "p99": percentile(lags, 0.99),
+        "max": max(lags, default=0.0),
+        "written": stream.writes,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--errors", type=int, default=20000, help="ошибок в волне")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных отправок")
+    parser.add_argument("--repeat-limit", type=int, default=5, help="LOG_REPEAT_LIMIT для queue (0 — без ограничения)")
+    parser.add_argument("--write-delay", type=float, default=0.0002, help="время одной записи в поток, сек")
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'storm,s':>8} {'lag p50,ms':>11} {'lag p99,ms':>11} {'lag max,ms':>11} {'written':>8}")
+    for mode in ("sync", "queue"):
+        stats = await run(mode, args)
+        print(f"{mode:<6} {stats['elapsed']:>8.2f} {stats['p50'] * 1000:>11.1f} {stats['p99'] * 1000:>11.1f} "
+              f"{stats['max'] * 1000:>11.1f} {stats['written']:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""Время распределения пар в зависимости от числа участников и плотности запретов.
+
+Запуск: python benchmarks/bench_matching.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import Exclusions, match  # noqa: E402
+
+
+def make_exclusions(ids, rng: random.Random, couples: float, team_size: int) -> Exclusions:
+    """Пары супругов, команды и прошлогодние назначения"""
+    exclusions = Exclusions()
+    shuffled = ids.copy()
+    rng.shuffle(shuffled)
+    couples_count = int(len(ids) * couples) // 2
+    for i in range(couples_count):
+        exclusions.forbid_pair(shuffled[2 * i], shuffled[2 * i + 1])
+    if team_size > 1:
+        for start in range(0, len(ids), team_size * 10):
+            exclusions.forbid_group(ids[start:start + team_size])
+    previous = ids.copy()
+    rng.shuffle(previous)
+    exclusions.forbid_previous({previous[i]: previous[(i + 1) % len(previous)] for i in range(len(previous))})
+    return exclusions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--couples", type=float, default=0.3, help="доля участников в парах")
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'n':>9} {'запретов':>10} {'время, с':>10} {'мкс/участник':>13}")
+    for n in args.sizes:
+        rng = random.Random(args.seed)
+        ids = list(range(1, n + 1))
+        exclusions = make_exclusions(ids, rng, args.couples, args.team_size)
+        edges = sum(len(forbidden) for forbidden in exclusions.forbidden.values())
+
+        started = time.perf_counter()
+        assignments = match(ids, exclusions, seed=args.seed)
+        elapsed = time.perf_counter() - started
+
+        assert all(exclusions.allowed(g, r) for g, r in assignments.items())
+        assert sorted(assignments.values()) == ids
+        print(f"{n:>9} {edges:>10} {elapsed:>10.3f} {elapsed / n * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""CPU на отрисовку сообщений жеребьевки: прежний код (18 str.replace на поле) против rendering.py.
+
+Запуск: python benchmarks/bench_rendering.py --participants 10000 --draws 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rendering import CardCache, is_valid_markdown, render_lottery_result  # noqa: E402
+
+BOOKS = [
+    "Мұқағали Мақатаев “Махаббат диалогы”",
+    "Мұхтар Әуезов “Абай жолы”",
+    "Ә. Нұрпейісов “Қан мен тер”",
+    "Ж. Аймауытов “Ақбілек”",
+    "Кристи А.: Человек в коричневом костюме",
+    "Дадзай О.: Человек недостойный (2-е изд.)",
+]
+
+
+@dataclass
+class Card:
+    user_id: int
+    name: str
+    desired_book: str
+    comment: str
+
+
+def old_escape_markdown(text: str) -> str:
+    if not text:
+        return ""
+    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+    for char in special_chars:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+
+def old_render(receiver: Card) -> str:
+    name_escaped = old_escape_markdown(receiver.name)
+    book_escaped = old_escape_markdown(receiver.desired_book)
+    comment_escaped = old_escape_markdown(receiver.comment) if receiver.comment else ""
+    message_text = (
+        "🎲 **Жеребе нәтижесі!**\n\n"
+        f"Сізге осы оқырман түсті **{name_escaped}**\n\n"
+        f"📖 **Оқырман қалайтын кітап:**\n"
+        f"_{book_escaped}_\n\n"
+    )
+    if receiver.comment:
+        message_text += f"💬 **Пікір:**\n_{comment_escaped}_"
+    return message_text
+
+
+def make_cards(count: int, rng: random.Random):
+    cards = []
+    for i in range(count):
+        books = rng.sample(BOOKS, rng.randint(1, 5))
+        cards.append(Card(
+            user_id=i,
+            name=f"Оқырман_{i}",
+            desired_book="\n".join(f"{n}.{book}" for n, book in enumerate(books, 1)),
+            comment=rng.choice(["", "Осылардың 1-еуін таңдаңыз🤭", "Рахмет!"]),
+        ))
+    return cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--participants", type=int, default=10000)
+    parser.add_argument("--draws", type=int, default=3, help="жеребьевка + повторные")
+    args = parser.parse_args()
+
+    cards = make_cards(args.participants, random.Random(1))
+
+    started = time.process_time()
+    for _ in range(args.draws):
+        for card in cards:
+            old_render(card)
+    old_cpu = time.process_time() - started
+
+    started = time.process_time()
+    for card in cards:
+        render_lottery_result(card)
+    uncached_cpu = time.process_time() - started
+
+    cache = CardCache()
+    started = time.process_time()
+    for _ in range(args.draws):
+        for card in cards:
+            cache.lottery_result(card)
+    cached_cpu = time.process_time() - started
+
+    invalid = sum(1 for card in cards if not is_valid_markdown(render_lottery_result(card).text))
+    print(f"participants={args.participants} draws={args.draws}")
+    print(f"old (replace x18, no cache):   {old_cpu * 1000:8.1f} ms CPU")
+    print(f"new, one draw without cache:   {uncached_cpu * 1000:8.1f} ms CPU")
+    print(f"new, {args.draws} draws with cache:      {cached_cpu * 1000:8.1f} ms CPU")
+    print(f"cards that fell back to plain text: {invalid}")
+
+
+if __name__ == "__main__":
+    main()
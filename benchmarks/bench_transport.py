@@ -0,0 +1,112 @@
+"""Сквозное сравнение polling и webhook на одной машине через FakeTelegramServer.
+
+Бот (настоящий Application с обработчиками book_bot) ходит в локальный
+сервер по HTTP. Сервер отдает обновления /start либо через getUpdates, либо
+POST-запросом на webhook и замеряет время до ответа бота.
+
+Запуск: python benchmarks/bench_transport.py --users 300 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.fake_api import FAKE_TOKEN, FakeTelegramServer, message_update  # noqa: E402
+from benchmarks.load_registrations import percentile  # noqa: E402
+from events import EventRegistry  # noqa: E402
+
+WEBHOOK_PATH = "telegram"
+WEBHOOK_SECRET = "local-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(book_bot, mode: str, users: int, latency: float) -> dict:
+    pushed = defaultdict(deque)
+    latencies = []
+
+    def on_call(method: str, params: dict, at: float):
+        chat_id = params.get("chat_id")
+        if method == "sendMessage" and chat_id and pushed[int(chat_id)]:
+            latencies.append(at - pushed[int(chat_id)].popleft())
+
+    server = FakeTelegramServer(latency=latency, on_call=on_call)
+    await server.start()
+
+    # Каждый прогон — с чистыми данными мероприятия по умолчанию в новом каталоге
+    os.chdir(tempfile.mkdtemp())
+    book_bot.events = EventRegistry(book_bot.create_event)
+    application = Application.builder() \
+        .token(FAKE_TOKEN) \
+        .base_url(server.base_url) \
+        .concurrent_updates(book_bot.PerUserUpdateProcessor(book_bot.MAX_CONCURRENT_UPDATES)) \
+        .build()
+    book_bot.add_handlers(application)
+    await application.initialize()
+    await application.start()
+    if mode == "webhook":
+        port = free_port()
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"http://127.0.0.1:{port}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+
+    started = time.perf_counter()
+    for user_id in range(1, users + 1):
+        pushed[user_id].append(time.perf_counter())
+        server.push_update(message_update(user_id, "/start"))
+        # Пользователи приходят не одновременно, а потоком
+        await asyncio.sleep(0.001)
+    while len(latencies) < users and time.perf_counter() - started < 120:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await server.stop()
+    book_bot.events.close()
+    return {
+        "answered": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка сети на запрос, сек")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    import book_bot
+
+    for mode in ("polling", "webhook"):
+        stats = await run(book_bot, mode, args.users, args.latency)
+        print(f"{mode:>8}: answered {stats['answered']}/{args.users} in {stats['elapsed']:.2f}s "
+              f"({stats['throughput']:.0f}/s), p50={stats['p50'] * 1000:.0f}ms p99={stats['p99'] * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
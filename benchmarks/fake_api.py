@@ -0,0 +1,337 @@
+"""Имитация Bot API для бенчмарков: одна реализация ответов для всех способов подключения.
+
+FakeBotApi подключается к Application или telegram.Bot как BaseRequest и
+проходит весь путь python-telegram-bot (сериализация, разбор ответа, ошибки
+по HTTP-кодам). Умеет задержку сети, 429 при превышении общего и
+поканального лимитов, 403 для заблокированных чатов и 400 на неразбираемую
+разметку. FakeTelegramServer отдает те же ответы по HTTP вместо
+api.telegram.org (polling и webhook) для сквозных замеров на одной машине.
+
+    bot = await fake_bot(FakeBotApi(latency=0.05, global_limit=30))  # Broadcaster и т.п.
+    Application.builder().token(FAKE_TOKEN).request(api).get_updates_request(api)
+    Application.builder().token(FAKE_TOKEN).base_url(server.base_url)  # по HTTP
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+from telegram import Bot
+from telegram.request import BaseRequest, RequestData
+
+FAKE_TOKEN = "123456:FAKE"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Кітап-гәп", "username": "kitapgap_fake_bot"}
+
+# Одновременных POST на webhook (как max_connections у Telegram)
+WEBHOOK_MAX_CONNECTIONS = 40
+
+
+class FakeBotApi(BaseRequest):
+    """Отвечает на запросы Bot API с заданной задержкой; может отдавать 429, 403 и 400"""
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, global_limit: int = 0,
+                 per_chat_limit: int = 0, retry_after: int = 1, blocked: Set[int] = None,
+                 seed: int = 0, on_call: Callable[[str, dict, float], None] = None):
+        self.latency = latency
+        self.jitter = jitter
+        # Лимиты отправок в секунду; 0 - без ограничения
+        self.global_limit = global_limit
+        self.per_chat_limit = per_chat_limit
+        self.retry_after = retry_after
+        self.blocked = blocked or set()
+        self.random = random.Random(seed)
+        self.on_call = on_call
+        self.calls: Dict[str, int] = {}
+        self.sent: List[dict] = []
+        self.documents: List[Tuple[int, bytes]] = []
+        self.rejected = 0
+        self._message_ids = itertools.count(1)
+        self._window: Deque[float] = deque()
+        self._chat_windows: Dict[int, Deque[float]] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def _method(url: str) -> str:
+        return url.rsplit("/", 1)[-1]
+
+    def _message(self, chat_id: int, text: str = None) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text or "",
+        }
+
+    @staticmethod
+    def _expire(window: Deque[float], now: float):
+        while window and now - window[0] >= 1.0:
+            window.popleft()
+
+    def _rate_limited(self, chat_id: int) -> bool:
+        if not self.global_limit and not self.per_chat_limit:
+            return False
+        now = time.monotonic()
+        self._expire(self._window, now)
+        chat_window = self._chat_windows.setdefault(chat_id, deque())
+        self._expire(chat_window, now)
+        if (self.global_limit and len(self._window) >= self.global_limit) or \
+                (self.per_chat_limit and len(chat_window) >= self.per_chat_limit):
+            self.rejected += 1
+            return True
+        self._window.append(now)
+        chat_window.append(now)
+        return False
+
+    @staticmethod
+    def _error(code: int, description: str, retry_after: int = None) -> Tuple[int, bytes]:
+        body = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return code, json.dumps(body).encode()
+
+    def respond(self, method: str, params: dict) -> Tuple[int, bytes]:
+        """Формирует ответ Bot API на вызов метода"""
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            chat_id = int(chat_id)
+            if chat_id in self.blocked:
+                return self._error(403, "Forbidden: bot was blocked by the user")
+            if method.startswith("send") and self._rate_limited(chat_id):
+                return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                                   retry_after=self.retry_after)
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = []
+        elif method in ("sendMessage", "editMessageText"):
+            text = params.get("text")
+            # Незакрытая разметка Markdown, как ее отвергает Telegram
+            if params.get("parse_mode") and text and text.count("*") % 2:
+                return self._error(400, "Bad Request: can't parse entities")
+            if method == "sendMessage":
+                self.sent.append({"chat_id": chat_id, "text": text, "parse_mode": params.get("parse_mode")})
+            result = self._message(chat_id, text)
+        elif method == "sendDocument":
+            result = self._message(chat_id)
+            result["document"] = {"file_id": "fake", "file_unique_id": "fake"}
+        else:
+            # answerCallbackQuery, deleteWebhook, setWebhook и т.п.
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}, ensure_ascii=False).encode()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = self._method(url)
+        params = request_data.parameters if request_data else {}
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if request_data and request_data.contains_files:
+            for input_file in request_data.multipart_data.values():
+                self.documents.append((params.get("chat_id"), input_file[1]))
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.on_call:
+            self.on_call(api_method, params, time.perf_counter())
+        return self.respond(api_method, params)
+
+
+async def fake_bot(api: FakeBotApi) -> Bot:
+    """telegram.Bot поверх FakeBotApi, готовый к вызовам (например, для Broadcaster)"""
+    bot = Bot(FAKE_TOKEN, request=api, get_updates_request=api)
+    await bot.initialize()
+    return bot
+
+
+class FakeTelegramServer:
+    """Локальный HTTP-сервер вместо api.telegram.org с ответами FakeBotApi.
+
+    Понимает getUpdates (long polling), setWebhook/deleteWebhook и методы
+    отправки. Обновления, добавленные через push_update, отдаются боту либо
+    через getUpdates, либо POST-запросом на его webhook. latency — задержка
+    сети на каждый запрос и каждый POST на webhook.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 on_call: Callable[[str, dict, float], None] = None, api: FakeBotApi = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # Задержку добавляет сам сервер, у FakeBotApi остаются ответы и лимиты
+        self.api = api or FakeBotApi(latency=0.0)
+        if on_call is not None:
+            self.api.on_call = on_call
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._new_updates = asyncio.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._webhook_slots = asyncio.Semaphore(WEBHOOK_MAX_CONNECTIONS)
+        self._tasks = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=WEBHOOK_MAX_CONNECTIONS))
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        # Отпускает висящие long polling запросы
+        self._new_updates.set()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._client:
+            await self._client.aclose()
+
+    # ==================== ОБНОВЛЕНИЯ ====================
+    def push_update(self, update: dict):
+        """Передает обновление боту (через webhook, если он установлен)"""
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+        if self.webhook_url:
+            task = asyncio.create_task(self._post_webhook(update))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+
+    async def _post_webhook(self, update: dict):
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+        async with self._webhook_slots:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            await self._client.post(self.webhook_url, content=json.dumps(update), headers=headers)
+
+    async def _get_updates(self, params: dict) -> bytes:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = self._updates[:limit]
+        return json.dumps({"ok": True, "result": batch}, ensure_ascii=False).encode()
+
+    # ==================== HTTP ====================
+    async def _dispatch(self, method: str, params: dict):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getUpdates":
+            return 200, await self._get_updates(params)
+        if method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            return 200, b'{"ok": true, "result": true}'
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return 200, b'{"ok": true, "result": true}'
+        self.api.calls[method] = self.api.calls.get(method, 0) + 1
+        if self.api.on_call:
+            self.api.on_call(method, params, time.perf_counter())
+        return self.api.respond(method, params)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                method = urlsplit(target).path.rsplit("/", 1)[-1]
+                if headers.get("content-type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = dict(parse_qsl(body.decode("utf-8")))
+                status, payload = await self._dispatch(method, params)
+
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+# ==================== ФАБРИКИ ОБНОВЛЕНИЙ ====================
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Reader {user_id}", "username": f"reader{user_id}"}
+
+
+def message_update(user_id: int, text: str) -> dict:
+    """JSON обновления с текстовым сообщением (или командой, если текст начинается с /)"""
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    """JSON обновления с нажатием inline-кнопки"""
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "...",
+            },
+        },
+    }
@@ -0,0 +1,254 @@
+"""Нагрузочный генератор диалогов: тысячи одновременных пользователей через настоящий Application.
+
+Каждый пользователь проходит /start → имя → книга → комментарий (или кнопка
+«Пропустить») → /send и с заданной вероятностью удаляет данные через /clear;
+параллельно админ листает /list. Пользователь, как живой, ждет ответа бота
+перед следующим шагом. Для каждого шага проверяется, что ответ пришел и что
+это ответ именно на этот шаг: пропуски (нет ответа за --timeout) и ответы не
+того шага считаются нарушением переходов ConversationHandler.
+
+Несколько значений --processor прогоняются по очереди на тех же пользователях,
+например последовательная обработка против PerUserUpdateProcessor. Всплеск
+регистраций — все приходят разом и не думают: --ramp 0 --think 0.
+
+Запуск:
+    python benchmarks/load_registrations.py --users 2000 --ramp 5 --latency 0.05
+    python benchmarks/load_registrations.py --users 500 --ramp 0 --think 0 --processor sequential per-user
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.fake_api import FAKE_TOKEN, FakeBotApi, callback_update, message_update  # noqa: E402
+from benchmarks.synthetic import make_record  # noqa: E402
+from events import DEFAULT_EVENT, EventRegistry  # noqa: E402
+
+REPLY_METHODS = {"sendMessage", "editMessageText"}
+
+# Начало ответа бота на каждый шаг диалога
+EXPECTED = {
+    "start": ("«Кітап-гәп»", "У вас уже есть сохраненные данные"),
+    "name": ("Қандай кітапты",),
+    "book": ("Пікір қалдыра аласыз",),
+    "comment": ("📋",),
+    "skip_comment": ("📋",),
+    "send": ("Спасибо! Ваши данные сохранены",),
+    "clear": ("Сіз сенімдісіз бе?",),
+    "clear_confirm": ("Деректеріңіз жойылды",),
+    "list": ("📋 Қатысушылар тізімі", "Участников пока нет"),
+}
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ReplyRouter:
+    """Доставляет ответы бота ждущим их симулированным пользователям"""
+
+    def __init__(self):
+        self.waiting: Dict[int, asyncio.Future] = {}
+        self.unexpected = 0
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[chat_id] = future
+        return future
+
+    def on_call(self, method: str, params: dict, at: float):
+        if method not in REPLY_METHODS:
+            return
+        future = self.waiting.pop(int(params["chat_id"]), None)
+        if future is None or future.done():
+            # Лишний ответ: пользователь его не ждал (дубль или ответ на пропущенный шаг)
+            self.unexpected += 1
+            return
+        future.set_result((params.get("text") or "", at))
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.dropped: Counter = Counter()
+        self.wrong: Counter = Counter()
+        self.samples: List[str] = []
+        self.updates = 0
+
+
+async def step(application: Application, router: ReplyRouter, stats: Stats, user_id: int,
+               name: str, update: dict, timeout: float) -> bool:
+    """Отправляет обновление и ждет ответа; False, если ответа нет или он от другого шага"""
+    reply = router.expect(user_id)
+    sent_at = time.perf_counter()
+    stats.updates += 1
+    await application.update_queue.put(Update.de_json(update, application.bot))
+    try:
+        text, replied_at = await asyncio.wait_for(reply, timeout)
+    except asyncio.TimeoutError:
+        router.waiting.pop(user_id, None)
+        stats.dropped[name] += 1
+        return False
+    stats.latencies[name].append(replied_at - sent_at)
+    if not text.startswith(EXPECTED[name]):
+        stats.wrong[name] += 1
+        if len(stats.samples) < 5:
+            stats.samples.append(f"{name}: {text[:60]!r}")
+        return False
+    return True
+
+
+async def simulate_user(application, router, stats, user_id: int, rng: random.Random, args) -> Optional[dict]:
+    """Проходит регистрацию; возвращает введенные данные, если пользователь остался зарегистрирован"""
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    record = make_record(user_id, rng)
+    comment = record["comment"] or "Рахмет!"
+    skip = rng.random() < args.skip
+
+    async def think():
+        if args.think:
+            await asyncio.sleep(rng.uniform(0, args.think))
+
+    flow = [
+        ("start", message_update(user_id, "/start")),
+        ("name", message_update(user_id, record["name"])),
+        ("book", message_update(user_id, record["desired_book"])),
+        ("skip_comment", callback_update(user_id, "skip_comment")) if skip
+        else ("comment", message_update(user_id, comment)),
+        ("send", message_update(user_id, "/send")),
+    ]
+    if rng.random() < args.clear:
+        flow += [
+            ("clear", message_update(user_id, "/clear")),
+            ("clear_confirm", callback_update(user_id, "clear_my_data")),
+        ]
+    for name, update in flow:
+        if not await step(application, router, stats, user_id, name, update, args.timeout):
+            return None
+        await think()
+    if flow[-1][0] == "clear_confirm":
+        return None
+    # Обработчики сохраняют введенный текст без пробелов по краям
+    return {"name": record["name"].strip(), "desired_book": record["desired_book"].strip(),
+            "comment": "" if skip else comment.strip()}
+
+
+async def simulate_admin(application, router, stats, admin_id: int, args, done: asyncio.Event):
+    """Админ периодически открывает /list, пока идет нагрузка"""
+    while not done.is_set():
+        await step(application, router, stats, admin_id, "list", message_update(admin_id, "/list"), args.timeout)
+        try:
+            await asyncio.wait_for(done.wait(), args.list_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(book_bot, processor: str, args):
+    os.chdir(tempfile.mkdtemp())
+    book_bot.events = EventRegistry(book_bot.create_event)
+    router = ReplyRouter()
+    stats = Stats()
+
+    api = FakeBotApi(latency=args.latency, jitter=args.latency / 2, on_call=router.on_call)
+    builder = Application.builder().token(FAKE_TOKEN).request(api).get_updates_request(api)
+    if processor == "per-user":
+        builder = builder.concurrent_updates(book_bot.PerUserUpdateProcessor(args.max_concurrent))
+    if args.persistence:
+        builder = builder.persistence(book_bot.DraftPersistence("drafts.json"))
+    application = builder.build()
+    book_bot.add_handlers(application)
+    await application.initialize()
+    await application.start()
+
+    rng = random.Random(args.seed)
+    done = asyncio.Event()
+    admin = asyncio.create_task(simulate_admin(application, router, stats, book_bot.ADMIN_ID, args, done))
+    started = time.perf_counter()
+    user_ids = [10_000_000 + i for i in range(args.users)]
+    results = await asyncio.gather(*(
+        simulate_user(application, router, stats, user_id, random.Random(rng.random()), args)
+        for user_id in user_ids
+    ))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await admin
+
+    # Сверяем сохраненные данные с тем, что вводили пользователи
+    bot_data = book_bot.events.get(DEFAULT_EVENT).bot_data
+    expected = {user_id: data for user_id, data in zip(user_ids, results) if data}
+    mismatched = 0
+    for user_id, data in expected.items():
+        participant = bot_data.get_participant(user_id)
+        if participant is None or (participant.name, participant.desired_book, participant.comment) != (
+                data["name"], data["desired_book"], data["comment"]):
+            mismatched += 1
+    extra = bot_data.count_participants() - len(expected)
+
+    await application.stop()
+    await application.shutdown()
+    book_bot.events.close()
+    return stats, router, elapsed, len(expected), mismatched, extra
+
+
+def report(processor: str, stats: Stats, router: ReplyRouter, elapsed: float, registered: int,
+           mismatched: int, extra: int, args):
+    total = sum(len(values) for values in stats.latencies.values())
+    print(f"users={args.users} processor={processor} latency={args.latency * 1000:.0f}ms")
+    print(f"{stats.updates} updates in {elapsed:.2f}s: {total / elapsed:.0f} replies/s, "
+          f"{registered / elapsed:.0f} registrations/s")
+    print(f"{'step':<14} {'count':>7} {'p50,ms':>8} {'p95,ms':>8} {'p99,ms':>8} {'max,ms':>8} {'dropped':>8} {'wrong':>6}")
+    for name in EXPECTED:
+        values = stats.latencies.get(name, [])
+        if not values and not stats.dropped[name]:
+            continue
+        print(f"{name:<14} {len(values):>7} {percentile(values, 0.5) * 1000:>8.0f} "
+              f"{percentile(values, 0.95) * 1000:>8.0f} {percentile(values, 0.99) * 1000:>8.0f} "
+              f"{max(values, default=0) * 1000:>8.0f} {stats.dropped[name]:>8} {stats.wrong[name]:>6}")
+    print(f"dropped={sum(stats.dropped.values())} wrong_transitions={sum(stats.wrong.values())} "
+          f"unexpected_replies={router.unexpected}")
+    print(f"registered={registered} mismatched_data={mismatched} extra_participants={extra}")
+    for sample in stats.samples:
+        print(f"  wrong reply: {sample}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд приходят все пользователи")
+    parser.add_argument("--think", type=float, default=0.2, help="пауза пользователя между шагами, до N сек")
+    parser.add_argument("--skip", type=float, default=0.3, help="доля нажимающих «Пропустить» вместо комментария")
+    parser.add_argument("--clear", type=float, default=0.1, help="доля удаляющих данные через /clear")
+    parser.add_argument("--list-interval", type=float, default=0.5, help="как часто админ открывает /list, сек")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка Bot API, сек")
+    parser.add_argument("--timeout", type=float, default=30.0, help="сколько ждать ответа на шаг, сек")
+    parser.add_argument("--processor", nargs="+", choices=["per-user", "sequential"], default=["per-user"],
+                        help="обработка обновлений; несколько значений — сравнение по очереди")
+    parser.add_argument("--max-concurrent", type=int, default=64)
+    parser.add_argument("--persistence", action="store_true", help="с сохранением черновиков (DraftPersistence)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    import book_bot
+    book_bot.METRICS_PORT = 0
+
+    for processor in args.processor:
+        report(processor, *await run(book_bot, processor, args), args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""Память на одного участника: прежний dataclass с __dict__ против текущего представления.
+
+Замеряет через tracemalloc, сколько байт занимает весь загруженный BotData:
+словарь участников (объекты, строки и сам словарь) и теневая копия записей
+в PersistenceWriter, для JSON-снимка и для бинарного снимка до и после
+декодирования всех участников. «Прежнее» представление воспроизводит старую
+загрузку: @dataclass без __slots__, отдельные строки у каждого участника и
+теневая копия из asdict.
+
+Запуск: python benchmarks/memory.py --count 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import make_snapshot  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+
+@dataclass
+class DictParticipant:
+    """Participant до перехода на __slots__"""
+    user_id: int
+    username: str
+    name: str
+    desired_book: str
+    comment: str
+    assigned_to: int = None
+
+
+def load_dict_bot_data(storage):
+    """Загрузка, как она была: без пула строк, по объекту с __dict__ на участника, и теневая копия записей"""
+    participants = {}
+    for pid_str, p_data in storage.load().items():
+        p_data['user_id'] = int(p_data['user_id'])
+        if p_data.get('assigned_to'):
+            p_data['assigned_to'] = int(p_data['assigned_to'])
+        participants[int(pid_str)] = DictParticipant(**p_data)
+    records = {str(pid): asdict(p) for pid, p in participants.items()}
+    return participants, records
+
+
+def measure(count: int, build):
+    """Байт на участника, которые остаются занятыми после build()"""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / count, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_memory_") as workdir:
+        os.chdir(workdir)
+        try:
+            run(args)
+        finally:
+            os.chdir(ROOT)
+
+
+def run(args):
+    import book_bot
+    book_bot.METRICS_PORT = 0
+
+    snapshot = make_snapshot(args.count, args.seed)
+    create_storage("json", book_bot.DATA_FILE, "json").save(snapshot)
+    create_storage("json", "binary.json", "binary").save(snapshot)
+    del snapshot
+
+    def bot_data(snapshot_format: str, data_file: str):
+        # Весь BotData, как в боте: участники и теневая копия в потоке записи
+        return book_bot.BotData(data_file, "journal", snapshot_format=snapshot_format)
+
+    cases = [
+        ("dataclass (прежний)", lambda: load_dict_bot_data(create_storage("json", book_bot.DATA_FILE))),
+        ("slots + пул строк, JSON", lambda: bot_data("json", book_bot.DATA_FILE)),
+    ]
+    print(f"participants={args.count}")
+    print(f"{'представление':<34} {'байт/участник':>14}")
+    for title, build in cases:
+        per_participant, result = measure(args.count, build)
+        print(f"{title:<34} {per_participant:>14.0f}")
+        if isinstance(result, book_bot.BotData):
+            result.close()
+        del result
+
+    # Бинарный снимок: сразу после загрузки и после декодирования всех участников
+    data = None
+
+    def load_binary():
+        nonlocal data
+        data = bot_data("binary", "binary.json")
+        return data
+
+    per_participant, _ = measure(args.count, load_binary)
+    print(f"{'бинарный снимок, после загрузки':<34} {per_participant:>14.0f}")
+
+    def decode_all():
+        for _ in data.participants.values():
+            pass
+
+    # К памяти после загрузки добавляются декодированные участники (сам снимок — в mmap, вне кучи)
+    decoded, _ = measure(args.count, decode_all)
+    print(f"{'бинарный снимок, все декодированы':<34} {per_participant + decoded:>14.0f}")
+    data.close()
+
+
+if __name__ == "__main__":
+    main()
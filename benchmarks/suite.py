@@ -0,0 +1,259 @@
+"""Набор бенчмарков бота на 1k–1M синтетических участников с записью результатов в JSON.
+
+Замеряет запуск мероприятия (загрузка снимка и журнала), первый полный
+перебор участников, BotData.load_data, save_data, add_participant, perform_lottery,
+escape_markdown, отрисовку страниц /list, подготовку сообщений жеребьевки и
+цикл рассылки (Broadcaster на FakeBotApi с задержкой сети). Результаты вместе с
+версией кода пишутся в JSON; --compare сравнивает два таких файла.
+
+Запуск:
+    python benchmarks/suite.py --sizes 1000 10000 100000 1000000 --output results.json
+    python benchmarks/suite.py --compare old.json results.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_api import FakeBotApi, fake_bot  # noqa: E402
+from benchmarks.synthetic import iter_records, make_snapshot  # noqa: E402
+from broadcast import Broadcaster  # noqa: E402
+from events import DEFAULT_EVENT, EventRegistry  # noqa: E402
+from matching import Exclusions  # noqa: E402
+from rendering import escape_markdown  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Во сколько раз метрика должна вырасти, чтобы --compare отметил регрессию
+REGRESSION_RATIO = 1.2
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def best_of(repeat: int, function, *args):
+    """Минимальное время из repeat запусков (меньше шума на коротких замерах) и последний результат"""
+    best = None
+    for _ in range(repeat):
+        elapsed, result = timed(function, *args)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def send_sample(messages, args):
+    """Цикл рассылки без лимитов Bot API: замеряется сам Broadcaster"""
+    bot = await fake_bot(FakeBotApi(latency=args.latency))
+    return await Broadcaster(bot, global_rate=args.send_rate).run(messages)
+
+
+def bench_size(book_bot, n: int, args) -> dict:
+    """Все замеры для одного размера; данные создаются в отдельном временном каталоге и удаляются после"""
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"bench_{n}_", dir=workdir) as size_dir:
+        os.chdir(size_dir)
+        try:
+            return measure_size(book_bot, n, args)
+        finally:
+            os.chdir(workdir)
+
+
+def measure_size(book_bot, n: int, args) -> dict:
+    """Замеры для одного размера в текущем каталоге"""
+    book_bot.STORAGE_MODE = args.storage
+    book_bot.SNAPSHOT_FORMAT = args.snapshot_format
+    result = {}
+
+    # Снимок на диске, как после работы бота
+    snapshot = make_snapshot(n, args.seed)
+    storage = create_storage(args.storage, book_bot.DATA_FILE, args.snapshot_format)
+    storage.save(snapshot)
+    snapshot_file = storage.binary_file if args.snapshot_format == "binary" else book_bot.DATA_FILE
+    result["file_bytes"] = os.path.getsize(snapshot_file)
+    del snapshot, storage
+    gc.collect()
+
+    # Холодный старт мероприятия: все, что происходит до ответа первому пользователю
+    book_bot.events = EventRegistry(book_bot.create_event)
+    result["event_load"], event = timed(book_bot.events.get, DEFAULT_EVENT)
+    bot_data = event.bot_data
+    # Для бинарного снимка здесь декодируются все участники
+    result["first_scan"], _ = timed(bot_data.get_all_participants)
+
+    result["load_data"], _ = best_of(args.repeat, bot_data.load_data)
+
+    # Полная запись снимка (save_data только ставит запрос, ждем записи на диск)
+    def save():
+        bot_data.save_data()
+        asyncio.run(bot_data.flush())
+
+    result["save_data"], _ = best_of(args.repeat, save)
+
+    # Регистрация новых участников поверх n существующих
+    adds = min(n, args.adds)
+    new_records = list(iter_records(adds, args.seed + 1, first_id=2_000_000_000))
+    started = time.perf_counter()
+    for record in new_records:
+        bot_data.add_participant(record["user_id"], record["username"], record["name"],
+                                 record["desired_book"], record["comment"])
+    result["add_participant_us"] = (time.perf_counter() - started) / adds * 1e6
+    flush_time, _ = timed(asyncio.run, bot_data.flush())
+    result["add_participant_flush"] = flush_time
+
+    participants = bot_data.get_all_participants()
+    result["perform_lottery"], ok = best_of(
+        args.repeat, book_bot.perform_lottery, event, participants, Exclusions(), args.seed
+    )
+    assert ok, "жеребьевка не удалась"
+    asyncio.run(bot_data.flush())
+
+    texts = [text for p in participants for text in (p.name, p.desired_book, p.comment)]
+    chars = sum(len(text) for text in texts)
+
+    def escape_all():
+        for text in texts:
+            escape_markdown(text)
+
+    result["escape_markdown"], _ = best_of(args.repeat, escape_all)
+    result["escape_markdown_mchars_per_s"] = chars / result["escape_markdown"] / 1e6
+
+    # /list: страницы по всему списку, без кэша и из кэша
+    pages = max(1, -(-len(participants) // event.list_pages.page_size))
+    sample = sorted({int(i * (pages - 1) / max(1, args.list_pages - 1)) for i in range(args.list_pages)})
+
+    def render_pages(cold: bool):
+        for page in sample:
+            if cold:
+                event.list_pages.invalidate()
+            book_bot.build_list_page(event, page)
+
+    elapsed, _ = best_of(args.repeat, render_pages, True)
+    result["list_page_ms"] = elapsed / len(sample) * 1000
+    elapsed, _ = best_of(args.repeat, render_pages, False)
+    result["list_page_cached_ms"] = elapsed / len(sample) * 1000
+
+    # Сообщения жеребьевки для всех участников (холодный кэш карточек)
+    def build_messages():
+        event.card_cache.invalidate()
+        return book_bot.build_lottery_messages(event, participants)
+
+    result["build_lottery_messages"], messages = best_of(args.repeat, build_messages)
+
+    # Цикл рассылки на выборке сообщений
+    sample_messages = messages[:args.send_sample]
+    broadcast = asyncio.run(send_sample(sample_messages, args))
+    result["send_messages"] = broadcast.total
+    result["send_loop"] = broadcast.elapsed
+    result["send_rate"] = broadcast.sent / broadcast.elapsed if broadcast.elapsed else 0.0
+
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    book_bot.events.close()
+    return result
+
+
+def compare(old_path: str, new_path: str):
+    """Печатает отношение новых замеров к старым; время выросло в REGRESSION_RATIO раз — регрессия"""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old['meta']['version']} -> {new['meta']['version']}")
+    for size, metrics in new["results"].items():
+        before = old["results"].get(size)
+        if not before:
+            continue
+        print(f"n={size}")
+        for name, value in metrics.items():
+            if name not in before or not before[name]:
+                continue
+            ratio = value / before[name]
+            # Для скоростей (*_per_s, *_rate) больше — лучше
+            higher_is_better = name.endswith(("_per_s", "_rate"))
+            regressed = (ratio < 1 / REGRESSION_RATIO) if higher_is_better else (ratio > REGRESSION_RATIO)
+            mark = "  <-- регрессия" if regressed else ""
+            print(f"  {name:<28} {before[name]:>12.4g} {value:>12.4g}  x{ratio:.2f}{mark}")
+
+
+def run_suite(args) -> dict:
+    """Прогоняет замеры по всем размерам и возвращает отчет с версией кода"""
+    import book_bot
+    book_bot.METRICS_PORT = 0
+
+    report = {
+        "meta": {
+            "version": git_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": {},
+    }
+    for n in args.sizes:
+        result = bench_size(book_bot, n, args)
+        report["results"][str(n)] = result
+        print(f"n={n}: " + ", ".join(f"{k}={v:.4g}" for k, v in result.items()), flush=True)
+        gc.collect()
+    return report
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    # load_data/save_data замеряют полный снимок в памяти, у SQLite его нет
+    parser.add_argument("--storage", default="journal", choices=["json", "journal"])
+    parser.add_argument("--snapshot-format", default="json", choices=["json", "binary"])
+    parser.add_argument("--adds", type=int, default=1000, help="сколько участников добавить поверх n")
+    parser.add_argument("--list-pages", type=int, default=50, help="сколько страниц /list отрисовать")
+    parser.add_argument("--send-sample", type=int, default=1000, help="сколько сообщений разослать")
+    parser.add_argument("--send-rate", type=float, default=1000.0, help="лимит рассылки, сообщений/сек")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка FakeBotApi на запрос, сек")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="повторов коротких замеров (берется лучший)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два файла результатов")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = os.path.abspath(args.output)
+    # Все файлы бота и данные замеров - во временном каталоге, удаляемом в конце
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        os.chdir(workdir)
+        try:
+            report = run_suite(args)
+        finally:
+            os.chdir(ROOT)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Синтетические участники, похожие на настоящих из participants.json.
+
+Имена на казахском и русском, списки книг в несколько строк с нумерацией
+в разных форматах ("1.", "2. ", "3)"), кавычки “ ” и « », эмодзи в
+комментариях и спецсимволы MarkdownV2. Генерация детерминирована по seed.
+"""
+import random
+from typing import Dict, Iterator
+
+FIRST_NAMES = [
+    "Айгерім", "Әлия", "Бота", "Гүлназ", "Дана", "Жанар", "Зарина", "Қарлығаш", "Мөлдір", "Нұрсұлу",
+    "Айдос", "Бауыржан", "Дәулет", "Ерлан", "Жандос", "Қайрат", "Мұрат", "Нұрлан", "Серік", "Тимур",
+    "Анна", "Мария", "Дмитрий", "Kunyerkye", "Aruzhan", "Авдулхадир",
+]
+LAST_NAMES = [
+    "Серікқызы", "Нұрланұлы", "Әбдіқадыр", "Тоқтарова", "Жұмабек", "Исабекова", "Оспанов", "Qasymova", "",
+]
+AUTHORS = [
+    "Мұқағали Мақатаев", "Мұхтар Әуезов", "Нұрпейісов.Ә.К", "Мұхтар Шаханов", "Аймауытов.Ж",
+    "Дулат Исабеков", "Төлен Әбдік", "Абай Құнанбайұлы", "Ілияс Есенберлин", "Книга Кристи А.",
+    "Книга Джио С.", "Кавамура Г.", "Дадзай О.", "Ли Куан", "Әшли Вәнс",
+]
+TITLES = [
+    "Махаббат диалогы", "Жапония Күнделігі", "Қан мен тер", "Эверестке шығу", "Ақбілек", "Тіршілік",
+    "Парасат майданы", "Абай жолы", "Көшпенділер", "Қара сөздер", "Человек в коричневом костюме",
+    "Ежевичная зима", "Фиалки в марте", "Если все кошки в мире исчезнут", "Человек недостойный",
+    "Сингапур тарихы. Үшінші әлемнен біріншіге", "Илон Маск: Tesla, SpaceX (2-басылым)",
+]
+COMMENTS = [
+    "", "", "", "Осылардың 1-еуін таңдаңыз🤭", "Рахмет!", "Кез келгенін 🙏", "Қазақ тіліндегі нұсқасы болса_жақсы",
+    "Любую из списка, спасибо!", "*Қатты мұқаба* болса жақсы [міндетті емес]",
+]
+NUMBER_FORMATS = ["{n}.{book}", "{n}. {book}", "{n}) {book}", "{n}.{book} "]
+QUOTES = [("“", "”"), ("«", "»"), ('"', '"'), ("", "")]
+
+
+def make_book_list(rng: random.Random) -> str:
+    """Список желаемых книг: одна книга или нумерованный список на несколько строк"""
+    count = rng.choice([1, 1, 2, 3, 5, 7])
+    books = []
+    for _ in range(count):
+        left, right = rng.choice(QUOTES)
+        books.append(f"{rng.choice(AUTHORS)} {left}{rng.choice(TITLES)}{right}")
+    if count == 1:
+        return books[0]
+    number_format = rng.choice(NUMBER_FORMATS)
+    return "\n".join(number_format.format(n=n, book=book) for n, book in enumerate(books, 1))
+
+
+def make_record(user_id: int, rng: random.Random) -> dict:
+    """Запись участника в формате снимка participants.json"""
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}".strip()
+    return {
+        "user_id": user_id,
+        "username": rng.choice(["", f"reader_{user_id}", f"kitap{user_id % 1000}_{user_id}"]),
+        "name": name,
+        "desired_book": make_book_list(rng),
+        "comment": rng.choice(COMMENTS),
+        "assigned_to": None,
+    }
+
+
+def iter_records(count: int, seed: int = 42, first_id: int = 1_000_000_000) -> Iterator[dict]:
+    """Записи участников с user_id, похожими на настоящие Telegram ID"""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield make_record(first_id + i * 7, rng)
+
+
+def make_snapshot(count: int, seed: int = 42) -> Dict[str, dict]:
+    """Снимок данных {str(user_id): запись}, как в participants.json"""
+    return {str(record["user_id"]): record for record in iter_records(count, seed)}
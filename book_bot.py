@@ -1,22 +1,45 @@
 import logging
-import random
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, asdict
-import json
+from itertools import islice
 import os
 import sys
 import asyncio
 import html
+import secrets
+import time
+
+from storage import SqliteParticipants, SqliteStorage, create_storage
+from snapshot import BinaryRecords, LazyParticipants
+from persistence import PersistenceWriter
+from broadcast import GLOBAL_RATE, Broadcaster, BroadcastMessage, BroadcastResult, DELIVERY_FAILED, DELIVERY_PENDING
+from bulk_import import IMPORT_FORMATS, MIN_BOOK_LENGTH, MIN_NAME_LENGTH, REPORTED_ERRORS, import_format, read_bytes
+from draw_schedule import FROZEN, PREPARED, DrawSchedule
+from outbox import Outbox
+from matching import Exclusions, MatchingError, match
+from update_processor import PerUserUpdateProcessor
+from export import EXPORT_FORMATS, ExportWriter, rows_for_chunk
+from drafts import DraftPersistence
+from metrics import EVENTS_LOADED, THROTTLE_USERS, MetricsServer, timed
+from logs import bind_update, setup_logging
+from profiling import UpdateProfiler
+from throttling import DUPLICATE, RATE_LIMITED, UserThrottle
+from api_request import BULK, INTERACTIVE, InstrumentedRequest, TrafficPriority
+from events import DEFAULT_EVENT, Event, EventRegistry, is_valid_event_name
+from rendering import render_list_entry, render_list_page, render_search_results, render_summary, render_top_books
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    ExtBot,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
     ConversationHandler,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    TypeHandler,
+    ApplicationHandlerStop
 )
 from telegram.error import TimedOut, BadRequest
 
@@ -24,21 +47,106 @@ from telegram.error import TimedOut, BadRequest
 BOT_TOKEN = "7968778030:AAGOCRvTo65Mb_H5Fbsv39V_0ZVC_plYdYk"
 ADMIN_ID = 7744826474
 
+# Адрес Bot API (можно указать локальный сервер для тестов)
+BOT_API_BASE_URL = "https://api.telegram.org/bot"
+
+# Webhook: если WEBHOOK_URL задан, обновления принимаются по HTTP, иначе бот опрашивает Telegram (polling)
+WEBHOOK_URL = ""  # Например: "https://bot.example.com"
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"
+WEBHOOK_SECRET_TOKEN = ""
+
 # Состояния для ConversationHandler
 NAME, BOOK, COMMENT, CONFIRM = range(4)
 
 # Файл для хранения данных
 DATA_FILE = "participants.json"
 
+# Режим хранения: "json" (перезапись файла целиком), "journal" (журнал + компактизация)
+# или "sqlite" (база с индексами, данные переносятся из DATA_FILE при первом запуске)
+STORAGE_MODE = "journal"
+
+# Формат снимка для "json" и "journal": "json" или "binary" (компактный, participants.bin,
+# загружается через mmap с декодированием участников при обращении). Прежний формат читается.
+SNAPSHOT_FORMAT = "json"
+DB_FILE = "participants.db"
+
+# Максимум одновременно обрабатываемых обновлений (обновления одного пользователя идут по очереди)
+MAX_CONCURRENT_UPDATES = 64
+
+# Пулы соединений с Bot API: ответы пользователям и массовые отправки (рассылка итогов, /export)
+# идут через разные пулы, массовые запросы уступают интерактивным
+INTERACTIVE_POOL_SIZE = 256
+INTERACTIVE_TIMEOUT = 10.0
+BULK_POOL_SIZE = 32
+BULK_TIMEOUT = 30.0
+
+# Участников в одной порции при выгрузке /export
+EXPORT_CHUNK_SIZE = 1000
+
+# Запреты для жеребьевки: {"pairs": [[id1, id2], ...], "groups": [[id1, id2, id3], ...],
+# "previous": [[кто_дарил, кому], ...]} (previous - прошлогодние пары, запрет только в одну сторону)
+EXCLUSIONS_FILE = "exclusions.json"
+
+# Файл очереди доставки результатов жеребьевки
+OUTBOX_FILE = "outbox.jsonl"
+
+# Запланированная жеребьевка (/schedule): за сколько секунд до рассылки закрыть регистрацию,
+# подобрать пары и отрисовать сообщения
+DRAW_PREPARE_AHEAD = 10 * 60
+SCHEDULE_FILE = "draw_schedule.json"
+SCHEDULE_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (порт 0 — выключено)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+
+# Каталог с данными мероприятий (кроме мероприятия по умолчанию, чьи файлы лежат рядом с ботом)
+EVENTS_DIR = "events"
+
+# Максимальная задержка (сек) перед записью изменений на диск
+SAVE_MAX_DELAY = 0.5
+
+# Незавершенные регистрации (состояние диалога и введенные поля) переживают перезапуск
+DRAFTS_FILE = "drafts.json"
+DRAFT_TTL = 7 * 24 * 3600  # Черновик без изменений дольше недели удаляется
+DRAFTS_UPDATE_INTERVAL = 5  # Как часто (сек) приложение передает изменения черновиков на запись
+
+# Поиск по книгам (/search) и самые желанные книги (/topbooks)
+SEARCH_RESULTS_LIMIT = 10  # Книг в ответе /search
+SEARCH_NAMES_LIMIT = 5  # Имен участников на книгу в ответе /search
+TOP_BOOKS_LIMIT = 20  # Книг в ответе /topbooks
+
+# Ограничение частоты обновлений от одного пользователя (на админа не действует)
+THROTTLE_RATE = 1.0  # Обновлений в секунду в среднем
+THROTTLE_BURST = 10  # Сколько обновлений можно отправить подряд
+THROTTLE_MAX_USERS = 100_000  # Сколько пользователей учитывать одновременно
+THROTTLE_IDLE_TTL = 600  # Через сколько секунд простоя пользователь удаляется из учета
+DUPLICATE_CALLBACK_WINDOW = 2.0  # Повторное нажатие той же кнопки за это время (сек) отбрасывается
+THROTTLE_NOTICE_INTERVAL = 10  # Как часто (сек) напоминать пользователю об ограничении
+
+# Профилирование по команде /profile (только админ)
+PROFILE_DEFAULT_SECONDS = 30  # Длительность по умолчанию
+PROFILE_MAX_SECONDS = 600  # Предел длительности, в том числе для /profile <N>u
+PROFILE_SAMPLE_INTERVAL = 0.005  # Как часто (сек) снимать стек event loop
+
+# Логирование: запись в фоновом потоке, формат "json" (строка JSON на запись) или "text"
+LOG_FORMAT = "json"
+LOG_LEVEL = logging.INFO
+LOG_QUEUE_SIZE = 10_000  # Записей в очереди; при переполнении новые отбрасываются, а не тормозят бота
+LOG_REPEAT_LIMIT = 5  # Сколько одинаковых ошибок записывать за окно, остальные только считаются
+LOG_REPEAT_WINDOW = 60  # Окно (сек) для LOG_REPEAT_LIMIT
+
 # Настройка логирования
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW)
 logger = logging.getLogger(__name__)
 
 # ==================== МОДЕЛИ ДАННЫХ ====================
-@dataclass
+# Участники без __dict__: на больших мероприятиях их миллионы (slots есть с Python 3.10)
+PARTICIPANT_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**PARTICIPANT_SLOTS)
 class Participant:
     user_id: int
     username: str
@@ -47,40 +155,73 @@ class Participant:
     comment: str
     assigned_to: int = None  # ID участника, которому нужно дарить
 
+# Поля, которые часто совпадают у разных участников: при загрузке хранятся одной строкой
+POOLED_FIELDS = ('name', 'desired_book', 'comment')
+
 class BotData:
-    def __init__(self, data_file: str = DATA_FILE):
+    def __init__(self, data_file: str = DATA_FILE, storage_mode: str = STORAGE_MODE,
+                 save_max_delay: float = SAVE_MAX_DELAY, snapshot_format: str = SNAPSHOT_FORMAT):
         self.data_file = data_file
+        self.storage = create_storage(storage_mode, data_file, snapshot_format)
         self.participants: Dict[int, Participant] = self.load_data()
+        self.listeners: List[Callable[[dict], None]] = []
+        # Запись на диск идет в отдельном потоке, чтобы не блокировать event loop
+        self.writer = PersistenceWriter(self.storage, self._snapshot(), save_max_delay)
     
-    def save_data(self):
-        """Сохраняет данные в JSON файл"""
-        data = {
+    def _snapshot(self) -> Dict[str, dict]:
+        """Возвращает данные в формате JSON-снимка"""
+        if isinstance(self.participants, LazyParticipants):
+            return self.participants.to_records()
+        return {
             str(pid): asdict(p) 
             for pid, p in self.participants.items()
         }
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    def subscribe(self, listener: Callable[[dict], None]):
+        """Подписывает listener(op) на изменения данных (кэши, индексы)"""
+        self.listeners.append(listener)
+    
+    def _notify(self, op: dict):
+        for listener in self.listeners:
+            listener(op)
+    
+    def _commit(self, op: dict):
+        """Ставит изменение в очередь на запись"""
+        self.writer.submit(op)
+        self._notify(op)
+    
+    def save_data(self):
+        """Запрашивает запись полного снимка данных"""
+        self.writer.request_full_save()
+    
+    async def flush(self):
+        """Дожидается записи на диск всех изменений"""
+        await self.writer.flushed()
     
     def load_data(self) -> Dict[int, Participant]:
-        """Загружает данные из JSON файла"""
-        if not os.path.exists(self.data_file):
-            return {}
-        
+        """Загружает данные из хранилища"""
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = self.storage.load()
+            if isinstance(data, BinaryRecords):
+                # Бинарный снимок: участники декодируются при первом обращении
+                return LazyParticipants(data, Participant)
             
             participants = {}
+            # Пул строк на время загрузки (см. POOLED_FIELDS)
+            pool = {}.setdefault
             for pid_str, p_data in data.items():
                 # Конвертируем user_id из строки в int
                 p_data['user_id'] = int(p_data['user_id'])
                 if 'assigned_to' in p_data and p_data['assigned_to']:
                     p_data['assigned_to'] = int(p_data['assigned_to'])
+                for field in POOLED_FIELDS:
+                    if field in p_data:
+                        p_data[field] = pool(p_data[field], p_data[field])
                 participants[int(pid_str)] = Participant(**p_data)
             
             return participants
         except Exception as e:
-            logger.error(f"Ошибка загрузки данных: {e}")
+            logger.error("Ошибка загрузки данных: %s", e)
             return {}
     
     def add_participant(self, user_id: int, username: str, name: str, 
@@ -94,38 +235,253 @@ class BotData:
             comment=comment
         )
         self.participants[user_id] = participant
-        self.save_data()
+        self._commit({"op": "put", "participant": asdict(participant)})
         return participant
     
+    def import_participants(self, records: List[dict]) -> int:
+        """Добавляет (или обновляет) участников пачкой, возвращает число новых.
+        
+        Одна операция и один полный снимок вместо строки журнала на каждого участника.
+        Пара прошедшей жеребьевки у уже зарегистрированных участников сохраняется.
+        """
+        if not records:
+            return 0
+        added = 0
+        for record in records:
+            previous = self.participants.get(record["user_id"])
+            if previous is None:
+                added += 1
+            else:
+                record = dict(record, assigned_to=previous.assigned_to)
+            self.participants[record["user_id"]] = Participant(**record)
+        self._commit({"op": "import", "participants": records})
+        self.save_data()
+        return added
+    
     def clear_user_data(self, user_id: int) -> bool:
         """Удаляет данные пользователя"""
         if user_id in self.participants:
             del self.participants[user_id]
-            self.save_data()
+            self._commit({"op": "delete", "user_id": user_id})
             return True
         return False
     
+    def set_assignments(self, assignments: Dict[int, int]):
+        """Сохраняет пары жеребьевки (кто кому дарит) одной записью"""
+        for giver_id, receiver_id in assignments.items():
+            self.participants[giver_id].assigned_to = receiver_id
+        self._commit({
+            "op": "assign",
+            "assignments": {str(giver_id): receiver_id for giver_id, receiver_id in assignments.items()}
+        })
+    
+    def reset_assignments(self):
+        """Сбрасывает результаты жеребьевки"""
+        self.set_assignments({pid: None for pid in self.participants})
+    
+    def get_participant(self, user_id: int) -> Optional[Participant]:
+        """Возвращает участника по ID"""
+        return self.participants.get(user_id)
+    
+    def count_participants(self) -> int:
+        """Число участников"""
+        return len(self.participants)
+    
+    def count_assigned(self) -> int:
+        """Число участников с назначенной парой"""
+        return sum(1 for p in self.participants.values() if p.assigned_to)
+    
     def get_all_participants(self) -> List[Participant]:
         """Возвращает список всех участников"""
         return list(self.participants.values())
     
+    def get_participants_page(self, offset: int, limit: int) -> List[Participant]:
+        """Возвращает участников с offset по offset + limit в порядке регистрации"""
+        return list(islice(self.participants.values(), offset, offset + limit))
+    
+    def iter_participant_chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Participant]]:
+        """Итерирует участников порциями; между порциями данные можно менять"""
+        user_ids = list(self.participants)
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = (self.participants.get(user_id) for user_id in user_ids[start:start + chunk_size])
+            yield [participant for participant in chunk if participant is not None]
+    
     def clear_all_data(self):
         """Очищает все данные"""
         self.participants.clear()
-        self.save_data()
+        self._commit({"op": "clear"})
+    
+    def close(self):
+        """Записывает оставшиеся изменения и закрывает хранилище"""
+        self.writer.close()
+        self.storage.close()
+
+class SqliteBotData(BotData):
+    """BotData поверх SQLite: участники не держатся в памяти, поиск идет по индексам"""
+    
+    def __init__(self, data_file: str = DATA_FILE, db_file: str = DB_FILE,
+                 event: str = "default", save_max_delay: float = SAVE_MAX_DELAY):
+        self.data_file = data_file
+        self.storage = SqliteStorage(db_file, event)
+        # Однократный перенос данных из participants.json
+        self.storage.migrate_from_json(data_file)
+        self.participants = SqliteParticipants(self.storage, Participant)
+        self.listeners: List[Callable[[dict], None]] = []
+        self.writer = PersistenceWriter(self.storage, None, save_max_delay)
+    
+    def _commit(self, op: dict):
+        """Выполняет изменение сразу, COMMIT делает поток записи"""
+        self.storage.apply(op)
+        self.writer.submit(op)
+        self._notify(op)
+    
+    def add_participant(self, user_id: int, username: str, name: str, 
+                       desired_book: str, comment: str = "") -> Participant:
+        """Добавляет нового участника"""
+        participant = Participant(
+            user_id=user_id,
+            username=username or "",
+            name=name,
+            desired_book=desired_book,
+            comment=comment
+        )
+        self._commit({"op": "put", "participant": asdict(participant)})
+        return participant
+    
+    def import_participants(self, records: List[dict]) -> int:
+        """Добавляет (или обновляет) участников пачкой одной транзакцией, не трогая пары жеребьевки"""
+        if not records:
+            return 0
+        before = self.count_participants()
+        self._commit({"op": "import", "participants": records})
+        return self.count_participants() - before
+    
+    def clear_user_data(self, user_id: int) -> bool:
+        """Удаляет данные пользователя"""
+        if user_id in self.participants:
+            self._commit({"op": "delete", "user_id": user_id})
+            return True
+        return False
+    
+    def set_assignments(self, assignments: Dict[int, int]):
+        """Сохраняет пары жеребьевки одной транзакцией"""
+        self._commit({
+            "op": "assign",
+            "assignments": {str(giver_id): receiver_id for giver_id, receiver_id in assignments.items()}
+        })
+    
+    def reset_assignments(self):
+        """Сбрасывает результаты жеребьевки"""
+        self.set_assignments({pid: None for pid in self.storage.iter_ids()})
+    
+    def clear_all_data(self):
+        """Очищает все данные"""
+        self._commit({"op": "clear"})
+    
+    def count_participants(self) -> int:
+        """Число участников"""
+        return self.storage.count()
+    
+    def count_assigned(self) -> int:
+        """Число участников с назначенной парой"""
+        return self.storage.count_assigned()
+    
+    def get_participants_page(self, offset: int, limit: int) -> List[Participant]:
+        """Возвращает участников с offset по offset + limit (LIMIT/OFFSET в SQLite)"""
+        return [self.participants.build(row) for row in self.storage.page(offset, limit)]
+    
+    def iter_participant_chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Participant]]:
+        """Итерирует участников порциями прямо из базы"""
+        chunk = []
+        for row in self.storage.iter_rows(chunk_size):
+            chunk.append(self.participants.build(row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def event_file(event: str, filename: str) -> str:
+    """Путь к файлу мероприятия"""
+    if event == DEFAULT_EVENT:
+        return filename
+    return os.path.join(EVENTS_DIR, event, filename)
+
+def create_bot_data(event: str = DEFAULT_EVENT) -> BotData:
+    """Создает хранилище данных мероприятия по STORAGE_MODE"""
+    data_file = event_file(event, DATA_FILE)
+    if STORAGE_MODE == "sqlite":
+        return SqliteBotData(data_file, DB_FILE, event)
+    return BotData(data_file, STORAGE_MODE, snapshot_format=SNAPSHOT_FORMAT)
+
+def create_event(name: str) -> Event:
+    """Загружает данные мероприятия"""
+    if name != DEFAULT_EVENT:
+        os.makedirs(os.path.join(EVENTS_DIR, name), exist_ok=True)
+    return Event(
+        name,
+        create_bot_data(name),
+        Outbox(event_file(name, OUTBOX_FILE)),
+        event_file(name, EXCLUSIONS_FILE),
+        DrawSchedule(event_file(name, SCHEDULE_FILE))
+    )
+
+def known_events() -> List[str]:
+    """Мероприятия, у которых есть данные на диске"""
+    names = [DEFAULT_EVENT]
+    if os.path.isdir(EVENTS_DIR):
+        names += sorted(
+            name for name in os.listdir(EVENTS_DIR)
+            if is_valid_event_name(name) and os.path.isdir(os.path.join(EVENTS_DIR, name))
+        )
+    return names
+
+def event_exists(name: str) -> bool:
+    """Мероприятие уже создано: основное, загружено в память или есть его каталог"""
+    return name == DEFAULT_EVENT or name in events.loaded or os.path.isdir(os.path.join(EVENTS_DIR, name))
+
+# Мероприятия загружаются при первом обращении и выгружаются из памяти при простое
+events = EventRegistry(create_event)
+EVENTS_LOADED.set_function(lambda: len(events.loaded))
+
+# Эндпоинт метрик
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
 
-# Инициализация хранилища данных
-bot_data = BotData()
+# Ограничение частоты обновлений
+throttle = UserThrottle(
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_MAX_USERS, THROTTLE_IDLE_TTL,
+    DUPLICATE_CALLBACK_WINDOW, THROTTLE_NOTICE_INTERVAL, exempt=[ADMIN_ID]
+)
+THROTTLE_USERS.set_function(lambda: len(throttle))
+
+# Профилирование обработки обновлений по команде /profile
+profiler = UpdateProfiler(PROFILE_SAMPLE_INTERVAL)
+
+# Массовые запросы пропускают вперед ответы пользователям
+traffic_priority = TrafficPriority()
+# Бот с отдельным пулом соединений для массовых отправок (создается в main)
+BULK_BOT_KEY = 'bulk_bot'
+
+def bulk_bot(application: Application):
+    """Бот для рассылок и выгрузок; без отдельного пула (бенчмарки, тесты) — основной"""
+    return application.bot_data.get(BULK_BOT_KEY, application.bot)
+
+# Поля регистрации, которые вводит пользователь
+DRAFT_FIELDS = ('name', 'desired_book', 'comment')
+
+# Ответ админу на новую жеребьевку или /resend, пока идет рассылка результатов
+DELIVERY_RUNNING = "Рассылка результатов еще идет, дождитесь ее окончания"
+# Ответ на регистрацию и удаление данных, пока идет подготовка запланированной жеребьевки
+REGISTRATION_CLOSED = "Регистрация закрыта: скоро жеребьевка. Ожидайте результатов."
 
-def escape_markdown(text: str) -> str:
-    """Экранирует спецсимволы Markdown"""
-    if not text:
-        return ""
-    # Экранируем символы Markdown
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+def current_event(context: ContextTypes.DEFAULT_TYPE) -> Event:
+    """Мероприятие пользователя: выбирается ссылкой /start <event>, админом — командой /event"""
+    return events.get(context.user_data.get('event', DEFAULT_EVENT))
+
+def clear_draft(context: ContextTypes.DEFAULT_TYPE):
+    """Очищает введенные поля регистрации (выбранное мероприятие остается)"""
+    for field in DRAFT_FIELDS:
+        context.user_data.pop(field, None)
 
 # ==================== КОМАНДЫ ====================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -133,14 +489,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
         user = update.effective_user
         
+        # Ссылка вида t.me/<bot>?start=<event> приводит пользователя в нужное мероприятие.
+        # Создает мероприятия только админ (/event): по неизвестной ссылке остаемся в текущем
+        if context.args and is_valid_event_name(context.args[0]) and event_exists(context.args[0]):
+            context.user_data['event'] = context.args[0]
+        event = current_event(context)
+        
         welcome_text = (
             "«Кітап-гәп»-қа қош келдіңіз!📚\n"
             "Деректерді толтырыңыз.\n\n"
             "Сіздің есіміңіз:"
         )
         
+        if event.schedule.frozen and user.id not in event.bot_data.participants:
+            await update.message.reply_text(REGISTRATION_CLOSED)
+            return ConversationHandler.END
+        
         # Проверяем, есть ли уже данные пользователя
-        if user.id in bot_data.participants:
+        if user.id in event.bot_data.participants:
             keyboard = [
                 [InlineKeyboardButton("✏️ Заполнить заново", callback_data="restart")],
                 [InlineKeyboardButton("✅ Мои данные верны", callback_data="keep")]
@@ -159,7 +525,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         logger.warning("Таймаут при отправке сообщения /start")
         return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Ошибка в команде /start: {e}")
+        logger.error("Ошибка в команде /start: %s", e)
         return ConversationHandler.END
 
 async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -167,8 +533,8 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     try:
         name = update.message.text.strip()
         
-        if len(name) < 2:
-            await update.message.reply_text("Пожалуйста, введите имя (минимум 2 символа)")
+        if len(name) < MIN_NAME_LENGTH:
+            await update.message.reply_text(f"Пожалуйста, введите имя (минимум {MIN_NAME_LENGTH} символа)")
             return NAME
         
         context.user_data['name'] = name
@@ -179,7 +545,7 @@ async def handle_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         )
         return BOOK
     except Exception as e:
-        logger.error(f"Ошибка при обработке имени: {e}")
+        logger.error("Ошибка при обработке имени: %s", e)
         await update.message.reply_text("Произошла ошибка. Попробуйте снова /start")
         return ConversationHandler.END
 
@@ -188,8 +554,8 @@ async def handle_book(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     try:
         book = update.message.text.strip()
         
-        if len(book) < 3:
-            await update.message.reply_text("Пожалуйста, укажите название книги (минимум 3 символа)")
+        if len(book) < MIN_BOOK_LENGTH:
+            await update.message.reply_text(f"Пожалуйста, укажите название книги (минимум {MIN_BOOK_LENGTH} символа)")
             return BOOK
         
         context.user_data['desired_book'] = book
@@ -206,7 +572,7 @@ async def handle_book(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         )
         return COMMENT
     except Exception as e:
-        logger.error(f"Ошибка при обработке книги: {e}")
+        logger.error("Ошибка при обработке книги: %s", e)
         await update.message.reply_text("Произошла ошибка. Попробуйте снова /start")
         return ConversationHandler.END
 
@@ -219,7 +585,7 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await show_summary(update, context)
         return CONFIRM
     except Exception as e:
-        logger.error(f"Ошибка при обработке комментария: {e}")
+        logger.error("Ошибка при обработке комментария: %s", e)
         await update.message.reply_text("Произошла ошибка. Попробуйте снова /start")
         return ConversationHandler.END
 
@@ -235,7 +601,7 @@ async def skip_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await show_summary(query, context, is_callback=True)
         return CONFIRM
     except Exception as e:
-        logger.error(f"Ошибка при пропуске комментария: {e}")
+        logger.error("Ошибка при пропуске комментария: %s", e)
         return ConversationHandler.END
 
 async def show_summary(update, context: ContextTypes.DEFAULT_TYPE, is_callback: bool = False):
@@ -243,51 +609,26 @@ async def show_summary(update, context: ContextTypes.DEFAULT_TYPE, is_callback:
     try:
         user_data = context.user_data
         
-        name = escape_markdown(user_data.get('name', 'Не указано'))
-        book = escape_markdown(user_data.get('desired_book', 'Не указано'))
-        comment = escape_markdown(user_data.get('comment', 'Не указано'))
-        
-        summary_text = (
-            "📋 **Сіздің деректеріңіз:**\n\n"
-            f"👤 **Есіміңіз:** {name}\n"
-            f"📚 **Сіз қалайтын кітап:** {book}\n"
-            f"💬 **Пікіріңіз:** {comment}\n\n"
-            "Деректерді жіберу үшін **/send** батырмасын басыңыз."
+        summary = render_summary(
+            user_data.get('name', 'Не указано'),
+            user_data.get('desired_book', 'Не указано'),
+            user_data.get('comment', 'Не указано')
         )
         
         if is_callback:
             # Для callback_query используем update.callback_query
             await update.edit_message_text(
-                text=summary_text,
-                parse_mode='Markdown'
+                text=summary.text,
+                parse_mode=summary.parse_mode
             )
         else:
             # Для обычного сообщения используем update.message
             await update.message.reply_text(
-                text=summary_text,
-                parse_mode='Markdown'
-            )
-    except BadRequest as e:
-        logger.error(f"Ошибка форматирования Markdown: {e}")
-        # Отправляем без форматирования
-        if is_callback:
-            await update.edit_message_text(
-                text="📋 Сіздің деректеріңіз:\n\n"
-                     f"👤 Есіміңіз: {user_data.get('name', 'Не указано')}\n"
-                     f"📚 Сіз қалайтын кітап: {user_data.get('desired_book', 'Не указано')}\n"
-                     f"💬 Пікіріңіз: {user_data.get('comment', 'Не указано')}\n\n"
-                     "Деректерді жіберу үшін /send батырмасын басыңыз."
-            )
-        else:
-            await update.message.reply_text(
-                text="📋 Сіздің деректеріңіз:\n\n"
-                     f"👤 Есіміңіз: {user_data.get('name', 'Не указано')}\n"
-                     f"📚 Сіз қалайтын кітап: {user_data.get('desired_book', 'Не указано')}\n"
-                     f"💬 Пікіріңіз: {user_data.get('comment', 'Не указано')}\n\n"
-                     "Деректерді жіберу үшін /send батырмасын басыңыз."
+                text=summary.text,
+                parse_mode=summary.parse_mode
             )
     except Exception as e:
-        logger.error(f"Ошибка при показе сводки: {e}")
+        logger.error("Ошибка при показе сводки: %s", e)
 
 async def submit_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /send (жіберу)"""
@@ -305,8 +646,13 @@ async def submit_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
+        event = current_event(context)
+        if event.schedule.frozen:
+            await update.message.reply_text(REGISTRATION_CLOSED)
+            return ConversationHandler.END
+        
         # Сохраняем данные
-        participant = bot_data.add_participant(
+        participant = event.bot_data.add_participant(
             user_id=user.id,
             username=user.username,
             name=user_data['name'],
@@ -315,14 +661,16 @@ async def submit_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         # Очищаем временные данные
-        context.user_data.clear()
+        clear_draft(context)
         
         await update.message.reply_text(
             "Спасибо! Ваши данные сохранены ✅\n"
             "Ожидайте проведения жеребьевки."
         )
+        # Регистрация завершена: диалог закрывается, его черновик удаляется из DraftPersistence
+        return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Ошибка при отправке данных: {e}")
+        logger.error("Ошибка при отправке данных: %s", e)
         await update.message.reply_text("Произошла ошибка при сохранении данных")
 
 async def lottery(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -334,20 +682,28 @@ async def lottery(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Эта команда доступна только администратору")
             return
         
-        participants = bot_data.get_all_participants()
+        event = current_event(context)
+        if event.schedule.active:
+            await update.message.reply_text(f"{event.schedule.describe()}. Отменить: /schedule cancel")
+            return
+        
+        participants_count = event.bot_data.count_participants()
         
-        if len(participants) < 2:
+        if participants_count < 2:
             await update.message.reply_text(
                 f"Жеребе тастауға қатысушылар жеткіліксіз. "
-                f"Қатысушылар саны: {len(participants)}"
+                f"Қатысушылар саны: {participants_count}"
             )
             return
         
+        if event.delivering:
+            await update.message.reply_text(DELIVERY_RUNNING)
+            return
+        
         # Проверяем, была ли уже жеребьевка
-        assigned_count = sum(1 for p in participants if p.assigned_to)
-        if assigned_count > 0:
+        if event.bot_data.count_assigned() > 0:
             keyboard = [
-                [InlineKeyboardButton("🔄 Қайтадан өткізу", callback_data="relottery")],
+                [InlineKeyboardButton("🔄 Қайтадан өткізу", callback_data=f"relottery:{event.name}")],
                 [InlineKeyboardButton("✖️ Жою", callback_data="cancel")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -359,94 +715,362 @@ async def lottery(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Проводим жеребьевку
-        result = perform_lottery(participants)
+        participants = event.bot_data.get_all_participants()
+        try:
+            result = perform_lottery(event, participants)
+        except MatchingError as e:
+            await update.message.reply_text(f"Жеребьевка невозможна: {e}")
+            return
         
         if not result:
             await update.message.reply_text("Ошибка при проведении жеребьевки")
             return
         
-        # Отправляем результаты каждому участнику
-        sent_count = 0
-        for participant in participants:
-            try:
-                assigned_participant = bot_data.participants[participant.assigned_to]
-                
-                name_escaped = escape_markdown(assigned_participant.name)
-                book_escaped = escape_markdown(assigned_participant.desired_book)
-                comment_escaped = escape_markdown(assigned_participant.comment) if assigned_participant.comment else ""
-                
-                message_text = (
-                    "🎲 **Жеребе нәтижесі!**\n\n"
-                    f"Сізге осы оқырман түсті **{name_escaped}**\n\n"
-                    f"📖 **Оқырман қалайтын кітап:**\n"
-                    f"_{book_escaped}_\n\n"
-                )
-                
-                if assigned_participant.comment:
-                    message_text += f"💬 **Пікір:**\n_{comment_escaped}_"
-                
-                await context.bot.send_message(
-                    chat_id=participant.user_id,
-                    text=message_text,
-                    parse_mode='Markdown'
-                )
-                sent_count += 1
-                
-            except BadRequest as e:
-                logger.error(f"Ошибка Markdown при отправке сообщения пользователю {participant.user_id}: {e}")
-                # Отправляем без форматирования
-                await context.bot.send_message(
-                    chat_id=participant.user_id,
-                    text=f"🎲 Жеребе нәтижесі!\n\n"
-                         f"Сізге осы оқырман түсті: {assigned_participant.name}\n\n"
-                         f"📖 Ол алғысы келетін кітап:\n"
-                         f"{assigned_participant.desired_book}\n\n" +
-                         (f"💬 Пікір:\n{assigned_participant.comment}" if assigned_participant.comment else "")
-                )
-                sent_count += 1
-                
-            except Exception as e:
-                logger.error(f"Не удалось отправить сообщение пользователю {participant.user_id}: {e}")
-        
-        bot_data.save_data()
+        # Результаты должны быть на диске до того, как участники их увидят
+        await event.bot_data.flush()
         
-        await update.message.reply_text(
-            f"Жеребе аяқталды!\n"
-            f"Қатысушылар саны: {len(participants)}\n"
-            f"Хабарлар жіберілді: {sent_count}"
+        # Рассылаем результаты в фоне, чтобы не блокировать обработку других обновлений
+        status_message = await update.message.reply_text(
+            f"Жеребе нәтижелері жіберілуде...\n"
+            f"Қатысушылар саны: {len(participants)}"
+        )
+        start_delivery(
+            context.application, event,
+            send_lottery_results(bulk_bot(context.application), event, participants, status_message.edit_text, repeat=False)
         )
     except Exception as e:
-        logger.error(f"Ошибка при проведении жеребьевки: {e}")
+        logger.error("Ошибка при проведении жеребьевки: %s", e)
         await update.message.reply_text("Произошла ошибка при проведении жеребьевки")
 
-def perform_lottery(participants: List[Participant]) -> bool:
-    """Проводит жеребьевку"""
+def build_lottery_messages(event: Event, participants: List[Participant], repeat: bool = False,
+                           assignments: Dict[int, int] = None) -> List[BroadcastMessage]:
+    """Готовит сообщения с результатами жеребьевки для рассылки.
+    
+    assignments — пары не из участников, а отдельно (пробная жеребьевка без сохранения).
+    """
+    messages = []
+    for participant in participants:
+        assigned_to = assignments[participant.user_id] if assignments is not None else participant.assigned_to
+        assigned_participant = event.bot_data.participants[assigned_to]
+        rendered = event.card_cache.lottery_result(assigned_participant, repeat)
+        messages.append(BroadcastMessage(
+            chat_id=participant.user_id,
+            text=rendered.text,
+            parse_mode=rendered.parse_mode
+        ))
+    return messages
+
+def new_draw_id() -> str:
+    """Идентификатор жеребьевки в outbox: время и случайный суффикс (две жеребьевки в одну секунду различаются)"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+
+def start_delivery(application: Application, event: Event, delivery) -> asyncio.Task:
+    """Запускает рассылку мероприятия в фоне; пока она идет, event.delivering не дает начать другую"""
+    event.delivery = application.create_task(delivery)
+    return event.delivery
+
+async def deliver_messages(bot, event: Event, messages: List[BroadcastMessage], report, title: str):
+    """Рассылает сообщения, отмечая доставку в outbox, и сообщает администратору о ходе рассылки"""
+    reported = {"done": -1}
+    # Состояния доставки относятся к жеребьевке, которая была в outbox при старте рассылки
+    draw_id = event.outbox.draw_id
+    
+    def on_state(chat_id: int, state: str):
+        event.outbox.mark(chat_id, state, draw_id)
+    
+    async def progress(result: BroadcastResult):
+        # Telegram не дает редактировать сообщение тем же текстом
+        if result.done == reported["done"]:
+            return
+        reported["done"] = result.done
+        await report(
+            f"Жеребе нәтижелері жіберілуде...\n"
+            f"Хабарлар жіберілді: {result.sent}/{result.total}\n"
+            f"Қателер: {result.failed + result.blocked}"
+        )
+    
     try:
-        # Создаем список ID участников
-        participant_ids = [p.user_id for p in participants]
-        
-        # Перемешиваем список
-        shuffled_ids = participant_ids.copy()
-        random.shuffle(shuffled_ids)
-        
-        # Создаем пары (каждый дарит следующему)
-        assignments = {}
-        n = len(shuffled_ids)
+        with event.in_use():
+            result = await Broadcaster(bot).run(messages, progress=progress, on_state=on_state)
+            event.outbox.sync()
+        await report(
+            f"{title}\n"
+            f"Хабарлар жіберілді: {result.sent}/{result.total}\n"
+            f"Қателер: {result.failed}\n"
+            f"Ботты бұғаттағандар: {result.blocked}\n"
+            f"Уақыты: {result.elapsed:.1f} сек"
+            + ("\n\nНеудачные можно отправить повторно: /resend" if result.failed else "")
+        )
+    except Exception as e:
+        logger.error("Ошибка при рассылке результатов жеребьевки: %s", e)
+
+async def send_lottery_results(bot, event: Event, participants: List[Participant], report,
+                               repeat: bool = False):
+    """Сохраняет результаты жеребьевки в outbox мероприятия и рассылает их"""
+    title = "Жеребе қайтадан өткізілді!" if repeat else "Жеребе аяқталды!"
+    try:
+        with event.in_use():
+            messages = build_lottery_messages(event, participants, repeat)
+            # Сначала outbox на диск: после сбоя рассылка продолжится с того же места
+            await asyncio.to_thread(event.outbox.start_draw, new_draw_id(), messages)
+            await deliver_messages(bot, event, messages, report, title)
+    except Exception as e:
+        logger.error("Ошибка при рассылке результатов жеребьевки: %s", e)
+
+def perform_lottery(event: Event, participants: List[Participant], exclusions: Exclusions = None,
+                    seed: int = None) -> bool:
+    """Проводит жеребьевку.
+    
+    Если пары распределить невозможно, выбрасывает MatchingError с причиной.
+    """
+    try:
+        if exclusions is None:
+            exclusions = Exclusions.from_file(event.exclusions_file)
         
-        for i in range(n):
-            giver_id = shuffled_ids[i]
-            receiver_id = shuffled_ids[(i + 1) % n]
-            assignments[giver_id] = receiver_id
+        # Каждый дарит следующему в общем кольце, с учетом запретов
+        assignments = match([p.user_id for p in participants], exclusions, seed)
         
         # Назначаем пары
-        for giver_id, receiver_id in assignments.items():
-            bot_data.participants[giver_id].assigned_to = receiver_id
+        for participant in participants:
+            participant.assigned_to = assignments[participant.user_id]
+        event.bot_data.set_assignments(assignments)
         
         return True
+    except MatchingError:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка при жеребьевке: {e}")
+        logger.error("Ошибка при жеребьевке: %s", e)
         return False
 
+async def prepare_draw(event: Event):
+    """Закрывает регистрацию, подбирает и сохраняет пары, отрисовывает сообщения запланированной жеребьевки.
+    
+    Пары, подобранные до перезапуска, не подбираются заново: отрисовываются только сообщения.
+    """
+    schedule = event.schedule
+    with event.in_use():
+        if not schedule.frozen:
+            schedule.advance(FROZEN)
+        participants = event.bot_data.get_all_participants()
+        if schedule.stage != PREPARED:
+            if len(participants) < 2:
+                raise MatchingError(f"участников недостаточно: {len(participants)}")
+            started = time.perf_counter()
+            # Подбор пар для большого мероприятия занимает секунды: не держим event loop
+            if not await asyncio.to_thread(perform_lottery, event, participants):
+                raise MatchingError("ошибка при подборе пар")
+            schedule.timings["match"] = time.perf_counter() - started
+            
+            # Пары на диске до того, как станут известны участникам
+            started = time.perf_counter()
+            await event.bot_data.flush()
+            schedule.timings["save"] = time.perf_counter() - started
+            schedule.advance(PREPARED)
+        
+        started = time.perf_counter()
+        schedule.messages = build_lottery_messages(event, participants)
+        schedule.timings["render"] = time.perf_counter() - started
+
+def render_draw_timings(count: int, timings: Dict[str, float]) -> str:
+    """Числа и замеры подготовки жеребьевки для админа"""
+    labels = (("match", "подбор пар"), ("save", "сохранение пар"), ("render", "отрисовка сообщений"))
+    lines = [f"Сообщений: {count}"]
+    lines += [f"{label}: {timings[key]:.2f} сек" for key, label in labels if key in timings]
+    lines.append(f"рассылка: около {count / GLOBAL_RATE:.0f} сек ({GLOBAL_RATE:.0f} сообщ./сек)")
+    return "\n".join(lines)
+
+async def prepare_draw_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: подготовка запланированной жеребьевки"""
+    event = events.get(context.job.data)
+    try:
+        await prepare_draw(event)
+        text = (f"Жеребьевка подготовлена, регистрация закрыта ({event.name}).\n"
+                f"{render_draw_timings(len(event.schedule.messages), event.schedule.timings)}")
+    except MatchingError as e:
+        # Без пар рассылать нечего: снимаем расписание и открываем регистрацию
+        cancel_draw_jobs(context.application, event.name)
+        event.schedule.clear()
+        text = f"Запланированная жеребьевка отменена ({event.name}): {e}"
+    except Exception as e:
+        logger.error("Ошибка подготовки жеребьевки: %s", e)
+        text = f"Ошибка подготовки жеребьевки ({event.name}): {e}. Повторим в назначенное время."
+    try:
+        await context.bot.send_message(chat_id=ADMIN_ID, text=text)
+    except Exception as e:
+        logger.error("Не удалось уведомить администратора: %s", e)
+
+async def run_draw_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: рассылка подготовленных результатов в назначенное время"""
+    event = events.get(context.job.data)
+    schedule = event.schedule
+    try:
+        with event.in_use():
+            if schedule.draw_id is not None and event.outbox.draw_id == schedule.draw_id:
+                # Перезапуск после записи outbox: рассылку продолжает resume_delivery
+                schedule.clear()
+                return
+            if schedule.stage != PREPARED or schedule.messages is None:
+                # Подготовка не прошла или сообщения потерялись при перезапуске
+                await prepare_draw(event)
+            messages = schedule.messages
+            status_message = await context.bot.send_message(
+                chat_id=ADMIN_ID,
+                text=f"Жеребе нәтижелері жіберілуде...\nҚатысушылар саны: {len(messages)}"
+            )
+            # Предыдущая рассылка (например, /resend) должна закончиться до замены outbox
+            if event.delivering:
+                await asyncio.wait([event.delivery])
+            event.delivery = asyncio.current_task()
+            # draw_id в расписании, затем outbox на диск, затем снятие расписания:
+            # после сбоя между ними рассылку продолжит только resume_delivery
+            draw_id = new_draw_id()
+            schedule.start_sending(draw_id)
+            await asyncio.to_thread(event.outbox.start_draw, draw_id, messages)
+            schedule.clear()
+            await deliver_messages(bulk_bot(context.application), event, messages, status_message.edit_text,
+                                   "Жеребе аяқталды!")
+    except Exception as e:
+        logger.error("Ошибка запланированной жеребьевки: %s", e)
+        cancel_draw_jobs(context.application, event.name)
+        schedule.clear()
+        try:
+            await context.bot.send_message(
+                chat_id=ADMIN_ID, text=f"Запланированная жеребьевка не состоялась ({event.name}): {e}"
+            )
+        except Exception as e:
+            logger.error("Не удалось уведомить администратора: %s", e)
+
+def cancel_draw_jobs(application: Application, name: str):
+    """Снимает задачи JobQueue запланированной жеребьевки мероприятия"""
+    for job_name in (f"draw-prepare:{name}", f"draw-send:{name}"):
+        for job in application.job_queue.get_jobs_by_name(job_name):
+            job.schedule_removal()
+
+def schedule_draw_jobs(application: Application, event: Event):
+    """Ставит в JobQueue подготовку (за DRAW_PREPARE_AHEAD) и рассылку запланированной жеребьевки"""
+    cancel_draw_jobs(application, event.name)
+    # Время уже прошло (например, бот был остановлен) — задача выполняется сразу
+    until_send = max(0.0, event.schedule.at - time.time())
+    until_prepare = max(0.0, until_send - DRAW_PREPARE_AHEAD)
+    application.job_queue.run_once(prepare_draw_job, until_prepare, data=event.name,
+                                   name=f"draw-prepare:{event.name}")
+    application.job_queue.run_once(run_draw_job, until_send, data=event.name, name=f"draw-send:{event.name}")
+
+async def preview_draw(event: Event) -> Tuple[str, Optional[BroadcastMessage]]:
+    """Пробная жеребьевка без сохранения: замеры подготовки и пример сообщения"""
+    participants = event.bot_data.get_all_participants()
+    if len(participants) < 2:
+        return f"Жеребьевка невозможна: участников недостаточно ({len(participants)})", None
+    exclusions = Exclusions.from_file(event.exclusions_file)
+    timings = {}
+    started = time.perf_counter()
+    try:
+        assignments = await asyncio.to_thread(match, [p.user_id for p in participants], exclusions)
+    except MatchingError as e:
+        return f"Жеребьевка невозможна: {e}", None
+    timings["match"] = time.perf_counter() - started
+    started = time.perf_counter()
+    messages = build_lottery_messages(event, participants, assignments=assignments)
+    timings["render"] = time.perf_counter() - started
+    text = (f"Пробная жеребьевка ({event.name}), ничего не сохранено и не отправлено.\n"
+            f"Участников: {len(participants)}\n{render_draw_timings(len(messages), timings)}")
+    return text, messages[0]
+
+async def schedule_lottery(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /schedule [ГГГГ-ММ-ДД ЧЧ:ММ | cancel | preview] (только для админа)"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        event = current_event(context)
+        schedule = event.schedule
+        arg = " ".join(context.args).strip().lower()
+        
+        if not arg:
+            text = schedule.describe()
+            if schedule.messages is not None:
+                text += f"\n{render_draw_timings(len(schedule.messages), schedule.timings)}"
+            await update.message.reply_text(text)
+            return
+        
+        if arg == "preview":
+            text, sample = await preview_draw(event)
+            await update.message.reply_text(text)
+            if sample is not None:
+                await update.message.reply_text("Пример сообщения участнику:")
+                await update.message.reply_text(sample.text, parse_mode=sample.parse_mode)
+            return
+        
+        if context.application.job_queue is None:
+            await update.message.reply_text("Планировщик недоступен: нужен python-telegram-bot[job-queue]")
+            return
+        
+        if arg == "cancel":
+            if not schedule.active:
+                await update.message.reply_text(schedule.describe())
+                return
+            cancel_draw_jobs(context.application, event.name)
+            prepared = schedule.stage == PREPARED
+            schedule.clear()
+            await update.message.reply_text(
+                "Запланированная жеребьевка отменена, регистрация открыта"
+                + ("\nПары уже подобраны: /lottery предложит провести жеребьевку заново" if prepared else "")
+            )
+            return
+        
+        try:
+            at = time.mktime(time.strptime(arg, SCHEDULE_TIME_FORMAT))
+        except ValueError:
+            await update.message.reply_text(
+                "Например: /schedule 2025-12-20 18:00 — назначить, /schedule preview — пробная жеребьевка, "
+                "/schedule cancel — отменить, /schedule — состояние"
+            )
+            return
+        if at <= time.time():
+            await update.message.reply_text("Это время уже прошло")
+            return
+        if schedule.stage == PREPARED:
+            await update.message.reply_text("Пары уже подобраны. Сначала отмените: /schedule cancel")
+            return
+        
+        schedule.set(at)
+        schedule_draw_jobs(context.application, event)
+        closes = time.strftime("%Y-%m-%d %H:%M", time.localtime(max(time.time(), at - DRAW_PREPARE_AHEAD)))
+        await update.message.reply_text(f"{schedule.describe()}\nРегистрация закроется в {closes}")
+    except Exception as e:
+        logger.error("Ошибка при планировании жеребьевки: %s", e)
+        await update.message.reply_text("Произошла ошибка при планировании жеребьевки")
+
+async def resend_failed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /resend (только для админа): повторно отправляет неудавшиеся результаты"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        event = current_event(context)
+        if event.delivering:
+            await update.message.reply_text(DELIVERY_RUNNING)
+            return
+        messages = event.outbox.with_state(DELIVERY_FAILED)
+        if not messages:
+            await update.message.reply_text("Нет сообщений для повторной отправки")
+            return
+        
+        status_message = await update.message.reply_text(f"Повторная отправка: {len(messages)}")
+        start_delivery(
+            context.application, event,
+            deliver_messages(bulk_bot(context.application), event, messages, status_message.edit_text, "Повторная отправка завершена!")
+        )
+    except Exception as e:
+        logger.error("Ошибка при повторной отправке: %s", e)
+        await update.message.reply_text("Произошла ошибка при повторной отправке")
+
 async def list_participants(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /list (тізім) (только для админа)"""
     try:
@@ -456,60 +1080,287 @@ async def list_participants(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Эта команда доступна только администратору")
             return
         
-        participants = bot_data.get_all_participants()
+        event = current_event(context)
+        if not event.bot_data.count_participants():
+            await update.message.reply_text("Участников пока нет")
+            return
         
-        if not participants:
+        text, reply_markup = build_list_page(event, 0)
+        await update.message.reply_text(text, reply_markup=reply_markup)
+            
+    except Exception as e:
+        logger.error("Қатысушылар тізімін көрсету кезінде қате: %s", e)
+        await update.message.reply_text("Қатысушылар тізімін алу кезінде қате пайда болды")
+
+def build_list_page(event: Event, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Возвращает текст страницы /list мероприятия (из кэша) и кнопки навигации"""
+    list_pages = event.list_pages
+    bot_data = event.bot_data
+    if list_pages.total is None:
+        list_pages.total = bot_data.count_participants()
+    total = list_pages.total
+    page_size = list_pages.page_size
+    pages = max(1, -(-total // page_size))
+    page = min(max(page, 0), pages - 1)
+    
+    text = list_pages.get(page)
+    if text is None:
+        # Формируем страницу БЕЗ Markdown
+        entries = []
+        participants = bot_data.get_participants_page(page * page_size, page_size)
+        for i, participant in enumerate(participants, page * page_size + 1):
+            receiver = bot_data.get_participant(participant.assigned_to) if participant.assigned_to else None
+            entries.append(render_list_entry(i, participant, receiver.name if receiver else None))
+        text = render_list_page(entries, page, pages, total)
+        list_pages.put(page, text)
+    
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"list:{event.name}:{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"list:{event.name}:{page + 1}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return text, reply_markup
+
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик кнопок навигации по /list (только для админа)"""
+    try:
+        query = update.callback_query
+        
+        if query.from_user.id != ADMIN_ID:
+            await query.answer("Эта команда доступна только администратору")
+            return
+        
+        await query.answer()
+        _, event_name, page = query.data.split(":")
+        text, reply_markup = build_list_page(events.get(event_name), int(page))
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        # Страница не изменилась (повторное нажатие)
+        logger.info("Страница списка не обновлена: %s", e)
+    except Exception as e:
+        logger.error("Ошибка при листании списка: %s", e)
+
+async def search_books(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /search <книга> (только для админа): кто хочет эту книгу"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        query = " ".join(context.args).strip()
+        if not query:
+            await update.message.reply_text("Формат: /search <название или автор>. Например: /search Абай жолы")
+            return
+        
+        event = current_event(context)
+        await event.book_index.ensure_built()
+        results = []
+        for title, user_ids in event.book_index.search(query, SEARCH_RESULTS_LIMIT):
+            names = []
+            for user_id in sorted(user_ids)[:SEARCH_NAMES_LIMIT]:
+                participant = event.bot_data.get_participant(user_id)
+                if participant:
+                    names.append(participant.name)
+            results.append((title, names, len(user_ids)))
+        await update.message.reply_text(render_search_results(query, results))
+    except Exception as e:
+        logger.error("Ошибка поиска по книгам: %s", e)
+        await update.message.reply_text("Произошла ошибка при поиске")
+
+async def top_books(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /topbooks (только для админа): самые запрашиваемые книги"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        index = current_event(context).book_index
+        await index.ensure_built()
+        top = index.top(TOP_BOOKS_LIMIT)
+        if not top:
             await update.message.reply_text("Участников пока нет")
             return
+        await update.message.reply_text(render_top_books(top, index.titles))
+    except Exception as e:
+        logger.error("Ошибка при подсчете книг: %s", e)
+        await update.message.reply_text("Произошла ошибка при подсчете книг")
+
+async def profile_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /profile [сек | <N>u] (только для админа): профиль обработки обновлений файлом"""
+    try:
+        user = update.effective_user
         
-        # Формируем список участников БЕЗ Markdown
-        message_lines = ["📋 Қатысушылар тізімі:\n"]
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
         
-        for i, participant in enumerate(participants, 1):
-            assigned_info = ""
-            if participant.assigned_to and participant.assigned_to in bot_data.participants:
-                assigned_to_participant = bot_data.participants[participant.assigned_to]
-                assigned_info = f" → 🎁 сыйлайды: {assigned_to_participant.name}"
-            
-            username = participant.username or "нет"
-            book_title = participant.desired_book.replace('_', '\\_').replace('*', '\\*').replace('`', '\\`')
-            
-            message_lines.append(
-                f"{i}. {participant.name} (@{username})"
-                f"{assigned_info}\n"
-                f"   📖: {book_title}\n"
-            )
+        usage = (f"Например: /profile 30 — {PROFILE_DEFAULT_SECONDS} сек по умолчанию, "
+                 f"/profile 500u — следующие 500 обновлений (не дольше {PROFILE_MAX_SECONDS} сек)")
+        arg = context.args[0].lower() if context.args else str(PROFILE_DEFAULT_SECONDS)
+        count = arg[:-1] if arg.endswith("u") else arg
+        if not count.isdigit() or int(count) <= 0:
+            await update.message.reply_text(usage)
+            return
+        if arg.endswith("u"):
+            seconds, updates = PROFILE_MAX_SECONDS, int(count)
+            scope = f"{updates} обновлений (не дольше {seconds} сек)"
+        else:
+            seconds, updates = min(int(count), PROFILE_MAX_SECONDS), 0
+            scope = f"{seconds} сек"
         
-        # Разбиваем сообщение если слишком длинное
-        message_text = "\n".join(message_lines)
+        if profiler.active:
+            await update.message.reply_text("Профилирование уже идет")
+            return
         
-        try:
-            # Пробуем отправить с Markdown
+        profiler.start(updates)
+        await update.message.reply_text(f"Профилирование запущено: {scope}")
+        # Профиль собирается в фоне: обработчик не держит очередь обновлений админа
+        context.application.create_task(send_profile(context.application, update.effective_chat.id, seconds))
+    except Exception as e:
+        logger.error("Ошибка при запуске профилирования: %s", e)
+        await update.message.reply_text("Произошла ошибка при запуске профилирования")
+
+async def send_profile(application: Application, chat_id: int, seconds: float):
+    """Дожидается конца профилирования и отправляет архив с результатами"""
+    try:
+        result = await profiler.collect(seconds)
+        archive = await asyncio.to_thread(result.to_zip)
+        await bulk_bot(application).send_document(
+            chat_id=chat_id,
+            document=archive,
+            filename=f"profile_{time.strftime('%Y%m%d_%H%M%S')}.zip",
+            caption=f"Профиль: {result.summary()}"
+        )
+    except Exception as e:
+        logger.error("Ошибка профилирования: %s", e)
+        await application.bot.send_message(chat_id=chat_id, text=f"Профилирование не удалось: {e}")
+
+async def import_participants_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик файла от админа (CSV, JSON, JSON Lines): массовый импорт участников мероприятия"""
+    try:
+        document = update.message.document
+        fmt = import_format(document.file_name or "")
+        if fmt is None:
             await update.message.reply_text(
-                message_text,
-                parse_mode='Markdown'
+                f"Импорт участников: файл {' / '.join('.' + f for f in IMPORT_FORMATS)} "
+                f"с колонками user_id, username, name, desired_book, comment"
             )
-        except BadRequest:
-            # Если не получается, отправляем без форматирования
-            await update.message.reply_text(
-                "📋 Қатысушылар тізімі:\n" + "\n".join([
-                    f"{i}. {p.name} (@{p.username or 'нет'})" + 
-                    (f" → 🎁 сыйлайды: {bot_data.participants[p.assigned_to].name}" if p.assigned_to and p.assigned_to in bot_data.participants else "") + 
-                    f"\n   📖: {p.desired_book}\n"
-                    for i, p in enumerate(participants, 1)
-                ])
+            return
+        
+        event = current_event(context)
+        if event.schedule.frozen:
+            await update.message.reply_text("Регистрация закрыта до жеребьевки, импорт невозможен")
+            return
+        
+        file = await document.get_file()
+        data = bytes(await file.download_as_bytearray())
+        # Разбор и проверка строк в отдельном потоке, чтобы не блокировать другие обновления
+        report = await asyncio.to_thread(read_bytes, data, fmt)
+        
+        with event.in_use():
+            started = time.perf_counter()
+            added = event.bot_data.import_participants(report.records)
+            await event.bot_data.flush()
+            written = time.perf_counter() - started
+        
+        await update.message.reply_text(
+            f"Импорт участников ({event.name}):\n{report.summary()}\n"
+            f"Новых участников: {added}\n"
+            f"Проверка: {report.elapsed:.2f} сек, запись: {written:.2f} сек"
+        )
+        if len(report.errors) > REPORTED_ERRORS:
+            await update.message.reply_document(
+                document=report.errors_csv(),
+                filename="import_errors.csv",
+                caption=f"Все строки с ошибками: {len(report.errors)}"
             )
+    except Exception as e:
+        logger.error("Ошибка при импорте участников: %s", e)
+        await update.message.reply_text("Произошла ошибка при импорте участников")
+
+async def export_participants(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /export [csv|jsonl] (только для админа): выгрузка участников и пар файлом"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        fmt = context.args[0].lower() if context.args else "csv"
+        if fmt not in EXPORT_FORMATS:
+            await update.message.reply_text(f"Формат: {' / '.join(EXPORT_FORMATS)}. Например: /export csv")
+            return
+        
+        event = current_event(context)
+        writer = ExportWriter(fmt)
+        try:
+            with event.in_use():
+                for chunk in event.bot_data.iter_participant_chunks():
+                    rows = rows_for_chunk(chunk, event.bot_data.get_participant)
+                    # Запись порции в отдельном потоке, чтобы не блокировать другие обновления
+                    await asyncio.to_thread(writer.write_rows, rows)
+            writer.close()
             
+            with open(writer.path, 'rb') as document:
+                await bulk_bot(context.application).send_document(
+                    chat_id=update.effective_chat.id,
+                    document=document,
+                    filename=writer.filename,
+                    caption=f"Қатысушылар: {writer.rows}"
+                )
+        finally:
+            writer.close()
+            writer.remove()
     except Exception as e:
-        logger.error(f"Қатысушылар тізімін көрсету кезінде қате: {e}")
-        await update.message.reply_text("Қатысушылар тізімін алу кезінде қате пайда болды")
+        logger.error("Ошибка при выгрузке участников: %s", e)
+        await update.message.reply_text("Произошла ошибка при выгрузке участников")
+
+async def select_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /event [название] (только для админа): выбор мероприятия для команд админа"""
+    try:
+        user = update.effective_user
+        
+        if user.id != ADMIN_ID:
+            await update.message.reply_text("Эта команда доступна только администратору")
+            return
+        
+        if not context.args:
+            await update.message.reply_text(
+                f"Текущее мероприятие: {context.user_data.get('event', DEFAULT_EVENT)}\n"
+                f"Все мероприятия: {', '.join(known_events())}\n"
+                f"Загружены в память: {', '.join(events.loaded) or 'нет'}\n\n"
+                "Выбрать или создать: /event <название>"
+            )
+            return
+        
+        name = context.args[0]
+        if not is_valid_event_name(name):
+            await update.message.reply_text("Название: латинские буквы, цифры, _ и -, не длиннее 32 символов")
+            return
+        
+        context.user_data['event'] = name
+        event = events.get(name)
+        await update.message.reply_text(
+            f"Текущее мероприятие: {name}\n"
+            f"Участников: {event.bot_data.count_participants()}\n"
+            f"Ссылка для регистрации: https://t.me/{context.bot.username}?start={name}"
+        )
+    except Exception as e:
+        logger.error("Ошибка при выборе мероприятия: %s", e)
+        await update.message.reply_text("Произошла ошибка при выборе мероприятия")
 
 async def clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команданы өңдеуші /clear (қайта)"""
     try:
         user = update.effective_user
         
-        if user.id in bot_data.participants:
+        if user.id in current_event(context).bot_data.participants:
             keyboard = [
                 [InlineKeyboardButton("🗑️ Менің деректерімді тазалау", callback_data="clear_my_data")],
                 [InlineKeyboardButton("✖️ Болдырмау", callback_data="cancel")]
@@ -523,7 +1374,7 @@ async def clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text("Сізде сақталған деректер жоқ")
     except Exception as e:
-        logger.error(f"Деректерді тазалау кезінде қате: {e}")
+        logger.error("Деректерді тазалау кезінде қате: %s", e)
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий кнопок"""
@@ -540,7 +1391,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Есіміңіз:",
                 parse_mode='Markdown'
             )
-            context.user_data.clear()
+            clear_draft(context)
             return NAME
         
         elif data == "keep":
@@ -554,73 +1405,51 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return await skip_comment(update, context)
         
         elif data == "clear_my_data":
-            if bot_data.clear_user_data(user.id):
+            if current_event(context).schedule.frozen:
+                await query.edit_message_text(REGISTRATION_CLOSED)
+            elif current_event(context).bot_data.clear_user_data(user.id):
                 await query.edit_message_text("Деректеріңіз жойылды✅ Қайта бастау үшін /start пайдаланыңыз.")
             else:
                 await query.edit_message_text("Деректерді өшіру мүмкін болмады")
         
-        elif data == "relottery":
-            # Очищаем предыдущие назначения
-            for participant in bot_data.participants.values():
-                participant.assigned_to = None
+        elif data.startswith("relottery:"):
+            if user.id != ADMIN_ID:
+                return
+            event = events.get(data.split(":", 1)[1])
+            if event.schedule.active:
+                await query.edit_message_text(f"{event.schedule.describe()}. Отменить: /schedule cancel")
+                return
+            if event.delivering:
+                await query.edit_message_text(DELIVERY_RUNNING)
+                return
+            # Проводим жеребьевку заново, по возможности не повторяя прошлые пары
+            participants = event.bot_data.get_all_participants()
+            exclusions = Exclusions.from_file(event.exclusions_file)
+            exclusions.forbid_previous({p.user_id: p.assigned_to for p in participants})
+            try:
+                result = perform_lottery(event, participants, exclusions)
+            except MatchingError as e:
+                logger.info("Не удалось избежать прошлых пар: %s", e)
+                try:
+                    result = perform_lottery(event, participants)
+                except MatchingError as e:
+                    await query.edit_message_text(f"Жеребьевка невозможна: {e}")
+                    return
             
-            # Проводим жеребьевку заново
-            participants = bot_data.get_all_participants()
-            if perform_lottery(participants):
-                # Отправляем результаты
-                sent_count = 0
-                for participant in participants:
-                    try:
-                        assigned_participant = bot_data.participants[participant.assigned_to]
-                        
-                        name_escaped = escape_markdown(assigned_participant.name)
-                        book_escaped = escape_markdown(assigned_participant.desired_book)
-                        comment_escaped = escape_markdown(assigned_participant.comment) if assigned_participant.comment else ""
-                        
-                        message_text = (
-                            "🔄 **Жеребе қайтадан өткізілді!**\n\n"
-                            f"Сізге келесі оқырман түсті: **{name_escaped}**\n\n"
-                            f"📖 **Оқырман қалайтын келетін кітап:**\n"
-                            f"_{book_escaped}_\n\n"
-                        )
-                        
-                        if assigned_participant.comment:
-                            message_text += f"💬 **Пікірі:**\n_{comment_escaped}_"
-                        
-                        await context.bot.send_message(
-                            chat_id=participant.user_id,
-                            text=message_text,
-                            parse_mode='Markdown'
-                        )
-                        sent_count += 1
-                        
-                    except BadRequest as e:
-                        logger.error(f"Ошибка Markdown при отправке сообщения: {e}")
-                        # Отправляем без форматирования
-                        await context.bot.send_message(
-                            chat_id=participant.user_id,
-                            text=f"🔄 Жеребе қайтадан өткізілді!\n\n"
-                                 f"Сізге келесі оқырман түсті: {assigned_participant.name}\n\n"
-                                 f"📖 Оқырман қалайтын келетін кітап:\n"
-                                 f"{assigned_participant.desired_book}\n\n" +
-                                 (f"💬 Пікірі:\n{assigned_participant.comment}" if assigned_participant.comment else "")
-                        )
-                        sent_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить сообщение: {e}")
+            if result:
+                await event.bot_data.flush()
                 
-                bot_data.save_data()
-                await query.edit_message_text(
-                    f"Жеребе қайтадан өткізілді!\n"
-                    f"Хабарлама жіберілді: {sent_count}/{len(participants)}"
+                # Отправляем результаты
+                start_delivery(
+                    context.application, event,
+                    send_lottery_results(bulk_bot(context.application), event, participants, query.edit_message_text, repeat=True)
                 )
         
         elif data == "cancel":
             await query.edit_message_text("Действие отменено")
     
     except Exception as e:
-        logger.error(f"Ошибка в обработчике кнопок: {e}")
+        logger.error("Ошибка в обработчике кнопок: %s", e)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена диалога"""
@@ -629,69 +1458,202 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             "Заполнение данных отменено. "
             "Используйте /start чтобы начать заново."
         )
-        context.user_data.clear()
+        clear_draft(context)
         return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Ошибка при отмене: {e}")
+        logger.error("Ошибка при отмене: %s", e)
         return ConversationHandler.END
 
+async def throttle_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отбрасывает обновления сверх лимита частоты и повторные нажатия кнопок до остальных обработчиков"""
+    # Первый обработчик любого обновления: дальнейшие записи в лог получат его update_id и user_id
+    bind_update(update)
+    profiler.update_seen()
+    user = update.effective_user
+    if user is None:
+        return
+    query = update.callback_query
+    callback = (query.message.message_id if query.message else query.inline_message_id, query.data) if query else None
+    verdict = throttle.check(user.id, callback)
+    if verdict not in (DUPLICATE, RATE_LIMITED):
+        return
+    try:
+        if verdict == DUPLICATE:
+            # Первое нажатие уже обрабатывается, на повторное только убираем «часики» на кнопке
+            await query.answer()
+        elif throttle.should_notice(user.id):
+            if query:
+                await query.answer("Слишком часто, подождите немного")
+            elif update.effective_message:
+                await update.effective_message.reply_text("Слишком много сообщений. Подождите немного.")
+    except Exception as e:
+        logger.warning("Не удалось ответить на отброшенное обновление: %s", e)
+    raise ApplicationHandlerStop
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик ошибок"""
-    logger.error(f"Ошибка при обработке обновления: {context.error}", exc_info=context.error)
+    logger.error("Ошибка при обработке обновления: %s", context.error, exc_info=context.error)
     
     if isinstance(context.error, TimedOut):
         logger.warning("Таймаут при подключении к Telegram")
     elif isinstance(context.error, BadRequest):
-        logger.error(f"Ошибка запроса Telegram: {context.error}")
+        logger.error("Ошибка запроса Telegram: %s", context.error)
     else:
-        logger.error(f"Необработанная ошибка: {context.error}")
+        logger.error("Необработанная ошибка: %s", context.error)
 
-# ==================== ОСНОВНАЯ ФУНКЦИЯ ====================
-def main():
-    """Запуск бота"""
-    # Создаем Application с настройками таймаута
-    application = Application.builder() \
-        .token(BOT_TOKEN) \
-        .connect_timeout(30.0) \
-        .read_timeout(30.0) \
-        .write_timeout(30.0) \
-        .pool_timeout(30.0) \
-        .get_updates_connect_timeout(10.0) \
-        .get_updates_read_timeout(10.0) \
-        .get_updates_write_timeout(10.0) \
-        .get_updates_pool_timeout(10.0) \
-        .build()
+async def post_init(application: Application) -> None:
+    """Запускает метрики и выгрузку простаивающих мероприятий, досылает результаты, не отправленные до перезапуска"""
+    if METRICS_PORT:
+        await metrics_server.start()
+    if bulk_bot(application) is not application.bot:
+        await bulk_bot(application).initialize()
+    events.start_eviction()
+    for name in known_events():
+        # Запланированные жеребьевки снова ставятся в JobQueue
+        if application.job_queue is not None and os.path.exists(event_file(name, SCHEDULE_FILE)):
+            event = events.get(name)
+            if event.schedule.draw_id is not None and event.outbox.draw_id == event.schedule.draw_id:
+                # Остановка после записи outbox: рассылка уже в outbox, ее продолжит resume_delivery
+                event.schedule.clear()
+            elif event.schedule.active:
+                schedule_draw_jobs(application, event)
+        path = event_file(name, OUTBOX_FILE)
+        if not os.path.exists(path):
+            continue
+        # Мероприятие загружаем, только если в его очереди остались неотправленные сообщения
+        probe = Outbox(path)
+        has_pending = bool(probe.with_state(DELIVERY_PENDING))
+        probe.close()
+        if has_pending:
+            await resume_delivery(application, events.get(name))
+
+async def resume_delivery(application: Application, event: Event):
+    """Досылает сообщения из outbox мероприятия, оставшиеся в pending"""
+    pending = event.outbox.with_state(DELIVERY_PENDING)
+    logger.info("Продолжаем рассылку жеребьевки %s (%s): осталось %s", event.outbox.draw_id, event.name, len(pending))
+    try:
+        status_message = await application.bot.send_message(
+            chat_id=ADMIN_ID,
+            text=f"Продолжаем рассылку результатов после перезапуска ({event.name}): {len(pending)}"
+        )
+        report = status_message.edit_text
+    except Exception as e:
+        logger.error("Не удалось уведомить администратора: %s", e)
+        
+        async def report(text: str):
+            logger.info(text)
     
+    start_delivery(
+        application, event,
+        deliver_messages(bulk_bot(application), event, pending, report, "Рассылка после перезапуска завершена!")
+    )
+
+async def post_shutdown(application: Application) -> None:
+    """Записывает несохраненные изменения всех мероприятий при остановке бота"""
+    events.stop_eviction()
+    await metrics_server.stop()
+    if bulk_bot(application) is not application.bot:
+        await bulk_bot(application).shutdown()
+    await asyncio.to_thread(events.close)
+
+def add_handlers(application: Application):
+    """Регистрирует обработчики бота (каждый обернут timed для метрик времени обработки)"""
     # Добавляем обработчик ошибок
     application.add_error_handler(error_handler)
     
+    # Ограничение частоты срабатывает раньше всех обработчиков (группа -1).
+    # Без timed: ApplicationHandlerStop — штатный исход, а не ошибка обработчика
+    application.add_handler(TypeHandler(Update, throttle_updates), group=-1)
+    
     # Создаем ConversationHandler для /start
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[CommandHandler("start", timed(start))],
         states={
-            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_name)],
-            BOOK: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_book)],
+            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_name))],
+            BOOK: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_book))],
             COMMENT: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_comment),
-                CommandHandler("start", start)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_comment)),
+                CommandHandler("start", timed(start))
             ],
             CONFIRM: [
-                CommandHandler("send", submit_data),
-                CommandHandler("start", start)
+                CommandHandler("send", timed(submit_data)),
+                CommandHandler("start", timed(start))
             ],
         },
-        fallbacks=[CommandHandler("cancel", cancel)],
+        fallbacks=[CommandHandler("cancel", timed(cancel))],
+        name="registration",
+        persistent=application.persistence is not None,
     )
     
     # Добавляем обработчики
     application.add_handler(conv_handler)
-    application.add_handler(CommandHandler("send", submit_data))
-    application.add_handler(CommandHandler("lottery", lottery))
-    application.add_handler(CommandHandler("list", list_participants))
-    application.add_handler(CommandHandler("clear", clear_data))
+    application.add_handler(CommandHandler("send", timed(submit_data)))
+    application.add_handler(CommandHandler("lottery", timed(lottery)))
+    application.add_handler(CommandHandler("schedule", timed(schedule_lottery)))
+    application.add_handler(CommandHandler("list", timed(list_participants)))
+    application.add_handler(CommandHandler("resend", timed(resend_failed)))
+    application.add_handler(CommandHandler("export", timed(export_participants)))
+    # Файлы для импорта участников принимаются только от админа
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.User(ADMIN_ID), timed(import_participants_file)
+    ))
+    application.add_handler(CommandHandler("search", timed(search_books)))
+    application.add_handler(CommandHandler("topbooks", timed(top_books)))
+    application.add_handler(CommandHandler("profile", timed(profile_updates)))
+    application.add_handler(CommandHandler("clear", timed(clear_data)))
+    application.add_handler(CommandHandler("event", timed(select_event)))
     
-    # Обработчик кнопок (CallbackQueryHandler)
-    application.add_handler(CallbackQueryHandler(button_handler))
+    # Обработчики кнопок (CallbackQueryHandler)
+    application.add_handler(CallbackQueryHandler(timed(list_page_callback), pattern=r"^list:[A-Za-z0-9_-]+:\d+$"))
+    application.add_handler(CallbackQueryHandler(timed(button_handler)))
+
+# ==================== ОСНОВНАЯ ФУНКЦИЯ ====================
+def main():
+    """Запуск бота"""
+    # Запросы к Bot API идут через InstrumentedRequest, чтобы попадать в метрики.
+    # Ответы пользователям и массовые отправки — через разные пулы соединений
+    request = InstrumentedRequest(
+        lane=INTERACTIVE,
+        priority=traffic_priority,
+        connection_pool_size=INTERACTIVE_POOL_SIZE,
+        connect_timeout=INTERACTIVE_TIMEOUT,
+        read_timeout=INTERACTIVE_TIMEOUT,
+        write_timeout=INTERACTIVE_TIMEOUT,
+        pool_timeout=INTERACTIVE_TIMEOUT
+    )
+    bulk_request = InstrumentedRequest(
+        lane=BULK,
+        priority=traffic_priority,
+        connection_pool_size=BULK_POOL_SIZE,
+        connect_timeout=BULK_TIMEOUT,
+        read_timeout=BULK_TIMEOUT,
+        write_timeout=BULK_TIMEOUT,
+        pool_timeout=BULK_TIMEOUT
+    )
+    # getUpdates висит до 10 секунд, поэтому не учитывается в приоритете
+    get_updates_request = InstrumentedRequest(
+        connect_timeout=10.0,
+        read_timeout=10.0,
+        write_timeout=10.0,
+        pool_timeout=10.0
+    )
+    application = Application.builder() \
+        .token(BOT_TOKEN) \
+        .base_url(BOT_API_BASE_URL) \
+        .request(request) \
+        .get_updates_request(get_updates_request) \
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES)) \
+        .persistence(DraftPersistence(DRAFTS_FILE, ttl=DRAFT_TTL, update_interval=DRAFTS_UPDATE_INTERVAL)) \
+        .post_init(post_init) \
+        .post_shutdown(post_shutdown) \
+        .build()
+    application.bot_data[BULK_BOT_KEY] = ExtBot(
+        token=BOT_TOKEN,
+        base_url=BOT_API_BASE_URL,
+        request=bulk_request
+    )
+    
+    add_handlers(application)
     
     # Запускаем бота
     print("Бот запущен...")
@@ -701,11 +1663,23 @@ def main():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(application.run_polling(
-                allowed_updates=Update.ALL_TYPES
-            ))
+            run_application(application)
         finally:
             loop.close()
+    else:
+        run_application(application)
+
+def run_application(application: Application):
+    """Получает обновления через webhook (если задан WEBHOOK_URL) или polling"""
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            allowed_updates=Update.ALL_TYPES
+        )
     else:
         application.run_polling(
             allowed_updates=Update.ALL_TYPES
@@ -0,0 +1,196 @@
+"""Индекс желаемых книг для /search и /topbooks.
+
+Поле desired_book часто содержит нумерованный список на несколько строк
+("1.Абай жолы", "2) «Ақбілек»"), поэтому каждая строка индексируется как
+отдельная книга. Названия нормализуются: регистр, казахские буквы
+(ә→а, қ→к, ү→у, ...), ё→е, кавычки и знаки препинания, так что «Абай жолы»,
+"абай жолы" и АБАЙ ЖОЛЫ — одна книга. Поиск идет по триграммам
+нормализованных названий с проверкой подстроки и не перебирает участников.
+"""
+import asyncio
+import heapq
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Номер пункта списка в начале строки: "1.", "2. ", "3)", "4 -"
+_NUMBERING_RE = re.compile(r"^\s*\d{1,3}\s*[.)\-:]\s*")
+# Все, кроме букв и цифр, становится пробелом (кавычки, точки, скобки, эмодзи)
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+# Казахские буквы и ё сводятся к близким русским, чтобы написание не влияло на поиск
+# (цепочка str.replace в несколько раз быстрее str.translate со словарем)
+_LETTERS = tuple(zip("әғқңөұүһіё", "агкноуухие"))
+
+# Минимальная длина названия книги (как при регистрации)
+MIN_TITLE_LENGTH = 3
+
+
+def normalize(text: str) -> str:
+    """Нормализованная форма для сравнения: нижний регистр, без кавычек и пунктуации"""
+    text = text.casefold()
+    for letter, replacement in _LETTERS:
+        text = text.replace(letter, replacement)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def split_books(desired_book: str) -> List[str]:
+    """Отдельные книги из поля desired_book (по строкам, без номеров пунктов)"""
+    books = []
+    for line in desired_book.splitlines():
+        title = _NUMBERING_RE.sub("", line).strip()
+        if len(title) >= MIN_TITLE_LENGTH:
+            books.append(title)
+    return books
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _query_trigrams(query: str) -> Set[str]:
+    # Запрос может быть началом или серединой слова, поэтому дополняем пробелом только короткий
+    if len(query) < 3:
+        query = f" {query}"
+    return {query[i:i + 3] for i in range(len(query) - 2)}
+
+
+class _Title:
+    __slots__ = ("title", "users")
+
+    def __init__(self, title: str):
+        # Написание первого участника, запросившего книгу
+        self.title = title
+        self.users: Set[int] = set()
+
+
+class BookIndex:
+    """Инкрементальный индекс книг мероприятия: книга -> участники, триграмма -> книги.
+
+    Строится при первом запросе (загрузка мероприятия не замедляется) и
+    дальше обновляется подписчиком on_change на изменения BotData. Построение
+    идет порциями с возвратом управления event loop; изменения, пришедшие во
+    время построения, сразу применяются к индексу.
+    """
+
+    def __init__(self, load: Callable[[], Iterable[List]]):
+        # load() отдает участников порциями (BotData.iter_participant_chunks)
+        self._load = load
+        self._built = False
+        self._building: Optional[asyncio.Task] = None
+        self._titles: Dict[str, _Title] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._by_user: Dict[int, List[str]] = {}
+
+    async def ensure_built(self):
+        """Строит индекс, если он еще не построен, не блокируя event loop надолго"""
+        if self._built:
+            return
+        if self._building is None:
+            self._building = asyncio.ensure_future(self._build())
+        await asyncio.shield(self._building)
+
+    async def _build(self):
+        try:
+            for chunk in self._load():
+                for participant in chunk:
+                    self._add(participant.user_id, participant.desired_book)
+                await asyncio.sleep(0)
+            self._built = True
+        finally:
+            self._building = None
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        # Синхронный вызов без ensure_built (CLI, бенчмарки)
+        for chunk in self._load():
+            for participant in chunk:
+                self._add(participant.user_id, participant.desired_book)
+        self._built = True
+
+    def _add(self, user_id: int, desired_book: str):
+        # Участник мог попасть в индекс через on_change раньше своей порции
+        self._remove(user_id)
+        keys = []
+        for title in split_books(desired_book):
+            key = normalize(title)
+            if not key or key in keys:
+                continue
+            keys.append(key)
+            entry = self._titles.get(key)
+            if entry is None:
+                entry = self._titles[key] = _Title(title)
+                for trigram in _trigrams(key):
+                    self._trigrams.setdefault(trigram, set()).add(key)
+            entry.users.add(user_id)
+        if keys:
+            self._by_user[user_id] = keys
+
+    def _remove(self, user_id: int):
+        for key in self._by_user.pop(user_id, ()):
+            entry = self._titles[key]
+            entry.users.discard(user_id)
+            if entry.users:
+                continue
+            del self._titles[key]
+            for trigram in _trigrams(key):
+                keys = self._trigrams.get(trigram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._trigrams[trigram]
+
+    def on_change(self, op: dict):
+        """Подписчик на изменения BotData"""
+        if not self._built and self._building is None:
+            # Индекс еще не строился: при построении он прочитает актуальные данные
+            return
+        kind = op.get("op")
+        if kind == "put":
+            record = op["participant"]
+            self._add(record["user_id"], record["desired_book"])
+        elif kind == "import":
+            for record in op["participants"]:
+                self._add(record["user_id"], record["desired_book"])
+        elif kind == "delete":
+            self._remove(op["user_id"])
+        elif kind == "clear":
+            self._titles.clear()
+            self._trigrams.clear()
+            self._by_user.clear()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, Set[int]]]:
+        """Книги, в нормализованном названии которых есть запрос: [(название, {user_id}), ...]"""
+        self._ensure_built()
+        query = normalize(query)
+        if not query:
+            return []
+        candidates = None
+        for trigram in sorted(_query_trigrams(query), key=lambda t: len(self._trigrams.get(t, ()))):
+            keys = self._trigrams.get(trigram)
+            if not keys:
+                return []
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return []
+        if candidates is None:
+            # Запрос из одной буквы: триграмм нет
+            return []
+        matches = (self._titles[key] for key in candidates if query in key)
+        return [(entry.title, entry.users) for entry in self._largest(matches, limit)]
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Самые запрашиваемые книги: [(название, число участников), ...]"""
+        self._ensure_built()
+        return [(entry.title, len(entry.users)) for entry in self._largest(self._titles.values(), limit)]
+
+    @property
+    def titles(self) -> int:
+        """Число разных книг"""
+        self._ensure_built()
+        return len(self._titles)
+
+    @staticmethod
+    def _largest(entries: Iterator[_Title], limit: int) -> List[_Title]:
+        return heapq.nlargest(limit, entries, key=lambda entry: (len(entry.users), entry.title))
@@ -0,0 +1,232 @@
+"""Параллельная рассылка сообщений с ограничением скорости под лимиты Telegram"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import BROADCAST_MESSAGES, BROADCAST_RATE, BROADCAST_RETRIES, BROADCAST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и ~1 сообщение в секунду в один чат
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+# Сколько запросов одновременно может быть "в полете"
+CONCURRENCY = 20
+# Сколько раз повторять отправку при сетевых ошибках
+MAX_ATTEMPTS = 3
+# Как часто сообщать о ходе рассылки (сек)
+PROGRESS_INTERVAL = 3.0
+
+# Состояния доставки сообщения
+DELIVERY_PENDING = "pending"
+DELIVERY_SENT = "sent"
+DELIVERY_FAILED = "failed"
+DELIVERY_BLOCKED = "blocked"  # Пользователь заблокировал бота (Forbidden)
+
+
+@dataclass
+class BroadcastMessage:
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    fallback_text: Optional[str] = None  # Текст без разметки, если Telegram не принял разметку
+
+
+@dataclass
+class BroadcastResult:
+    total: int
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    failed_chats: List[int] = field(default_factory=list)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не больше rate операций в секунду, всплески до capacity
+
+    По умолчанию capacity=1, чтобы в любом окне в 1 секунду было не больше rate+1 запросов.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else 1.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ждет, пока появится свободный токен"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (после RetryAfter от Telegram)"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class Broadcaster:
+    """Рассылает сообщения параллельно, соблюдая общий и поканальный лимиты.
+
+    При RetryAfter вся рассылка ставится на паузу, а сообщение возвращается
+    в очередь. Ход рассылки периодически передается в progress.
+    """
+
+    def __init__(self, bot, global_rate: float = GLOBAL_RATE,
+                 per_chat_interval: float = PER_CHAT_INTERVAL,
+                 concurrency: int = CONCURRENCY, max_attempts: int = MAX_ATTEMPTS):
+        self.bot = bot
+        self.bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._chat_next: Dict[int, float] = {}
+
+    async def _wait_chat(self, chat_id: int):
+        now = time.monotonic()
+        next_allowed = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, next_allowed) + self.per_chat_interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+    async def _send(self, message: BroadcastMessage, text: str, parse_mode: Optional[str]):
+        await self._wait_chat(message.chat_id)
+        await self.bucket.acquire()
+        await self.bot.send_message(chat_id=message.chat_id, text=text, parse_mode=parse_mode)
+
+    async def _deliver(self, message: BroadcastMessage, result: BroadcastResult) -> bool:
+        """Отправляет одно сообщение; возвращает False, если его нужно повторить позже"""
+        try:
+            await self._send(message, message.text, message.parse_mode)
+        except RetryAfter as e:
+            self.bucket.pause(_retry_after_seconds(e))
+            result.retries += 1
+            return False
+        except BadRequest as e:
+            if message.fallback_text is None or message.parse_mode is None:
+                raise
+            logger.error("Ошибка разметки при отправке сообщения пользователю %s: %s", message.chat_id, e)
+            try:
+                await self._send(message, message.fallback_text, None)
+            except RetryAfter as retry:
+                self.bucket.pause(_retry_after_seconds(retry))
+                result.retries += 1
+                return False
+        return True
+
+    async def run(self, messages: List[BroadcastMessage],
+                  progress: Callable[[BroadcastResult], Awaitable[None]] = None,
+                  progress_interval: float = PROGRESS_INTERVAL,
+                  on_state: Callable[[int, str], None] = None) -> BroadcastResult:
+        """Рассылает все сообщения и возвращает итог.
+
+        on_state(chat_id, state) вызывается, как только доставка сообщения завершена.
+        """
+        def finish(message: BroadcastMessage, state: str, error: Exception = None):
+            if state == DELIVERY_SENT:
+                result.sent += 1
+            else:
+                logger.error("Не удалось отправить сообщение пользователю %s: %s", message.chat_id, error)
+                if state == DELIVERY_BLOCKED:
+                    result.blocked += 1
+                else:
+                    result.failed += 1
+                result.failed_chats.append(message.chat_id)
+            if on_state:
+                on_state(message.chat_id, state)
+
+        result = BroadcastResult(total=len(messages))
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait((message, 0))
+        started = time.monotonic()
+
+        async def worker():
+            while True:
+                try:
+                    message, attempts = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    if await self._deliver(message, result):
+                        finish(message, DELIVERY_SENT)
+                    else:
+                        queue.put_nowait((message, attempts))
+                except Forbidden as e:
+                    finish(message, DELIVERY_BLOCKED, e)
+                except (TimedOut, NetworkError) as e:
+                    if isinstance(e, BadRequest) or attempts + 1 >= self.max_attempts:
+                        finish(message, DELIVERY_FAILED, e)
+                    else:
+                        result.retries += 1
+                        queue.put_nowait((message, attempts + 1))
+                except Exception as e:
+                    finish(message, DELIVERY_FAILED, e)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_interval)
+                await self._report(progress, result)
+
+        reporter_task = asyncio.create_task(reporter()) if progress else None
+        try:
+            # Повторы возвращаются в очередь, поэтому запускаем воркеров, пока она не опустеет
+            while not queue.empty():
+                await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()))))
+        finally:
+            if reporter_task:
+                reporter_task.cancel()
+        result.elapsed = time.monotonic() - started
+        self._record_metrics(result)
+        if progress:
+            await self._report(progress, result)
+        return result
+
+    @staticmethod
+    def _record_metrics(result: BroadcastResult):
+        BROADCAST_MESSAGES.labels(DELIVERY_SENT).inc(result.sent)
+        BROADCAST_MESSAGES.labels(DELIVERY_FAILED).inc(result.failed)
+        BROADCAST_MESSAGES.labels(DELIVERY_BLOCKED).inc(result.blocked)
+        BROADCAST_RETRIES.inc(result.retries)
+        BROADCAST_SECONDS.observe(result.elapsed)
+        if result.elapsed > 0:
+            BROADCAST_RATE.set(result.sent / result.elapsed)
+
+    @staticmethod
+    async def _report(progress, result: BroadcastResult):
+        try:
+            await progress(result)
+        except Exception as e:
+            logger.warning("Не удалось обновить ход рассылки: %s", e)
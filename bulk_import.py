@@ -0,0 +1,202 @@
+"""Массовый импорт участников из CSV, JSON или JSON Lines (например, из анкеты на сайте).
+
+Строки читаются потоком и проверяются по тем же правилам, что и
+регистрация в чате (MIN_NAME_LENGTH, MIN_BOOK_LENGTH используют handle_name
+и handle_book). Ошибочные строки попадают в отчет, все правильные
+добавляются одной операцией BotData.import_participants — одной записью
+на диск вместо записи на каждого участника.
+
+Колонки: user_id (ID в Telegram, обязательно), username, name, desired_book,
+comment; лишние колонки (например, из /export) игнорируются.
+
+Запуск при остановленном боте (работающему боту файл отправляет админ):
+    python bulk_import.py participants.csv [--event club2025]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+# Правила регистрации (те же, что в handle_name и handle_book)
+MIN_NAME_LENGTH = 2
+MIN_BOOK_LENGTH = 3
+
+IMPORT_FORMATS = ("csv", "json", "jsonl")
+
+# Сколько ошибочных строк перечислять в отчете
+REPORTED_ERRORS = 20
+
+
+def import_format(filename: str) -> Optional[str]:
+    """Формат по расширению файла (None — не поддерживается)"""
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def iter_rows(f: IO[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(номер строки, строка) из файла; строка CSV — dict, строка JSON — что угодно (проверит validate_row)"""
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, e
+    elif fmt == "json":
+        # JSON-массив целиком (или снимок participants.json: {user_id: запись})
+        data = json.load(f)
+        rows = data.values() if isinstance(data, dict) else data
+        yield from enumerate(rows, 1)
+    else:
+        raise ValueError(f"Неизвестный формат импорта: {fmt}")
+
+
+def _text(row: dict, field: str) -> str:
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def validate_row(row) -> Tuple[Optional[dict], Optional[str]]:
+    """Запись участника в формате снимка или текст ошибки"""
+    if isinstance(row, Exception):
+        return None, f"некорректный JSON: {row}"
+    if not isinstance(row, dict):
+        return None, "ожидался объект с полями участника"
+    try:
+        user_id = int(_text(row, "user_id"))
+    except ValueError:
+        return None, "нет числового user_id"
+    if user_id <= 0:
+        return None, "user_id должен быть положительным"
+    name = _text(row, "name")
+    if len(name) < MIN_NAME_LENGTH:
+        return None, f"имя короче {MIN_NAME_LENGTH} символов"
+    desired_book = _text(row, "desired_book")
+    if len(desired_book) < MIN_BOOK_LENGTH:
+        return None, f"название книги короче {MIN_BOOK_LENGTH} символов"
+    return {
+        "user_id": user_id,
+        "username": _text(row, "username").lstrip("@"),
+        "name": name,
+        "desired_book": desired_book,
+        "comment": _text(row, "comment"),
+        "assigned_to": None,
+    }, None
+
+
+class ImportReport:
+    """Итог проверки файла: правильные записи и ошибочные строки"""
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self.errors: List[Tuple[int, str]] = []
+        self.elapsed = 0.0
+
+    @property
+    def rows(self) -> int:
+        return len(self.records) + len(self.errors)
+
+    def summary(self) -> str:
+        lines = [
+            f"Строк: {self.rows}",
+            f"Импортировано: {len(self.records)}",
+            f"С ошибками: {len(self.errors)}",
+        ]
+        lines += [f"  строка {line_no}: {error}" for line_no, error in self.errors[:REPORTED_ERRORS]]
+        if len(self.errors) > REPORTED_ERRORS:
+            lines.append(f"  ... и еще {len(self.errors) - REPORTED_ERRORS}")
+        return "\n".join(lines)
+
+    def errors_csv(self) -> bytes:
+        """Все ошибочные строки файлом (utf-8-sig, как /export)"""
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(["line", "error"])
+        writer.writerows(self.errors)
+        return text.getvalue().encode("utf-8-sig")
+
+
+def read_participants(f: IO[str], fmt: str) -> ImportReport:
+    """Читает и проверяет строки; повтор user_id в файле — ошибка (остается первая строка)"""
+    started = time.perf_counter()
+    report = ImportReport()
+    seen: Dict[int, int] = {}
+    try:
+        for line_no, row in iter_rows(f, fmt):
+            record, error = validate_row(row)
+            if record is not None and record["user_id"] in seen:
+                record, error = None, f"повтор user_id {record['user_id']} (см. строку {seen[record['user_id']]})"
+            if record is None:
+                report.errors.append((line_no, error))
+                continue
+            seen[record["user_id"]] = line_no
+            report.records.append(record)
+    except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        report.errors.append((0, f"файл не прочитан: {e}"))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def read_bytes(data: bytes, fmt: str) -> ImportReport:
+    """read_participants для файла, присланного боту"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        report = ImportReport()
+        report.errors.append((0, f"файл не в UTF-8: {e}"))
+        return report
+    return read_participants(io.StringIO(text, newline=""), fmt)
+
+
+def read_file(path: str, fmt: str = None) -> ImportReport:
+    """read_participants для файла на диске; формат по расширению, если не указан"""
+    fmt = fmt or import_format(path)
+    if fmt is None:
+        raise ValueError(f"Формат файла {path}: {' / '.join(IMPORT_FORMATS)}")
+    # utf-8-sig: CSV из Excel начинается с BOM
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return read_participants(f, fmt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="по умолчанию — по расширению файла")
+    parser.add_argument("--event", default=None, help="мероприятие (по умолчанию — основное)")
+    args = parser.parse_args()
+
+    from events import DEFAULT_EVENT, is_valid_event_name
+    name = args.event or DEFAULT_EVENT
+    # Имя мероприятия становится каталогом в EVENTS_DIR
+    if not is_valid_event_name(name):
+        parser.error("--event: латинские буквы, цифры, _ и -, не длиннее 32 символов")
+
+    import book_bot
+    report = read_file(args.file, args.format)
+    event = book_bot.create_event(name)
+    try:
+        if event.schedule.frozen:
+            print("Регистрация закрыта (идет подготовка жеребьевки), импорт невозможен")
+            sys.exit(1)
+        started = time.perf_counter()
+        # Одна операция и одна запись на диск для всех правильных строк
+        added = event.bot_data.import_participants(report.records)
+        event.bot_data.writer.sync()
+        written = time.perf_counter() - started
+    finally:
+        event.close()
+    print(report.summary())
+    print(f"Новых участников: {added}, проверка {report.elapsed:.2f} сек, запись {written:.2f} сек")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Сохранение незавершенных регистраций (состояние диалога и user_data) между перезапусками"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from persistence import PersistenceWriter
+from storage import JournalStorage
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд без изменений черновик регистрации считается заброшенным
+DRAFT_TTL = 7 * 24 * 3600
+
+# Как часто (сек) проверять черновики на устаревание
+EXPIRE_CHECK_INTERVAL = 600
+
+# Поля user_data, которые хранятся без срока: выбор мероприятия переживает заброшенный черновик
+KEPT_FIELDS = ("event",)
+
+
+def apply_draft_op(records: Dict[str, dict], op: dict):
+    """Применяет операцию журнала черновиков (идемпотентно, как apply_op участников)"""
+    kind = op.get("op")
+    if kind == "put":
+        records[op["key"]] = op["record"]
+    elif kind == "delete":
+        records.pop(op["key"], None)
+    else:
+        logger.warning("Неизвестная операция журнала черновиков: %s", kind)
+
+
+def _user_key(user_id: int) -> str:
+    return f"u:{user_id}"
+
+
+def _conversation_key(name: str, key: Tuple) -> str:
+    return f"c:{name}:{','.join(map(str, key))}"
+
+
+class DraftPersistence(BasePersistence):
+    """Хранит только незавершенные регистрации: состояние ConversationHandler и user_data.
+
+    Каждое изменение — одна строка журнала (JournalStorage) на одного
+    пользователя, а не перезапись всех данных. Пустые user_data и завершенные
+    диалоги удаляются из хранилища, а черновики без изменений дольше ttl
+    отбрасываются, поэтому файл растет только с числом незаконченных регистраций.
+    Поля kept (выбор мероприятия) при устаревании остаются: запись с одними
+    ими не устаревает.
+    """
+
+    def __init__(self, data_file: str, ttl: float = DRAFT_TTL, update_interval: float = 5,
+                 max_delay: float = 0.5, kept: Tuple[str, ...] = KEPT_FIELDS):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.ttl = ttl
+        self.kept = kept
+        self.storage = JournalStorage(data_file, apply=apply_draft_op, indent=None)
+        self._records: Dict[str, dict] = self.storage.load()
+        self._writer = PersistenceWriter(
+            self.storage, dict(self._records), max_delay, apply=apply_draft_op, name="drafts-writer"
+        )
+        self._next_expire_check = 0.0
+        self.expire()
+
+    @property
+    def drafts(self) -> int:
+        """Число незавершенных регистраций в хранилище"""
+        return sum(1 for key in self._records if key.startswith("c:"))
+
+    def _put(self, key: str, record: dict):
+        record["ts"] = int(time.time())
+        self._records[key] = record
+        self._writer.submit({"op": "put", "key": key, "record": record})
+
+    def _delete(self, key: str):
+        if self._records.pop(key, None) is not None:
+            self._writer.submit({"op": "delete", "key": key})
+
+    def _kept_data(self, key: str, record: dict) -> dict:
+        """Поля user_data, которые не удаляются вместе с черновиком"""
+        if not key.startswith("u:"):
+            return {}
+        return {field: record["data"][field] for field in self.kept if field in record["data"]}
+
+    def expire(self, now: float = None) -> int:
+        """Удаляет черновики, не менявшиеся дольше ttl; возвращает число удаленных или урезанных записей.
+
+        Из user_data устаревшего черновика остаются только поля kept.
+        """
+        now = time.time() if now is None else now
+        stale = []
+        for key, record in self._records.items():
+            if now - record["ts"] <= self.ttl:
+                continue
+            kept = self._kept_data(key, record)
+            if kept != record.get("data"):
+                stale.append((key, kept))
+        for key, kept in stale:
+            if kept:
+                self._put(key, {"user_id": self._records[key]["user_id"], "data": kept})
+            else:
+                self._delete(key)
+        if stale:
+            logger.info("Удалено устаревших черновиков: %s", len(stale))
+        self._next_expire_check = time.monotonic() + EXPIRE_CHECK_INTERVAL
+        return len(stale)
+
+    def _maybe_expire(self):
+        if time.monotonic() >= self._next_expire_check:
+            self.expire()
+
+    # ==================== ЧТЕНИЕ ====================
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {
+            record["user_id"]: dict(record["data"])
+            for key, record in self._records.items()
+            if key.startswith("u:")
+        }
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[tuple]:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        prefix = f"c:{name}:"
+        return {
+            tuple(record["key"]): record["state"]
+            for key, record in self._records.items()
+            if key.startswith(prefix)
+        }
+
+    # ==================== ЗАПИСЬ ====================
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        record_key = _conversation_key(name, key)
+        if new_state is None:
+            self._delete(record_key)
+        else:
+            record = self._records.get(record_key)
+            if record is None or record["state"] != new_state:
+                self._put(record_key, {"key": list(key), "state": new_state})
+        self._maybe_expire()
+
+    async def update_user_data(self, user_id: int, data: dict):
+        record_key = _user_key(user_id)
+        if not data:
+            self._delete(record_key)
+        else:
+            record = self._records.get(record_key)
+            if record is None or record["data"] != data:
+                self._put(record_key, {"user_id": user_id, "data": dict(data)})
+        self._maybe_expire()
+
+    async def drop_user_data(self, user_id: int):
+        self._delete(_user_key(user_id))
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data: tuple):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Вызывается при остановке приложения: дописывает журнал и останавливает поток записи"""
+        await asyncio.to_thread(self.close)
+
+    def close(self):
+        self._writer.close()
+        self.storage.close()
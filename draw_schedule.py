@@ -0,0 +1,104 @@
+"""Запланированная жеребьевка мероприятия: время, закрытие регистрации и подготовленные сообщения.
+
+Подготовка идет заранее (за DRAW_PREPARE_AHEAD в book_bot): регистрация
+закрывается, пары подбираются и сохраняются, сообщения с результатами
+отрисовываются. В назначенное время остается только разослать их.
+Время, стадия и draw_id хранятся в файле мероприятия и переживают перезапуск;
+сами сообщения — только в памяти (после перезапуска отрисовываются заново по
+сохраненным парам). draw_id записывается перед тем, как сообщения попадут в
+outbox: если outbox уже содержит эту жеребьевку, рассылку продолжает
+resume_delivery, и запланированная рассылка не повторяется.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from broadcast import BroadcastMessage
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Стадии запланированной жеребьевки
+SCHEDULED = "scheduled"  # время назначено, регистрация открыта
+FROZEN = "frozen"  # регистрация закрыта, идет подготовка
+PREPARED = "prepared"  # пары сохранены, сообщения готовы к рассылке
+
+
+class DrawSchedule:
+    """Состояние запланированной жеребьевки одного мероприятия (файл JSON)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.at: Optional[float] = None  # Время рассылки, unix time
+        self.stage: Optional[str] = None
+        # Жеребьевка в outbox, начатая этой рассылкой
+        self.draw_id: Optional[str] = None
+        self.messages: Optional[List[BroadcastMessage]] = None
+        # Замеры подготовки: {"match": сек, "render": сек, ...}
+        self.timings: Dict[str, float] = {}
+        self.load()
+
+    @property
+    def active(self) -> bool:
+        return self.at is not None
+
+    @property
+    def frozen(self) -> bool:
+        """Регистрация закрыта до рассылки"""
+        return self.stage in (FROZEN, PREPARED)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.at = data.get("at")
+            self.stage = data.get("stage")
+            self.draw_id = data.get("draw_id")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Не удалось прочитать расписание жеребьевки %s: %s", self.path, e)
+
+    def save(self):
+        atomic_write_json(self.path, {"at": self.at, "stage": self.stage, "draw_id": self.draw_id})
+
+    def set(self, at: float):
+        """Назначает (или переносит) жеребьевку; подготовленное ранее сбрасывается"""
+        self.at = at
+        self.stage = SCHEDULED
+        self.draw_id = None
+        self.messages = None
+        self.timings = {}
+        self.save()
+
+    def advance(self, stage: str):
+        self.stage = stage
+        self.save()
+
+    def start_sending(self, draw_id: str):
+        """Запоминает draw_id до записи сообщений в outbox"""
+        self.draw_id = draw_id
+        self.save()
+
+    def clear(self):
+        """Снимает расписание и открывает регистрацию"""
+        self.at = None
+        self.stage = None
+        self.draw_id = None
+        self.messages = None
+        self.timings = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def describe(self) -> str:
+        if not self.active:
+            return "Жеребьевка не запланирована"
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.at))
+        stage = {
+            SCHEDULED: "регистрация открыта",
+            FROZEN: "регистрация закрыта, идет подготовка",
+            PREPARED: "пары подобраны, сообщения готовы",
+        }.get(self.stage, self.stage)
+        return f"Жеребьевка запланирована на {when}: {stage}"
@@ -0,0 +1,152 @@
+"""Мероприятия (клубы, сезоны): у каждого свои участники, жеребьевка и /list.
+
+Данные мероприятия загружаются при первом обращении и выгружаются из памяти,
+если к нему долго не обращались, поэтому память растет с числом активных
+мероприятий, а не со всей историей.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from book_index import BookIndex
+from rendering import CardCache, ListPageCache
+
+logger = logging.getLogger(__name__)
+
+# Мероприятие по умолчанию: данные лежат там же, где до появления мероприятий
+DEFAULT_EVENT = "default"
+
+# Через сколько секунд без обращений мероприятие выгружается из памяти
+EVENT_IDLE_TIMEOUT = 30 * 60
+
+# Как часто (сек) проверять мероприятия на простой
+EVICT_INTERVAL = 60
+
+# Имя мероприятия попадает в ссылку t.me/<bot>?start=<event> и в callback_data кнопок
+EVENT_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def is_valid_event_name(name: str) -> bool:
+    """Проверяет, что имя мероприятия подходит для ссылки и имени каталога"""
+    return bool(name) and EVENT_NAME_RE.match(name) is not None
+
+
+class Event:
+    """Раздел данных одного мероприятия: участники, очередь доставки, расписание жеребьевки,
+    кэши отрисовки и индекс книг"""
+
+    def __init__(self, name: str, bot_data, outbox, exclusions_file: str, schedule):
+        self.name = name
+        self.bot_data = bot_data
+        self.outbox = outbox
+        self.exclusions_file = exclusions_file
+        self.schedule = schedule
+        self.card_cache = CardCache()
+        self.list_pages = ListPageCache()
+        bot_data.subscribe(self.card_cache.on_change)
+        bot_data.subscribe(self.list_pages.on_change)
+        self.book_index = BookIndex(bot_data.iter_participant_chunks)
+        bot_data.subscribe(self.book_index.on_change)
+        self.last_used = time.monotonic()
+        self._in_use = 0
+        # Фоновая рассылка результатов жеребьевки (одна за раз)
+        self.delivery: Optional[asyncio.Task] = None
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        """Идет долгая операция (рассылка, выгрузка), выгружать нельзя"""
+        return self._in_use > 0
+
+    @property
+    def delivering(self) -> bool:
+        """Идет рассылка результатов: новую жеребьевку и повторную отправку начинать нельзя"""
+        return self.delivery is not None and not self.delivery.done()
+
+    @contextmanager
+    def in_use(self):
+        """Не дает выгрузить мероприятие, пока идет долгая операция"""
+        self._in_use += 1
+        try:
+            yield self
+        finally:
+            self._in_use -= 1
+            self.touch()
+
+    def close(self):
+        """Записывает оставшиеся изменения и закрывает файлы мероприятия"""
+        self.outbox.close()
+        self.bot_data.close()
+
+
+class EventRegistry:
+    """Загруженные мероприятия: загрузка по требованию и выгрузка простаивающих"""
+
+    def __init__(self, factory: Callable[[str], Event], idle_timeout: float = EVENT_IDLE_TIMEOUT):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self._events: Dict[str, Event] = {}
+        self._lock = threading.Lock()
+        self._eviction: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> List[str]:
+        """Имена мероприятий, загруженных в память"""
+        with self._lock:
+            return list(self._events)
+
+    def get(self, name: str = DEFAULT_EVENT) -> Event:
+        """Возвращает мероприятие, загружая его при первом обращении"""
+        with self._lock:
+            event = self._events.get(name)
+            if event is None:
+                event = self._events[name] = self.factory(name)
+                logger.info("Загружено мероприятие %s: участников %s", name, event.bot_data.count_participants())
+            event.touch()
+            return event
+
+    def evict_idle(self, now: float = None) -> List[str]:
+        """Выгружает мероприятия без обращений дольше idle_timeout; возвращает их имена"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [
+                name for name, event in self._events.items()
+                if not event.busy and now - event.last_used > self.idle_timeout
+            ]
+            evicted = [self._events.pop(name) for name in idle]
+        for event in evicted:
+            event.close()
+            logger.info("Мероприятие %s выгружено из памяти", event.name)
+        return idle
+
+    async def _run_eviction(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.evict_idle)
+            except Exception as e:
+                logger.error("Ошибка при выгрузке мероприятий: %s", e)
+
+    def start_eviction(self, interval: float = EVICT_INTERVAL):
+        """Запускает фоновую выгрузку простаивающих мероприятий (в работающем event loop)"""
+        if self._eviction is None:
+            self._eviction = asyncio.get_running_loop().create_task(self._run_eviction(interval))
+
+    def stop_eviction(self):
+        """Останавливает фоновую выгрузку"""
+        if self._eviction is not None:
+            self._eviction.cancel()
+            self._eviction = None
+
+    def close(self):
+        """Выгружает все мероприятия, записывая оставшиеся изменения"""
+        with self._lock:
+            events, self._events = list(self._events.values()), {}
+        for event in events:
+            event.close()
@@ -0,0 +1,83 @@
+"""Потоковая выгрузка участников и пар жеребьевки в CSV или JSON Lines"""
+import csv
+import json
+import os
+import tempfile
+from typing import Callable, IO, Iterable, List, Optional
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+EXPORT_FIELDS = (
+    "user_id",
+    "username",
+    "name",
+    "desired_book",
+    "comment",
+    "assigned_to",
+    "assigned_to_name",
+    "assigned_to_username",
+)
+
+
+def export_row(participant, resolve: Callable[[int], Optional[object]]) -> dict:
+    """Строка выгрузки: участник и тот, кому он дарит (с именем)"""
+    receiver = resolve(participant.assigned_to) if participant.assigned_to else None
+    return {
+        "user_id": participant.user_id,
+        "username": participant.username,
+        "name": participant.name,
+        "desired_book": participant.desired_book,
+        "comment": participant.comment,
+        "assigned_to": participant.assigned_to,
+        "assigned_to_name": receiver.name if receiver else None,
+        "assigned_to_username": receiver.username if receiver else None,
+    }
+
+
+class ExportWriter:
+    """Пишет строки выгрузки во временный файл порциями, не держа весь текст в памяти"""
+
+    def __init__(self, fmt: str = "csv"):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+        self.fmt = fmt
+        self.rows = 0
+        # utf-8-sig, чтобы Excel правильно открыл кириллицу в CSV
+        encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+        handle, self.path = tempfile.mkstemp(prefix="participants_", suffix=f".{fmt}")
+        self._file: IO[str] = os.fdopen(handle, "w", encoding=encoding, newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+            self._csv.writeheader()
+
+    @property
+    def filename(self) -> str:
+        return f"participants.{self.fmt}"
+
+    def write_rows(self, rows: Iterable[dict]):
+        """Дописывает порцию строк"""
+        if self._csv is not None:
+            for row in rows:
+                self._csv.writerow(row)
+                self.rows += 1
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self.rows += 1
+
+    def close(self):
+        """Закрывает файл (сам файл остается до remove)"""
+        self._file.close()
+
+    def remove(self):
+        """Удаляет временный файл"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def rows_for_chunk(chunk: List[object], resolve: Callable[[int], Optional[object]]) -> List[dict]:
+    """Строки выгрузки для порции участников"""
+    return [export_row(participant, resolve) for participant in chunk]
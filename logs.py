@@ -0,0 +1,180 @@
+"""Логирование без блокировки event loop: очередь, запись в фоновом потоке, JSON-строки.
+
+Обработчик в event loop только кладет запись в ограниченную очередь
+(QueueHandler), а форматирование и запись в поток вывода делает поток
+QueueListener. Сообщение форматируется там же, поэтому аргументы логгера
+передаются в стиле logger.error("... %s", e), а не f-строкой. К записи
+добавляются update_id, user_id и handler текущего обновления.
+
+Одинаковые предупреждения и ошибки (тот же логгер, шаблон сообщения и тип
+исключения) пишутся не больше repeat_limit раз за repeat_window секунд,
+остальные только считаются; число пропущенных попадает в поле suppressed
+следующей записанной. При переполнении очереди записи отбрасываются, а не
+задерживают бота.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from metrics import CURRENT_HANDLER, LOG_DROPPED, LOG_QUEUE, LOG_SUPPRESSED
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_FORMATS = ("json", "text")
+
+# Поля контекста обновления в записи
+CONTEXT_FIELDS = ("update_id", "user_id", "handler")
+
+# Сколько разных повторяющихся ошибок помнить (больше — значит, ключи не повторяются)
+MAX_REPEAT_KEYS = 1024
+
+# (update_id, user_id) обновления, которое обрабатывает текущая задача
+_update: ContextVar[Tuple[Optional[int], Optional[int]]] = ContextVar("log_update", default=(None, None))
+
+_listener: Optional[QueueListener] = None
+
+
+def bind_update(update) -> None:
+    """Связывает последующие записи задачи с обновлением (вызывается первым обработчиком)"""
+    user = getattr(update, "effective_user", None)
+    _update.set((getattr(update, "update_id", None), user.id if user else None))
+    CURRENT_HANDLER.set(None)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи update_id, user_id и handler (в потоке, который пишет в лог)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id, record.user_id = _update.get()
+        record.handler = CURRENT_HANDLER.get()
+        return True
+
+
+class RepeatFilter(logging.Filter):
+    """Пропускает не больше limit одинаковых предупреждений и ошибок за window секунд"""
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # ключ -> [начало окна, записано, пропущено]
+        self._seen: Dict[tuple, List] = {}
+        # Фильтр вызывается в потоке, который пишет запись: в event loop, в потоке записи данных, в to_thread
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> tuple:
+        # Шаблон, а не готовый текст: ошибки разных пользователей — одна и та же ошибка
+        errors = tuple(type(arg).__name__ for arg in record.args or () if isinstance(arg, BaseException))
+        if record.exc_info and record.exc_info[0] is not None:
+            errors += (record.exc_info[0].__name__,)
+        return record.name, record.levelno, record.msg, errors
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.limit <= 0:
+            return True
+        key = self._key(record)
+        with self._lock:
+            now = time.monotonic()
+            state = self._seen.get(key)
+            if state is None:
+                if len(self._seen) >= MAX_REPEAT_KEYS:
+                    self._seen.clear()
+                state = self._seen[key] = [now, 0, 0]
+            elif now - state[0] >= self.window:
+                if state[2]:
+                    record.suppressed = state[2]
+                state[:] = [now, 0, 0]
+            if state[1] >= self.limit:
+                state[2] += 1
+                suppressed = True
+            else:
+                state[1] += 1
+                suppressed = False
+        if suppressed:
+            LOG_SUPPRESSED.inc()
+            return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись одной строкой JSON: ts, level, logger, message, поля контекста, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке и без ожидания места в очереди"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение соберет поток записи (QueueHandler.prepare форматирует его здесь)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+def setup_logging(level: int = logging.INFO, log_format: str = "json", queue_size: int = 10_000,
+                  repeat_limit: int = 5, repeat_window: float = 60, stream: TextIO = None) -> QueueListener:
+    """Настраивает корневой логгер на запись через очередь и запускает поток записи"""
+    global _listener
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Неизвестный формат логов: {log_format}")
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    records = queue.Queue(queue_size)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(RepeatFilter(repeat_limit, repeat_window))
+    handler.addFilter(ContextFilter())
+    LOG_QUEUE.set_function(records.qsize)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    _listener = QueueListener(records, output)
+    _listener.start()
+    # Дописывает оставшиеся в очереди записи при выходе
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Останавливает поток записи, предварительно записав очередь"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
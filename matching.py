@@ -0,0 +1,204 @@
+"""Распределение пар для жеребьевки с учетом запретов (пары, команды, прошлые назначения)"""
+import json
+import logging
+import os
+import random
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Сколько попыток исправления делать на одного участника до перезапуска
+REPAIR_TRIES_PER_PARTICIPANT = 50
+# Сколько раз начинать заново с новым перемешиванием
+MAX_RESTARTS = 5
+# Доля участников в одной группе, начиная с которой кольцо сразу строится с чередованием групп
+LARGE_GROUP_SHARE = 0.4
+
+
+class MatchingError(Exception):
+    """Пары распределить невозможно; текст исключения объясняет почему"""
+
+
+class Exclusions:
+    """Граф запретов: кому участник не может дарить"""
+
+    def __init__(self):
+        self.forbidden: Dict[int, Set[int]] = defaultdict(set)
+        # Группы хранятся отдельно: по ним проверяется выполнимость и строится запасное кольцо
+        self.groups: List[List[int]] = []
+
+    def forbid(self, giver_id: int, receiver_id: int):
+        """Запрещает giver_id дарить receiver_id"""
+        self.forbidden[giver_id].add(receiver_id)
+
+    def forbid_pair(self, first_id: int, second_id: int):
+        """Запрещает двум участникам дарить друг другу (например, супругам)"""
+        self.forbid(first_id, second_id)
+        self.forbid(second_id, first_id)
+
+    def forbid_group(self, member_ids: Iterable[int]):
+        """Запрещает участникам группы (команды) дарить друг другу"""
+        members = list(member_ids)
+        self.groups.append(members)
+        for giver_id in members:
+            for receiver_id in members:
+                if giver_id != receiver_id:
+                    self.forbid(giver_id, receiver_id)
+
+    def forbid_previous(self, assignments: Dict[int, Optional[int]]):
+        """Запрещает повторять прошлые назначения"""
+        for giver_id, receiver_id in assignments.items():
+            if receiver_id is not None:
+                self.forbid(giver_id, receiver_id)
+
+    def allowed(self, giver_id: int, receiver_id: int) -> bool:
+        return giver_id != receiver_id and receiver_id not in self.forbidden.get(giver_id, ())
+
+    @classmethod
+    def from_file(cls, path: str) -> "Exclusions":
+        """Загружает запреты из JSON.
+
+        {"pairs": [[a, b], ...], "groups": [[a, b, c], ...], "previous": [[giver, receiver], ...]}
+        previous - направленные запреты: giver не дарит receiver, например, как в прошлом году.
+        """
+        exclusions = cls()
+        if not os.path.exists(path):
+            return exclusions
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for first_id, second_id in data.get("pairs", []):
+            exclusions.forbid_pair(int(first_id), int(second_id))
+        for group in data.get("groups", []):
+            exclusions.forbid_group(int(member_id) for member_id in group)
+        for giver_id, receiver_id in data.get("previous", []):
+            exclusions.forbid(int(giver_id), int(receiver_id))
+        return exclusions
+
+
+def _check_feasible(ids: List[int], exclusions: Exclusions):
+    """Быстрые проверки, при которых распределение заведомо невозможно"""
+    n = len(ids)
+    if n < 2:
+        raise MatchingError(f"Недостаточно участников: {n}")
+    id_set = set(ids)
+    blocked_receivers: Dict[int, int] = defaultdict(int)
+    for giver_id in ids:
+        forbidden = exclusions.forbidden.get(giver_id, ())
+        forbidden_here = sum(1 for receiver_id in forbidden if receiver_id in id_set and receiver_id != giver_id)
+        if forbidden_here >= n - 1:
+            raise MatchingError(f"Участнику {giver_id} некому дарить: запрещены все остальные")
+        for receiver_id in forbidden:
+            if receiver_id in id_set and receiver_id != giver_id:
+                blocked_receivers[receiver_id] += 1
+    for receiver_id, count in blocked_receivers.items():
+        if count >= n - 1:
+            raise MatchingError(f"Участнику {receiver_id} никто не может дарить: запрещены все остальные")
+    # В кольце за каждым участником группы идет кто-то не из нее, и все они разные,
+    # поэтому группа может занимать не больше половины участников
+    for group in exclusions.groups:
+        size = len(id_set.intersection(group))
+        if 2 * size > n:
+            raise MatchingError(
+                f"Группа из {size} участников слишком велика: в ней может быть не больше "
+                f"половины всех участников ({n // 2} из {n})"
+            )
+
+
+def _repair_ring(ring: List[int], exclusions: Exclusions, rng: random.Random) -> bool:
+    """Исправляет запрещенные ребра в кольце обменом участников местами"""
+    n = len(ring)
+    allowed = exclusions.allowed
+
+    def edge_ok(i: int) -> bool:
+        return allowed(ring[i % n], ring[(i + 1) % n])
+
+    bad = [i for i in range(n) if not edge_ok(i)]
+    tries = REPAIR_TRIES_PER_PARTICIPANT * max(len(bad), 1) + n
+    while bad and tries > 0:
+        i = bad.pop()
+        if edge_ok(i):
+            continue
+        a = (i + 1) % n
+        while tries > 0:
+            tries -= 1
+            j = rng.randrange(n)
+            if j == a:
+                continue
+            ring[a], ring[j] = ring[j], ring[a]
+            # Обмен затрагивает только ребра вокруг позиций a и j
+            if all(edge_ok(k) for k in (a - 1, a, j - 1, j)):
+                break
+            ring[a], ring[j] = ring[j], ring[a]
+        else:
+            return False
+    return not bad
+
+
+def _interleave_groups(ids: List[int], exclusions: Exclusions, rng: random.Random) -> List[int]:
+    """Кольцо, в котором соседи из разных групп.
+
+    Участники выписываются группами от большей к меньшей (без группы - по
+    одному) и расставляются сначала на четные места кольца, затем на нечетные.
+    Если ни одна группа не больше половины, соседи всегда из разных групп.
+    """
+    group_of: Dict[int, int] = {}
+    for index, group in enumerate(exclusions.groups):
+        for member_id in group:
+            group_of.setdefault(member_id, index)
+    members: Dict[object, List[int]] = defaultdict(list)
+    for user_id in ids:
+        members[group_of.get(user_id, ("single", user_id))].append(user_id)
+    buckets = list(members.values())
+    for bucket in buckets:
+        rng.shuffle(bucket)
+    rng.shuffle(buckets)
+    buckets.sort(key=len, reverse=True)
+
+    order = [user_id for bucket in buckets for user_id in bucket]
+    n = len(order)
+    half = (n + 1) // 2
+    ring = [0] * n
+    ring[0::2] = order[:half]
+    ring[1::2] = order[half:]
+    return ring
+
+
+def match(ids: List[int], exclusions: Exclusions = None, seed: int = None) -> Dict[int, int]:
+    """Возвращает назначения giver_id -> receiver_id одним общим кольцом.
+
+    Никто не дарит сам себе и никому из своих запретов. Начинаем со случайного
+    кольца и точечно исправляем нарушения, поэтому при редких запретах время
+    почти линейно. Если группа занимает большую часть участников (например,
+    две команды пополам), случайное кольцо почти не исправляется - тогда
+    исправляется кольцо, в котором группы чередуются. Если решение не
+    найдено, выбрасывает MatchingError.
+    """
+    exclusions = exclusions or Exclusions()
+    ids = list(ids)
+    if len(set(ids)) != len(ids):
+        raise MatchingError("Повторяющиеся участники")
+    _check_feasible(ids, exclusions)
+
+    rng = random.Random(seed)
+    id_set = set(ids)
+    largest_group = max((len(id_set.intersection(group)) for group in exclusions.groups), default=0)
+    strategies = [False, True] if exclusions.groups else [False]
+    if largest_group > LARGE_GROUP_SHARE * len(ids):
+        strategies = [True]
+    for interleave in strategies:
+        for attempt in range(MAX_RESTARTS):
+            if interleave:
+                ring = _interleave_groups(ids, exclusions, rng)
+            else:
+                ring = ids.copy()
+                rng.shuffle(ring)
+            if _repair_ring(ring, exclusions, rng):
+                n = len(ring)
+                return {ring[i]: ring[(i + 1) % n] for i in range(n)}
+            logger.info("Жеребьевка: попытка %s не удалась, начинаем заново", attempt + 1)
+
+    raise MatchingError(
+        f"Не удалось распределить {len(ids)} участников с учетом запретов "
+        f"за {MAX_RESTARTS} попыток: запретов слишком много"
+    )
@@ -0,0 +1,340 @@
+"""Метрики бота в текстовом формате Prometheus: счетчики, гистограммы и HTTP-эндпоинт /metrics.
+
+Без внешних зависимостей. Запись метрики — это поиск корзины (bisect) и
+несколько сложений под неконкурентной блокировкой, поэтому метрики можно
+держать включенными в продакшене. Метрики пишут и event loop, и потоки
+записи данных, поэтому каждая метрика защищена своей блокировкой.
+"""
+import abc
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (сек), как в клиентах Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """Метрика с конкретными значениями меток (создается при первом обращении)"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Значение метрики для одного набора меток"""
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _GaugeValue:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение вычисляется функцией в момент чтения метрик"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Текущее значение (может расти и уменьшаться)"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception as e:
+                logger.warning("Не удалось вычислить метрику %s: %s", self.name, e)
+                continue
+            samples.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return samples
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Замеряет время выполнения блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (для задержек)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {count}")
+        return samples
+
+
+class Registry:
+    """Набор метрик для отдачи на /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ==================== МЕТРИКИ БОТА ====================
+HANDLER_SECONDS = histogram("bookbot_handler_seconds", "Время обработки обновления обработчиком", ["handler"])
+HANDLER_ERRORS = counter("bookbot_handler_errors_total", "Необработанные исключения в обработчиках", ["handler"])
+
+# lane: "interactive" (ответы пользователям) или "bulk" (рассылки, выгрузки)
+API_REQUESTS = counter("bookbot_telegram_requests_total", "Запросы к Bot API", ["lane", "method"])
+API_SECONDS = histogram("bookbot_telegram_request_seconds", "Время запроса к Bot API", ["lane", "method"])
+API_ERRORS = counter("bookbot_telegram_errors_total", "Ошибки запросов к Bot API", ["lane", "method", "error"])
+API_BULK_DEFERRED = counter(
+    "bookbot_telegram_bulk_deferred_total", "Массовые запросы, пропустившие вперед интерактивные"
+)
+
+STORAGE_SECONDS = histogram("bookbot_storage_seconds", "Время операций хранилища", ["store", "op"])
+STORAGE_BYTES = counter("bookbot_storage_bytes_total", "Прочитано и записано байт хранилищем", ["store", "op"])
+
+BROADCAST_MESSAGES = counter("bookbot_broadcast_messages_total", "Сообщения рассылок по итогу доставки", ["state"])
+BROADCAST_RETRIES = counter("bookbot_broadcast_retries_total", "Повторные попытки отправки в рассылках")
+BROADCAST_SECONDS = histogram(
+    "bookbot_broadcast_seconds", "Длительность рассылки", buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+BROADCAST_RATE = gauge("bookbot_broadcast_last_rate", "Скорость последней рассылки, сообщений/сек")
+
+EVENTS_LOADED = gauge("bookbot_events_loaded", "Мероприятия, загруженные в память")
+
+THROTTLED_UPDATES = counter("bookbot_throttled_updates_total", "Отброшенные ограничением частоты обновления", ["reason"])
+THROTTLE_EVICTIONS = counter(
+    "bookbot_throttle_evictions_total", "Пользователи, удаленные из учета ограничения частоты", ["reason"]
+)
+THROTTLE_USERS = gauge("bookbot_throttle_tracked_users", "Пользователи в учете ограничения частоты")
+
+LOG_QUEUE = gauge("bookbot_log_queue_records", "Записи логов, ожидающие записи")
+LOG_DROPPED = counter("bookbot_log_dropped_total", "Записи логов, отброшенные при переполнении очереди")
+LOG_SUPPRESSED = counter("bookbot_log_suppressed_total", "Повторяющиеся ошибки, не записанные в лог")
+
+# Обработчик текущего обновления (поле handler в логах); у каждого обновления своя задача и свой контекст
+CURRENT_HANDLER: ContextVar[Optional[str]] = ContextVar("current_handler", default=None)
+
+
+def timed(callback: Callable) -> Callable:
+    """Оборачивает обработчик обновлений: гистограмма времени и счетчик исключений по имени функции"""
+    name = callback.__name__
+    seconds = HANDLER_SECONDS.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        # Не сбрасывается после выхода: error_handler тоже пишет в лог имя обработчика
+        CURRENT_HANDLER.set(name)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер, отдающий REGISTRY на GET /metrics"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Метрики доступны на http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?", 1)[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,125 @@
+"""Журнал доставки результатов жеребьевки: какие сообщения отправлены, а какие нет"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from broadcast import BroadcastMessage, DELIVERY_BLOCKED, DELIVERY_FAILED, DELIVERY_PENDING, DELIVERY_SENT
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_STATES = (DELIVERY_PENDING, DELIVERY_SENT, DELIVERY_FAILED, DELIVERY_BLOCKED)
+
+
+class Outbox:
+    """Постоянная очередь сообщений одной жеребьевки с состоянием доставки по каждому участнику.
+
+    Файл в формате JSON Lines: заголовок жеребьевки, затем все сообщения
+    (изначально pending), затем дописываемые изменения состояния с draw_id
+    своей жеребьевки. После перезапуска бот досылает сообщения, оставшиеся
+    в pending.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.draw_id: Optional[str] = None
+        self.messages: Dict[int, BroadcastMessage] = {}
+        self.states: Dict[int, str] = {}
+        self._file = None
+        self.load()
+
+    def load(self):
+        """Восстанавливает очередь из файла"""
+        self.draw_id = None
+        self.messages.clear()
+        self.states.clear()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Пропущена повреждённая запись в %s", self.path)
+                    continue
+                kind = record.get("op")
+                if kind == "draw":
+                    self.draw_id = record["draw_id"]
+                elif kind == "message":
+                    message = BroadcastMessage(
+                        chat_id=record["chat_id"],
+                        text=record["text"],
+                        parse_mode=record.get("parse_mode"),
+                        fallback_text=record.get("fallback_text")
+                    )
+                    self.messages[message.chat_id] = message
+                    self.states[message.chat_id] = DELIVERY_PENDING
+                elif kind == "state" and record["chat_id"] in self.states:
+                    if record.get("draw_id", self.draw_id) != self.draw_id:
+                        continue
+                    self.states[record["chat_id"]] = record["state"]
+
+    def start_draw(self, draw_id: str, messages: List[BroadcastMessage]):
+        """Записывает новую жеребьевку целиком (атомарно) вместо предыдущей"""
+        self.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"op": "draw", "draw_id": draw_id}) + "\n")
+            for message in messages:
+                f.write(json.dumps({
+                    "op": "message",
+                    "chat_id": message.chat_id,
+                    "text": message.text,
+                    "parse_mode": message.parse_mode,
+                    "fallback_text": message.fallback_text
+                }, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.draw_id = draw_id
+        self.messages = {message.chat_id: message for message in messages}
+        self.states = {message.chat_id: DELIVERY_PENDING for message in messages}
+
+    def mark(self, chat_id: int, state: str, draw_id: str = None):
+        """Дописывает новое состояние доставки участнику.
+        
+        draw_id — жеребьевка, которую рассылал отправитель; состояние от
+        рассылки уже замененной жеребьевки не записывается.
+        """
+        if draw_id is not None and draw_id != self.draw_id:
+            logger.warning("Пропущено состояние доставки жеребьевки %s: текущая %s", draw_id, self.draw_id)
+            return
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps({
+            "op": "state", "draw_id": self.draw_id, "chat_id": chat_id, "state": state
+        }) + "\n")
+        self._file.flush()
+        self.states[chat_id] = state
+
+    def sync(self):
+        """Сбрасывает записанные состояния на диск"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def with_state(self, *states: str) -> List[BroadcastMessage]:
+        """Сообщения в указанных состояниях"""
+        return [self.messages[chat_id] for chat_id, state in self.states.items() if state in states]
+
+    def counts(self) -> Dict[str, int]:
+        """Число сообщений в каждом состоянии"""
+        counts = dict.fromkeys(DELIVERY_STATES, 0)
+        for state in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def close(self):
+        """Закрывает файл очереди"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
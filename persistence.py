@@ -0,0 +1,163 @@
+"""Фоновая запись данных: изменения копятся и сбрасываются в хранилище пачками в отдельном потоке"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from storage import JsonStorage, apply_op, copy_records
+
+logger = logging.getLogger(__name__)
+
+# Максимальная задержка (сек) между изменением и его записью на диск
+WRITE_MAX_DELAY = 0.5
+
+
+def _resolve(future: asyncio.Future, error: Exception = None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
+
+
+class PersistenceWriter:
+    """Поток записи, который объединяет серии изменений в одну запись.
+
+    Обработчики только ставят операцию в очередь (submit) и не ждут диска.
+    Поток ждёт до max_delay, собирая все изменения за это время, и передаёт
+    их хранилищу одной пачкой. Тем, кому нужна гарантия записи (например,
+    перед рассылкой итогов жеребьевки), достаточно `await writer.flushed()`.
+    """
+
+    def __init__(self, storage: JsonStorage, records: Optional[Dict[str, dict]],
+                 max_delay: float = WRITE_MAX_DELAY,
+                 apply: Callable[[Dict[str, dict], dict], None] = apply_op,
+                 name: str = "persistence-writer"):
+        self.storage = storage
+        # Теневая копия данных, которой владеет поток записи
+        # (None, если хранилище само применяет операции, как SQLite)
+        self.records = records
+        self.max_delay = max_delay
+        self.apply = apply
+        self._cond = threading.Condition()
+        self._queue: List[dict] = []
+        self._submitted = 0
+        self._flushed = 0
+        self._urgent = False
+        self._full_save = False
+        # Запрошенные и выполненные полные записи: flushed() ждет и их, а не только операции
+        self._saves_requested = 0
+        self._saves_done = 0
+        self._closed = False
+        self._waiters: List[Tuple[int, int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Число операций, еще не записанных на диск"""
+        with self._cond:
+            return self._submitted - self._flushed
+
+    def submit(self, op: dict):
+        """Ставит операцию в очередь на запись"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Поток записи уже остановлен")
+            self._queue.append(op)
+            self._submitted += 1
+            self._cond.notify()
+
+    def request_full_save(self):
+        """Просит поток записать полный снимок при ближайшем сбросе"""
+        with self._cond:
+            self._full_save = True
+            self._saves_requested += 1
+            self._urgent = True
+            self._cond.notify()
+
+    async def flushed(self):
+        """Дожидается записи на диск всех операций, поставленных до вызова"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            target, save_target = self._submitted, self._saves_requested
+            if self._flushed >= target and self._saves_done >= save_target:
+                return
+            self._waiters.append((target, save_target, loop, future))
+            self._urgent = True
+            self._cond.notify()
+        await future
+
+    def sync(self):
+        """Блокирующе дожидается записи всех операций (для CLI и остановки)"""
+        with self._cond:
+            target, save_target = self._submitted, self._saves_requested
+            self._urgent = True
+            self._cond.notify()
+            while (self._flushed < target or self._saves_done < save_target) and self._thread.is_alive():
+                self._cond.wait(0.1)
+
+    def close(self):
+        """Записывает все оставшиеся изменения и останавливает поток"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _snapshot(self) -> Dict[str, dict]:
+        if self.records is None:
+            return None
+        return copy_records(self.records)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._full_save and not self._closed:
+                    self._cond.wait()
+                if not self._queue and not self._full_save and self._closed:
+                    break
+                # Собираем изменения, пока не истечет задержка или кто-то не ждет записи
+                deadline = time.monotonic() + self.max_delay
+                while not self._urgent and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._queue = self._queue, []
+                full_save, self._full_save = self._full_save, False
+                save_target = self._saves_requested
+
+            error = self._write(batch, full_save)
+
+            with self._cond:
+                self._flushed += len(batch)
+                if full_save:
+                    self._saves_done = save_target
+                done = [w for w in self._waiters if w[0] <= self._flushed and w[1] <= self._saves_done]
+                self._waiters = [w for w in self._waiters if w not in done]
+                if not self._waiters:
+                    self._urgent = False
+                self._cond.notify_all()
+
+            for _, _, loop, future in done:
+                loop.call_soon_threadsafe(_resolve, future, error)
+
+    def _write(self, batch: List[dict], full_save: bool) -> Exception:
+        if self.records is not None:
+            for op in batch:
+                self.apply(self.records, op)
+        try:
+            if full_save:
+                self.storage.save(self._snapshot())
+            elif batch:
+                self.storage.commit(batch, self._snapshot)
+            return None
+        except Exception as e:
+            logger.error("Ошибка записи данных: %s", e)
+            # Данные остались в теневой копии: при следующем сбросе пишем полный снимок
+            with self._cond:
+                self._full_save = True
+            return e
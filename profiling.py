@@ -0,0 +1,154 @@
+"""Профилирование работающего бота по команде: cProfile и выборка стеков event loop.
+
+Пока профилирование выключено, его стоимость — одна проверка атрибута на
+обновление (UpdateProfiler.update_seen). Включенное профилирование на
+заданное время или число обновлений:
+    - cProfile в потоке event loop: топ функций по собственному и общему времени;
+    - поток-сэмплер раз в sample_interval секунд снимает стек потока event loop
+      и копит его в формате collapsed stacks (flamegraph.pl, speedscope).
+Результат — zip-архив: profile.txt (топ функций), stacks.collapsed и
+profile.prof (сырые данные pstats для snakeviz).
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from typing import Optional
+
+# Строк в топе функций
+TOP_FUNCTIONS = 50
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _StackSampler(threading.Thread):
+    """Периодически снимает стек указанного потока и считает одинаковые стеки"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileResult:
+    """Итог одного профилирования"""
+
+    def __init__(self, profile: cProfile.Profile, sampler: _StackSampler, seconds: float, updates: int):
+        self.profile = profile
+        self.sampler = sampler
+        self.seconds = seconds
+        self.updates = updates
+
+    def summary(self) -> str:
+        return f"{self.seconds:.1f} сек, обновлений: {self.updates}, снимков стека: {self.sampler.samples}"
+
+    def to_zip(self) -> bytes:
+        """Архив с топом функций, collapsed stacks и сырыми данными pstats"""
+        text = io.StringIO()
+        text.write(f"Профилирование: {self.summary()}\n\n")
+        stats = pstats.Stats(self.profile, stream=text)
+        stats.strip_dirs()
+        for order in ("tottime", "cumulative"):
+            text.write(f"==== по {order} ====\n")
+            stats.sort_stats(order).print_stats(TOP_FUNCTIONS)
+
+        raw = io.BytesIO()
+        with zipfile.ZipFile(raw, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("profile.txt", text.getvalue())
+            archive.writestr("stacks.collapsed", self.sampler.collapsed())
+            # marshal-данные pstats, как у Stats.dump_stats
+            self.profile.create_stats()
+            archive.writestr("profile.prof", marshal.dumps(self.profile.stats))
+        return raw.getvalue()
+
+
+class UpdateProfiler:
+    """Одно профилирование за раз на seconds секунд или до updates обновлений.
+
+    start и collect вызываются из event loop: cProfile профилирует только
+    поток, в котором включен.
+    """
+
+    def __init__(self, sample_interval: float = 0.005):
+        self.sample_interval = sample_interval
+        self.active = False
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+        self._done: Optional[asyncio.Event] = None
+        self._updates_limit = 0
+        self._updates = 0
+        self._started = 0.0
+
+    def update_seen(self):
+        """Вызывается на каждое обновление; без профилирования ничего не делает"""
+        if not self.active:
+            return
+        self._updates += 1
+        if self._updates_limit and self._updates >= self._updates_limit:
+            self._done.set()
+
+    def start(self, updates: int = 0):
+        """Включает профилирование; updates — остановиться после стольких обновлений"""
+        if self.active:
+            raise RuntimeError("Профилирование уже идет")
+        profile = cProfile.Profile()
+        # ValueError, если в процессе уже работает другой профилировщик
+        profile.enable()
+        self._profile = profile
+        self._sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+        self._sampler.start()
+        self._done = asyncio.Event()
+        self._updates_limit = updates
+        self._updates = 0
+        self._started = time.perf_counter()
+        self.active = True
+
+    async def collect(self, seconds: float) -> ProfileResult:
+        """Ждет seconds секунд или заданного в start числа обновлений (что раньше) и выключает профилирование"""
+        try:
+            await asyncio.wait_for(self._done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            result = self.finish()
+        return result
+
+    def finish(self) -> ProfileResult:
+        self._profile.disable()
+        self._sampler.stop()
+        self.active = False
+        result = ProfileResult(self._profile, self._sampler, time.perf_counter() - self._started, self._updates)
+        self._profile = self._sampler = self._done = None
+        return result
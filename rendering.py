@@ -0,0 +1,256 @@
+"""Отрисовка карточек участников: экранирование MarkdownV2 за один проход, проверка разметки и кэш"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Ограничение Telegram на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+# Участников на одной странице /list
+LIST_PAGE_SIZE = 10
+
+MARKDOWN_V2 = "MarkdownV2"
+
+_SPECIAL_CHARS = "_*[]()~`>#+-=|{}.!\\"
+_SPECIAL_RE = re.compile("[" + re.escape(_SPECIAL_CHARS) + "]")
+
+
+def _escape_match(match: "re.Match") -> str:
+    return "\\" + match.group()
+
+
+def escape_markdown(text: str) -> str:
+    """Экранирует спецсимволы MarkdownV2 за один проход"""
+    if not text:
+        return ""
+    return _SPECIAL_RE.sub(_escape_match, text)
+
+
+def is_valid_markdown(text: str) -> bool:
+    """Проверяет MarkdownV2 до отправки: все спецсимволы экранированы, сущности закрыты, длина в лимите"""
+    if len(text) > MAX_MESSAGE_LENGTH:
+        return False
+    opened = []
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char == "\\":
+            if i + 1 >= n:
+                return False
+            i += 2
+            continue
+        marker = None
+        if char in "*~`":
+            marker = char
+        elif char == "_":
+            marker = "__" if text.startswith("__", i) else "_"
+        elif char == "|" and text.startswith("||", i):
+            marker = "||"
+        elif char in _SPECIAL_CHARS:
+            return False
+        if marker:
+            if opened and opened[-1] == marker:
+                opened.pop()
+            elif marker in opened:
+                return False
+            else:
+                opened.append(marker)
+            i += len(marker)
+            continue
+        i += 1
+    return not opened
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        return text
+    return text[:MAX_MESSAGE_LENGTH - 1] + "…"
+
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    text: str
+    parse_mode: Optional[str] = None
+
+
+def _choose(markdown_text: str, plain_text: str) -> RenderedMessage:
+    """Берет MarkdownV2, если он укладывается в лимит, иначе обычный текст.
+
+    Шаблоны проверяются is_valid_markdown при импорте модуля (см. ниже), а поля
+    экранируются escape_markdown, поэтому разметку каждого сообщения повторно
+    разбирать не нужно.
+    """
+    if len(markdown_text) <= MAX_MESSAGE_LENGTH:
+        return RenderedMessage(markdown_text, MARKDOWN_V2)
+    return RenderedMessage(_truncate(plain_text))
+
+
+def render_summary(name: str, book: str, comment: str) -> RenderedMessage:
+    """Сводка данных перед отправкой /send"""
+    markdown_text = (
+        "📋 *Сіздің деректеріңіз:*\n\n"
+        f"👤 *Есіміңіз:* {escape_markdown(name)}\n"
+        f"📚 *Сіз қалайтын кітап:* {escape_markdown(book)}\n"
+        f"💬 *Пікіріңіз:* {escape_markdown(comment)}\n\n"
+        "Деректерді жіберу үшін */send* батырмасын басыңыз\\."
+    )
+    plain_text = (
+        "📋 Сіздің деректеріңіз:\n\n"
+        f"👤 Есіміңіз: {name}\n"
+        f"📚 Сіз қалайтын кітап: {book}\n"
+        f"💬 Пікіріңіз: {comment}\n\n"
+        "Деректерді жіберу үшін /send батырмасын басыңыз."
+    )
+    return _choose(markdown_text, plain_text)
+
+
+def render_lottery_result(receiver, repeat: bool = False) -> RenderedMessage:
+    """Сообщение дарителю: кому он дарит и какую книгу тот хочет"""
+    name = escape_markdown(receiver.name)
+    book = escape_markdown(receiver.desired_book)
+    if repeat:
+        markdown_text = (
+            "🔄 *Жеребе қайтадан өткізілді\\!*\n\n"
+            f"Сізге келесі оқырман түсті: *{name}*\n\n"
+            "📖 *Оқырман қалайтын келетін кітап:*\n"
+            f"_{book}_\n\n"
+        )
+        plain_text = (
+            "🔄 Жеребе қайтадан өткізілді!\n\n"
+            f"Сізге келесі оқырман түсті: {receiver.name}\n\n"
+            "📖 Оқырман қалайтын келетін кітап:\n"
+            f"{receiver.desired_book}\n\n"
+        )
+        comment_title = "Пікірі:"
+    else:
+        markdown_text = (
+            "🎲 *Жеребе нәтижесі\\!*\n\n"
+            f"Сізге осы оқырман түсті *{name}*\n\n"
+            "📖 *Оқырман қалайтын кітап:*\n"
+            f"_{book}_\n\n"
+        )
+        plain_text = (
+            "🎲 Жеребе нәтижесі!\n\n"
+            f"Сізге осы оқырман түсті: {receiver.name}\n\n"
+            "📖 Ол алғысы келетін кітап:\n"
+            f"{receiver.desired_book}\n\n"
+        )
+        comment_title = "Пікір:"
+    if receiver.comment:
+        markdown_text += f"💬 *{comment_title}*\n_{escape_markdown(receiver.comment)}_"
+        plain_text += f"💬 {comment_title}\n{receiver.comment}"
+    return _choose(markdown_text, plain_text)
+
+
+def render_list_entry(index: int, participant, receiver_name: Optional[str] = None) -> str:
+    """Строка участника для /list (обычный текст, без разметки)"""
+    assigned_info = f" → 🎁 сыйлайды: {receiver_name}" if receiver_name else ""
+    return (
+        f"{index}. {participant.name} (@{participant.username or 'нет'})"
+        f"{assigned_info}\n"
+        f"   📖: {participant.desired_book}\n"
+    )
+
+
+def render_list_page(entries: List[str], page: int, pages: int, total: int) -> str:
+    """Страница /list: заголовок и строки участников, в пределах лимита Telegram"""
+    header = f"📋 Қатысушылар тізімі ({total}), бет {page + 1}/{pages}:\n"
+    return _truncate("\n".join([header] + entries))
+
+
+def render_search_results(query: str, results: List[Tuple[str, List[str], int]]) -> str:
+    """Ответ /search: книги и имена участников, которые их хотят (обычный текст)"""
+    if not results:
+        return f"🔎 «{query}»: ничего не найдено"
+    lines = [f"🔎 «{query}»:"]
+    for title, names, count in results:
+        more = f" и еще {count - len(names)}" if count > len(names) else ""
+        lines.append(f"\n📖 {title} ({count}):\n   {', '.join(names)}{more}")
+    return _truncate("\n".join(lines))
+
+
+def render_top_books(top: List[Tuple[str, int]], titles: int) -> str:
+    """Ответ /topbooks: самые запрашиваемые книги (обычный текст)"""
+    lines = [f"📚 Самые желанные книги (всего разных: {titles}):\n"]
+    lines += [f"{i}. {title} — {count}" for i, (title, count) in enumerate(top, 1)]
+    return _truncate("\n".join(lines))
+
+
+def _check_templates():
+    """Проверяет разметку шаблонов на данных со всеми спецсимволами"""
+    class Sample:
+        user_id = 0
+        name = desired_book = comment = _SPECIAL_CHARS
+
+    samples = [
+        render_summary(_SPECIAL_CHARS, _SPECIAL_CHARS, _SPECIAL_CHARS),
+        render_lottery_result(Sample, repeat=False),
+        render_lottery_result(Sample, repeat=True),
+    ]
+    for sample in samples:
+        if sample.parse_mode != MARKDOWN_V2 or not is_valid_markdown(sample.text):
+            raise ValueError(f"Некорректная разметка шаблона: {sample.text!r}")
+
+
+_check_templates()
+
+
+class CardCache:
+    """Кэш отрисованных карточек участников; сбрасывается при изменении участника"""
+
+    def __init__(self):
+        self._cards: Dict[int, Dict[str, RenderedMessage]] = {}
+
+    def lottery_result(self, receiver, repeat: bool = False) -> RenderedMessage:
+        """Карточка результата жеребьевки для получателя receiver"""
+        key = "relottery" if repeat else "lottery"
+        cards = self._cards.setdefault(receiver.user_id, {})
+        rendered = cards.get(key)
+        if rendered is None:
+            rendered = cards[key] = render_lottery_result(receiver, repeat)
+        return rendered
+
+    def invalidate(self, user_id: int = None):
+        """Сбрасывает карточки участника (или все, если user_id не указан)"""
+        if user_id is None:
+            self._cards.clear()
+        else:
+            self._cards.pop(user_id, None)
+
+    def on_change(self, op: dict):
+        """Подписчик на изменения BotData"""
+        kind = op.get("op")
+        if kind == "put":
+            self.invalidate(op["participant"]["user_id"])
+        elif kind == "import":
+            for record in op["participants"]:
+                self.invalidate(record["user_id"])
+        elif kind == "delete":
+            self.invalidate(op["user_id"])
+        elif kind == "clear":
+            self.invalidate()
+
+
+class ListPageCache:
+    """Кэш отрисованных страниц /list; сбрасывается при любом изменении участников"""
+
+    def __init__(self, page_size: int = LIST_PAGE_SIZE):
+        self.page_size = page_size
+        self.total: Optional[int] = None
+        self._pages: Dict[int, str] = {}
+
+    def get(self, page: int) -> Optional[str]:
+        return self._pages.get(page)
+
+    def put(self, page: int, text: str):
+        self._pages[page] = text
+
+    def invalidate(self):
+        """Сбрасывает все страницы"""
+        self._pages.clear()
+        self.total = None
+
+    def on_change(self, op: dict):
+        """Подписчик на изменения BotData: номера и пары на страницах сдвигаются при любом изменении"""
+        self.invalidate()
@@ -0,0 +1,312 @@
+"""Компактный бинарный снимок участников: типизированные целые и строки UTF-8 с длиной.
+
+Формат (little-endian):
+    заголовок      MAGIC (8 байт), число записей n (uint64)
+    user_id        int64[n]
+    assigned_to    int64[n], NO_ASSIGNMENT — пары нет
+    offsets        uint64[n], смещение строк записи от начала файла
+    строки         для каждой записи длины username, name, desired_book, comment
+                   (uint32[4]), затем сами строки в UTF-8 подряд
+
+Файл отображается в память (mmap), колонки целых читаются без разбора,
+а строки записи декодируются только при первом обращении к ней. Поэтому
+загрузка снимка на миллион участников занимает доли секунды вместо
+разбора JSON и создания миллиона объектов.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from dataclasses import asdict
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from metrics import STORAGE_BYTES, STORAGE_SECONDS
+
+MAGIC = b"BKSNAP\x00\x01"
+HEADER = struct.Struct("<8sQ")
+LENGTHS = struct.Struct("<4I")
+
+# Значение assigned_to, означающее «пара не назначена» (ID пользователей Telegram положительные)
+NO_ASSIGNMENT = 0
+
+STRING_FIELDS = ("username", "name", "desired_book", "comment")
+
+# Расширение файла бинарного снимка вместо .json
+BINARY_SUFFIX = ".bin"
+
+
+def binary_snapshot_path(data_file: str) -> str:
+    """participants.json -> participants.bin"""
+    return os.path.splitext(data_file)[0] + BINARY_SUFFIX
+
+
+def _column(buffer, start: int, count: int, typecode: str):
+    """Колонка из count 8-байтовых целых, начиная со start (без копирования на little-endian)"""
+    view = memoryview(buffer)[start:start + 8 * count]
+    if sys.byteorder == "little":
+        return view.cast(typecode)
+    column = array(typecode, view)
+    column.byteswap()
+    return column
+
+
+def _encode_strings(record: dict) -> bytes:
+    strings = [(record.get(field) or "").encode("utf-8") for field in STRING_FIELDS]
+    return LENGTHS.pack(*map(len, strings)) + b"".join(strings)
+
+
+class BinarySnapshot:
+    """Отображенный в память бинарный снимок; записи адресуются номером строки"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if os.name == "nt":
+                # Windows не дает заменить отображенный файл при следующей записи снимка
+                self._data = f.read()
+            else:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не бинарный снимок участников")
+        self.count = count
+        self.size = len(self._data)
+        start = HEADER.size
+        self.user_ids = _column(self._data, start, count, "q")
+        self.assigned = _column(self._data, start + 8 * count, count, "q")
+        self.offsets = _column(self._data, start + 16 * count, count, "Q")
+
+    def row(self, index: int) -> Tuple:
+        """Поля записи в порядке Participant: user_id, username, name, desired_book, comment, assigned_to"""
+        data = self._data
+        start = self.offsets[index]
+        username_len, name_len, book_len, comment_len = LENGTHS.unpack_from(data, start)
+        name = start + LENGTHS.size + username_len
+        book = name + name_len
+        comment = book + book_len
+        assigned_to = self.assigned[index]
+        return (
+            self.user_ids[index],
+            data[start + LENGTHS.size:name].decode("utf-8"),
+            data[name:book].decode("utf-8"),
+            data[book:comment].decode("utf-8"),
+            data[comment:comment + comment_len].decode("utf-8"),
+            assigned_to if assigned_to != NO_ASSIGNMENT else None,
+        )
+
+    def record(self, index: int) -> dict:
+        """Запись в формате JSON-снимка"""
+        user_id, username, name, desired_book, comment, assigned_to = self.row(index)
+        return {
+            "user_id": user_id,
+            "username": username,
+            "name": name,
+            "desired_book": desired_book,
+            "comment": comment,
+            "assigned_to": assigned_to,
+        }
+
+    def raw_strings(self, index: int) -> bytes:
+        """Закодированные строки записи как есть (для перезаписи снимка без декодирования)"""
+        end = self.offsets[index + 1] if index + 1 < self.count else self.size
+        return bytes(self._data[self.offsets[index]:end])
+
+
+class BinaryRecords(MutableMapping):
+    """Записи снимка по строковому user_id, как словарь из JSON-снимка.
+
+    Пока запись не прочитана и не изменена, вместо нее хранится номер строки
+    в снимке; при обращении она декодируется и дальше живет как обычный dict.
+    """
+
+    def __init__(self, snapshot: BinarySnapshot, rows: Dict[int, Union[int, dict]] = None):
+        self.snapshot = snapshot
+        if rows is None:
+            rows = dict(zip(snapshot.user_ids, range(snapshot.count)))
+        self._rows = rows
+
+    def __getitem__(self, key) -> dict:
+        user_id = int(key)
+        value = self._rows[user_id]
+        if type(value) is int:
+            value = self._rows[user_id] = self.snapshot.record(value)
+        return value
+
+    def __setitem__(self, key, record: dict):
+        self._rows[int(key)] = record
+
+    def __delitem__(self, key):
+        del self._rows[int(key)]
+
+    def __contains__(self, key) -> bool:
+        try:
+            return int(key) in self._rows
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self) -> Iterator[str]:
+        return map(str, self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def clear(self):
+        self._rows.clear()
+
+    def copy(self) -> "BinaryRecords":
+        """Независимая копия: непрочитанные записи остаются ссылками на снимок"""
+        return BinaryRecords(self.snapshot, {
+            user_id: value if type(value) is int else dict(value) for user_id, value in self._rows.items()
+        })
+
+
+class _LazyValues(ValuesView):
+    def __iter__(self):
+        return self._mapping._iter_values()
+
+
+class _LazyItems(ItemsView):
+    def __iter__(self):
+        return zip(self._mapping._items, self._mapping._iter_values())
+
+
+class LazyParticipants(MutableMapping):
+    """Участники по int user_id поверх бинарного снимка с декодированием при первом обращении.
+
+    Проверка `user_id in participants`, len и перебор ключей не декодируют
+    ничего. Первый полный перебор values() декодирует все записи, после
+    этого перебор идет со скоростью обычного словаря. Одинаковые имена,
+    книги и комментарии декодированных записей хранятся одной строкой.
+    """
+
+    def __init__(self, records: BinaryRecords, factory: Callable[..., object]):
+        self._snapshot = records.snapshot
+        self._factory = factory
+        # Номер строки снимка (еще не декодирован) или готовый участник
+        self._items = {
+            user_id: value if type(value) is int else factory(**value)
+            for user_id, value in records._rows.items()
+        }
+        self._undecoded = sum(1 for value in self._items.values() if type(value) is int)
+        # Пул строк на время декодирования (освобождается, когда декодировано все)
+        self._strings: Dict[str, str] = {}
+
+    def _row_decoded(self):
+        self._undecoded -= 1
+        if not self._undecoded:
+            self._strings = {}
+
+    def __getitem__(self, user_id: int):
+        value = self._items[user_id]
+        if type(value) is int:
+            _, username, name, desired_book, comment, assigned_to = self._snapshot.row(value)
+            pool = self._strings.setdefault
+            value = self._items[user_id] = self._factory(
+                user_id, username, pool(name, name), pool(desired_book, desired_book),
+                pool(comment, comment), assigned_to
+            )
+            self._row_decoded()
+        return value
+
+    def __setitem__(self, user_id: int, participant):
+        if type(self._items.get(user_id)) is int:
+            self._row_decoded()
+        self._items[user_id] = participant
+
+    def __delitem__(self, user_id: int):
+        if type(self._items.pop(user_id)) is int:
+            self._row_decoded()
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._items
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self):
+        self._items.clear()
+        self._undecoded = 0
+        self._strings = {}
+
+    def values(self):
+        return _LazyValues(self)
+
+    def items(self):
+        return _LazyItems(self)
+
+    def _iter_values(self):
+        if not self._undecoded:
+            return iter(self._items.values())
+        return self._decode_values()
+
+    def _decode_values(self):
+        for user_id, value in self._items.items():
+            if type(value) is int:
+                value = self[user_id]
+            yield value
+
+    def to_records(self) -> BinaryRecords:
+        """Записи в формате снимка; недекодированные остаются ссылками на снимок"""
+        return BinaryRecords(self._snapshot, {
+            user_id: value if type(value) is int else asdict(value) for user_id, value in self._items.items()
+        })
+
+
+def read_snapshot(path: str) -> BinaryRecords:
+    """Отображает бинарный снимок в память; записи декодируются при обращении"""
+    store = os.path.basename(path)
+    with STORAGE_SECONDS.labels(store, "load").time():
+        records = BinaryRecords(BinarySnapshot(path))
+    STORAGE_BYTES.labels(store, "load").inc(records.snapshot.size)
+    return records
+
+
+def write_snapshot(path: str, records: Union[BinaryRecords, Dict[str, dict]]):
+    """Атомарно записывает бинарный снимок: временный файл + fsync + os.replace.
+
+    Непрочитанные записи BinaryRecords копируются из старого снимка байтами, без декодирования.
+    """
+    user_ids, assigned, chunks = array("q"), array("q"), []
+    snapshot: Optional[BinarySnapshot] = None
+    if isinstance(records, BinaryRecords):
+        snapshot = records.snapshot
+        rows = records._rows.items()
+    else:
+        rows = ((int(record["user_id"]), record) for record in records.values())
+    for user_id, value in rows:
+        user_ids.append(user_id)
+        if type(value) is int:
+            assigned.append(snapshot.assigned[value])
+            chunks.append(snapshot.raw_strings(value))
+        else:
+            assigned.append(int(value.get("assigned_to") or NO_ASSIGNMENT))
+            chunks.append(_encode_strings(value))
+
+    count = len(user_ids)
+    offsets = array("Q")
+    offset = HEADER.size + 24 * count
+    for chunk in chunks:
+        offsets.append(offset)
+        offset += len(chunk)
+    if sys.byteorder != "little":
+        for column in (user_ids, assigned, offsets):
+            column.byteswap()
+
+    tmp_path = f"{path}.tmp"
+    store = os.path.basename(path)
+    with STORAGE_SECONDS.labels(store, "snapshot").time():
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count))
+            f.write(user_ids.tobytes())
+            f.write(assigned.tobytes())
+            f.write(offsets.tobytes())
+            f.write(b"".join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+    STORAGE_BYTES.labels(store, "snapshot").inc(size)
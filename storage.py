@@ -0,0 +1,539 @@
+"""Хранилища данных участников: снимок целиком (JSON или бинарный) или журнал с компактизацией"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional
+
+from metrics import STORAGE_BYTES, STORAGE_SECONDS
+from snapshot import BinaryRecords, binary_snapshot_path, read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Минимальное число записей в журнале, после которого запускается компактизация
+COMPACT_MIN_RECORDS = 1000
+
+# Форматы снимка: "json" (читается человеком) или "binary" (snapshot.py, быстрая загрузка)
+SNAPSHOT_FORMATS = ("json", "binary")
+
+
+def atomic_write_json(path: str, data: dict, indent: Optional[int] = 2):
+    """Атомарно записывает JSON: временный файл + fsync + os.replace"""
+    tmp_path = f"{path}.tmp"
+    store = os.path.basename(path)
+    separators = None if indent is not None else (",", ":")
+    if not isinstance(data, dict):
+        # Записи, загруженные из бинарного снимка
+        data = dict(data.items())
+    with STORAGE_SECONDS.labels(store, "snapshot").time():
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent, separators=separators)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+    STORAGE_BYTES.labels(store, "snapshot").inc(size)
+
+
+def apply_op(records: Dict[str, dict], op: dict):
+    """Применяет одну операцию журнала к словарю записей.
+
+    Все операции идемпотентны (устанавливают значение, а не изменяют его),
+    поэтому повторное проигрывание уже учтённого в снимке журнала безопасно.
+    """
+    kind = op.get("op")
+    if kind == "put":
+        record = op["participant"]
+        records[str(record["user_id"])] = record
+    elif kind == "import":
+        # Повторный импорт обновляет анкету, а пара прошедшей жеребьевки остается
+        for record in op["participants"]:
+            key = str(record["user_id"])
+            previous = records.get(key)
+            if previous is not None:
+                record = dict(record, assigned_to=previous.get("assigned_to"))
+            records[key] = record
+    elif kind == "delete":
+        records.pop(str(op["user_id"]), None)
+    elif kind == "assign":
+        for giver_id, receiver_id in op["assignments"].items():
+            if giver_id in records:
+                records[giver_id]["assigned_to"] = receiver_id
+    elif kind == "clear":
+        records.clear()
+    else:
+        logger.warning("Неизвестная операция журнала: %s", kind)
+
+
+def copy_records(records: Dict[str, dict]) -> Dict[str, dict]:
+    """Копия записей, которую не затронут дальнейшие изменения оригинала"""
+    if isinstance(records, BinaryRecords):
+        return records.copy()
+    return {pid: dict(record) for pid, record in records.items()}
+
+
+class JsonStorage:
+    """Хранит всех участников одним файлом-снимком и перезаписывает его при каждом изменении"""
+
+    def __init__(self, data_file: str, indent: Optional[int] = 2, snapshot_format: str = "json"):
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Неизвестный формат снимка: {snapshot_format}")
+        self.data_file = data_file
+        # None: снимок без отступов и пробелов (компактнее, но хуже читается)
+        self.indent = indent
+        self.snapshot_format = snapshot_format
+        self.binary_file = binary_snapshot_path(data_file)
+
+    def load(self) -> Dict[str, dict]:
+        """Читает снимок данных (словарь записей по строковому user_id).
+
+        Снимок в другом формате тоже читается: после смены SNAPSHOT_FORMAT
+        данные переходят в новый формат при следующей записи снимка.
+        """
+        if self.snapshot_format == "binary":
+            paths = (self.binary_file, self.data_file)
+        else:
+            paths = (self.data_file, self.binary_file)
+        path = next((path for path in paths if os.path.exists(path)), None)
+        if path is None:
+            return {}
+        if path == self.binary_file:
+            return read_snapshot(path)
+        store = os.path.basename(self.data_file)
+        with STORAGE_SECONDS.labels(store, "load").time():
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+                STORAGE_BYTES.labels(store, "load").inc(f.tell())
+        return records
+
+    def _write_snapshot_file(self, records: Dict[str, dict]):
+        """Атомарно записывает снимок в выбранном формате и удаляет снимок в другом"""
+        if self.snapshot_format == "binary":
+            path, stale = self.binary_file, self.data_file
+            write_snapshot(path, records)
+        else:
+            path, stale = self.data_file, self.binary_file
+            atomic_write_json(path, records, self.indent)
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    def save(self, records: Dict[str, dict]):
+        """Полностью перезаписывает снимок"""
+        self._write_snapshot_file(records)
+
+    def commit(self, ops: List[dict], snapshot: Callable[[], Dict[str, dict]]):
+        """Сохраняет пачку изменений; для JSON это одна полная перезапись файла"""
+        self.save(snapshot())
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+class JournalStorage(JsonStorage):
+    """Журнальное хранилище: снимок в data_file + журнал операций в формате JSON Lines.
+
+    Каждое изменение дописывается в журнал одной строкой, поэтому стоимость
+    регистрации не зависит от числа участников. Когда журнал становится
+    длиннее снимка, он ротируется и в фоновом потоке сворачивается в новый снимок.
+    """
+
+    def __init__(self, data_file: str, compact_min_records: int = COMPACT_MIN_RECORDS,
+                 apply: Callable[[Dict[str, dict], dict], None] = apply_op, indent: Optional[int] = 2,
+                 snapshot_format: str = "json"):
+        super().__init__(data_file, indent, snapshot_format)
+        self.journal_file = f"{data_file}.journal"
+        self.rotated_file = f"{data_file}.journal.old"
+        self.compact_min_records = compact_min_records
+        # Функция применения операции журнала к записям (по умолчанию операции участников)
+        self.apply = apply
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+        self._snapshot_size = 0
+        self._compaction: Optional[threading.Thread] = None
+
+    def load(self) -> Dict[str, dict]:
+        """Загружает снимок и проигрывает поверх него журнал"""
+        records = super().load()
+        self._snapshot_size = len(records)
+        replayed = 0
+        # Сначала ротированный журнал (если компактизация не успела завершиться), затем текущий
+        for path in (self.rotated_file, self.journal_file):
+            replayed += self._replay(path, records)
+        self._journal_records = replayed
+        if replayed:
+            logger.info("Из журнала восстановлено операций: %s", replayed)
+        if os.path.exists(self.rotated_file):
+            # Прошлая компактизация прервалась: сворачиваем журнал сразу
+            self.save(records)
+        return records
+
+    def _replay(self, path: str, records: Dict[str, dict]) -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        store = os.path.basename(self.data_file)
+        STORAGE_BYTES.labels(store, "replay").inc(os.path.getsize(path))
+        with STORAGE_SECONDS.labels(store, "replay").time(), open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя запись после сбоя при дозаписи
+                    logger.warning("Пропущена повреждённая запись журнала в %s", path)
+                    continue
+                self.apply(records, op)
+                count += 1
+        return count
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        return self._journal
+
+    def append(self, ops: List[dict]):
+        """Дописывает операции в журнал и сбрасывает его на диск"""
+        store = os.path.basename(self.data_file)
+        separators = None if self.indent is not None else (",", ":")
+        data = "".join(json.dumps(op, ensure_ascii=False, separators=separators) + "\n" for op in ops)
+        with self._lock, STORAGE_SECONDS.labels(store, "journal").time():
+            journal = self._open_journal()
+            journal.write(data)
+            journal.flush()
+            os.fsync(journal.fileno())
+            self._journal_records += len(ops)
+        STORAGE_BYTES.labels(store, "journal").inc(len(data.encode('utf-8')))
+
+    def commit(self, ops: List[dict], snapshot: Callable[[], Dict[str, dict]]):
+        """Дописывает операции и при необходимости запускает фоновую компактизацию"""
+        self.append(ops)
+        if self._journal_records >= max(self.compact_min_records, self._snapshot_size):
+            self.compact(snapshot)
+
+    def compact(self, snapshot: Callable[[], Dict[str, dict]]) -> bool:
+        """Ротирует журнал и в фоне записывает новый снимок"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return False
+        if os.path.exists(self.rotated_file):
+            # Предыдущая компактизация не завершилась: снимок её не учёл,
+            # поэтому её журнал пока нельзя перезаписывать
+            return False
+        records = snapshot()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_file):
+                os.replace(self.journal_file, self.rotated_file)
+            self._journal_records = 0
+        self._snapshot_size = len(records)
+        self._compaction = threading.Thread(
+            target=self._write_snapshot, args=(records,), name="journal-compaction", daemon=True
+        )
+        self._compaction.start()
+        return True
+
+    def _write_snapshot(self, records: Dict[str, dict]):
+        try:
+            self._write_snapshot_file(records)
+            os.remove(self.rotated_file)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("Ошибка компактизации журнала: %s", e)
+
+    def wait_compaction(self):
+        """Дожидается завершения фоновой компактизации"""
+        if self._compaction is not None:
+            self._compaction.join()
+
+    def save(self, records: Dict[str, dict]):
+        """Синхронно записывает полный снимок и очищает журнал"""
+        self.wait_compaction()
+        with self._lock:
+            self._write_snapshot_file(records)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            for path in (self.journal_file, self.rotated_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._journal_records = 0
+        self._snapshot_size = len(records)
+
+    def close(self):
+        """Дожидается компактизации и закрывает журнал"""
+        self.wait_compaction()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                self._journal = None
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+}
+
+
+def create_storage(mode: str, data_file: str, snapshot_format: str = "json") -> JsonStorage:
+    """Создаёт хранилище по названию режима"""
+    try:
+        return STORAGE_BACKENDS[mode](data_file, snapshot_format=snapshot_format)
+    except KeyError:
+        raise ValueError(f"Неизвестный режим хранения: {mode}")
+
+
+# ==================== SQLITE ====================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    event TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    name TEXT NOT NULL,
+    desired_book TEXT NOT NULL,
+    comment TEXT NOT NULL DEFAULT '',
+    assigned_to INTEGER,
+    PRIMARY KEY (event, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_participants_assigned_to ON participants (event, assigned_to);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+PARTICIPANT_COLUMNS = ("user_id", "username", "name", "desired_book", "comment", "assigned_to")
+_SELECT = f"SELECT {', '.join(PARTICIPANT_COLUMNS)} FROM participants"
+
+
+class _SharedConnection:
+    """Соединение с файлом базы и его блокировка, общие для всех мероприятий процесса"""
+
+    def __init__(self, db_file: str):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+        self.users = 0
+
+
+_connections: Dict[str, _SharedConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def _acquire_connection(db_file: str) -> _SharedConnection:
+    key = os.path.abspath(db_file)
+    with _connections_lock:
+        shared = _connections.get(key)
+        if shared is None:
+            shared = _connections[key] = _SharedConnection(db_file)
+        shared.users += 1
+        return shared
+
+
+def _release_connection(db_file: str):
+    key = os.path.abspath(db_file)
+    with _connections_lock:
+        shared = _connections[key]
+        shared.users -= 1
+        if shared.users:
+            return
+        del _connections[key]
+    with shared.lock:
+        shared.conn.commit()
+        shared.conn.close()
+
+
+class SqliteStorage:
+    """Хранит участников в SQLite (WAL) с индексами по user_id и assigned_to.
+
+    Запросы выполняются сразу (под блокировкой, соединение общее для потоков),
+    а COMMIT делает поток записи, объединяя изменения в одну транзакцию.
+    Мероприятия с одним файлом базы делят одно соединение: незафиксированные
+    изменения одного мероприятия не держат блокировку записи от другого.
+    """
+
+    def __init__(self, db_file: str, event: str = "default"):
+        self.db_file = db_file
+        self.event = event
+        shared = _acquire_connection(db_file)
+        self._lock = shared.lock
+        self._conn = shared.conn
+        self._closed = False
+
+    def _fetchone(self, sql: str, params=()) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def get(self, user_id: int) -> Optional[tuple]:
+        """Возвращает строку участника или None"""
+        return self._fetchone(f"{_SELECT} WHERE event = ? AND user_id = ?", (self.event, user_id))
+
+    def count(self) -> int:
+        """Число участников"""
+        return self._fetchone(
+            "SELECT COUNT(*) FROM participants WHERE event = ?", (self.event,)
+        )[0]
+
+    def count_assigned(self) -> int:
+        """Число участников с назначенной парой"""
+        return self._fetchone(
+            "SELECT COUNT(*) FROM participants WHERE event = ? AND assigned_to IS NOT NULL",
+            (self.event,)
+        )[0]
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[tuple]:
+        """Итерирует строки участников порциями, не загружая всю таблицу в память"""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT rowid, {', '.join(PARTICIPANT_COLUMNS)} FROM participants "
+                    "WHERE event = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (self.event, last_rowid, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def page(self, offset: int, limit: int) -> List[tuple]:
+        """Строки участников в порядке регистрации, начиная с offset"""
+        with self._lock:
+            return self._conn.execute(
+                f"{_SELECT} WHERE event = ? ORDER BY rowid LIMIT ? OFFSET ?",
+                (self.event, limit, offset)
+            ).fetchall()
+
+    def iter_ids(self) -> Iterator[int]:
+        """Итерирует user_id участников"""
+        for row in self.iter_rows():
+            yield row[0]
+
+    def apply(self, op: dict):
+        """Выполняет операцию журнала без COMMIT"""
+        kind = op.get("op")
+        with self._lock:
+            if kind == "put":
+                record = op["participant"]
+                self._conn.execute(
+                    "INSERT INTO participants (event, user_id, username, name, desired_book, comment, assigned_to) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (event, user_id) DO UPDATE SET username = excluded.username, "
+                    "name = excluded.name, desired_book = excluded.desired_book, "
+                    "comment = excluded.comment, assigned_to = excluded.assigned_to",
+                    (self.event, *(record.get(column) for column in PARTICIPANT_COLUMNS))
+                )
+            elif kind == "import":
+                # В отличие от put, assigned_to уже записанных участников не трогаем
+                self._conn.executemany(
+                    "INSERT INTO participants (event, user_id, username, name, desired_book, comment, assigned_to) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (event, user_id) DO UPDATE SET username = excluded.username, "
+                    "name = excluded.name, desired_book = excluded.desired_book, "
+                    "comment = excluded.comment",
+                    ((self.event, *(record.get(column) for column in PARTICIPANT_COLUMNS))
+                     for record in op["participants"])
+                )
+            elif kind == "delete":
+                self._conn.execute(
+                    "DELETE FROM participants WHERE event = ? AND user_id = ?", (self.event, op["user_id"])
+                )
+            elif kind == "assign":
+                self._conn.executemany(
+                    "UPDATE participants SET assigned_to = ? WHERE event = ? AND user_id = ?",
+                    ((receiver_id, self.event, int(giver_id))
+                     for giver_id, receiver_id in op["assignments"].items())
+                )
+            elif kind == "clear":
+                self._conn.execute("DELETE FROM participants WHERE event = ?", (self.event,))
+            else:
+                logger.warning("Неизвестная операция: %s", kind)
+
+    def commit(self, ops: List[dict] = None, snapshot: Callable[[], Dict[str, dict]] = None):
+        """Фиксирует накопленные изменения одной транзакцией"""
+        with self._lock, STORAGE_SECONDS.labels(os.path.basename(self.db_file), "commit").time():
+            self._conn.commit()
+
+    def save(self, records: Dict[str, dict] = None):
+        """Для SQLite полный снимок не нужен: достаточно COMMIT"""
+        self.commit()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._fetchone("SELECT value FROM meta WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate_from_json(self, json_file: str) -> int:
+        """Однократно переносит участников из participants.json или .bin (и журнала) в SQLite"""
+        meta_key = f"migrated:{self.event}:{os.path.abspath(json_file)}"
+        if self.get_meta(meta_key) is not None:
+            return 0
+        if not (os.path.exists(json_file) or os.path.exists(binary_snapshot_path(json_file))):
+            return 0
+        records = JournalStorage(json_file).load()
+        with self._lock:
+            for record in records.values():
+                self.apply({"op": "put", "participant": record})
+            self.set_meta(meta_key, str(len(records)))
+            self._conn.commit()
+        logger.info("Перенесено участников из %s в %s: %s", json_file, self.db_file, len(records))
+        return len(records)
+
+    def close(self):
+        """Фиксирует изменения; соединение закрывается вместе с последним мероприятием"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            self._conn.commit()
+        _release_connection(self.db_file)
+
+
+class SqliteParticipants(Mapping):
+    """Словарь участников поверх SQLite: user_id -> Participant без загрузки всей таблицы"""
+
+    def __init__(self, store: SqliteStorage, factory: Callable[..., object]):
+        self.store = store
+        self.factory = factory
+
+    def build(self, row: Optional[tuple]):
+        """Participant из строки таблицы (None для None)"""
+        if row is None:
+            return None
+        return self.factory(**dict(zip(PARTICIPANT_COLUMNS, row)))
+
+    def __getitem__(self, user_id: int):
+        participant = self.build(self.store.get(user_id))
+        if participant is None:
+            raise KeyError(user_id)
+        return participant
+
+    def __contains__(self, user_id) -> bool:
+        return self.store.get(user_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return self.store.iter_ids()
+
+    def __len__(self) -> int:
+        return self.store.count()
+
+    def values(self):
+        return (self.build(row) for row in self.store.iter_rows())
+
+    def items(self):
+        return ((participant.user_id, participant) for participant in self.values())
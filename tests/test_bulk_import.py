@@ -0,0 +1,58 @@
+"""Повторный импорт участников не сбрасывает пары прошедшей жеребьевки"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bulk_import import read_bytes  # noqa: E402
+
+# Кто кому дарит после жеребьевки
+DRAW = {1: 3, 2: 4, 3: 2, 4: 1}
+
+
+def csv_records(rows):
+    lines = ["user_id,username,name,desired_book,comment"]
+    lines += [f"{user_id},u{user_id},Имя {user_id},{book}," for user_id, book in rows]
+    report = read_bytes("\n".join(lines).encode(), "csv")
+    assert not report.errors
+    return report.records
+
+
+@pytest.fixture(params=["json", "journal", "sqlite"])
+def open_bot_data(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import book_bot
+
+    opened = []
+
+    def open_bot_data():
+        if request.param == "sqlite":
+            data = book_bot.SqliteBotData(str(tmp_path / "participants.json"), str(tmp_path / "participants.db"))
+        else:
+            data = book_bot.BotData(str(tmp_path / "participants.json"), request.param)
+        opened.append(data)
+        return data
+
+    yield open_bot_data
+    for data in opened:
+        data.close()
+
+
+def test_reimport_keeps_assignments(open_bot_data):
+    data = open_bot_data()
+    assert data.import_participants(csv_records((user_id, f"Книга {user_id}") for user_id in DRAW)) == len(DRAW)
+    data.set_assignments(DRAW)
+
+    # Участник 2 исправил анкету в форме на сайте, файл импортируется снова
+    assert data.import_participants(csv_records([(2, "Новая книга")])) == 0
+    assert data.get_participant(2).desired_book == "Новая книга"
+    assert {p.user_id: p.assigned_to for p in data.get_all_participants()} == DRAW
+    data.close()
+
+    # То же после перезапуска: из снимка, журнала или базы
+    reloaded = open_bot_data()
+    assert reloaded.get_participant(2).desired_book == "Новая книга"
+    assert {p.user_id: p.assigned_to for p in reloaded.get_all_participants()} == DRAW
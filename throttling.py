@@ -0,0 +1,97 @@
+"""Ограничение частоты обновлений от одного пользователя: token bucket и отсев повторных нажатий"""
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from metrics import THROTTLED_UPDATES, THROTTLE_EVICTIONS
+
+# Решения UserThrottle.check
+ALLOW = "allow"
+RATE_LIMITED = "rate"
+DUPLICATE = "duplicate"
+
+
+class _UserState:
+    __slots__ = ("tokens", "updated_at", "callback", "callback_at", "noticed_at")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+        # Последнее нажатие кнопки: (id сообщения, callback_data) и когда оно было
+        self.callback = None
+        self.callback_at = 0.0
+        self.noticed_at = float("-inf")
+
+
+class UserThrottle:
+    """Token bucket на пользователя: burst обновлений подряд, дальше rate в секунду.
+
+    Повторное нажатие той же кнопки того же сообщения в течение
+    duplicate_window считается дублем. Состояния пользователей хранятся в
+    порядке последнего обращения: простаивающие дольше idle_ttl удаляются при
+    проверках, а сверх max_users вытесняются самые давние, так что память
+    ограничена при любом числе пользователей. Вытесненный пользователь просто
+    начинает с полного bucket.
+    """
+
+    def __init__(self, rate: float, burst: int, max_users: int = 100_000, idle_ttl: float = 600,
+                 duplicate_window: float = 2.0, notice_interval: float = 10,
+                 exempt: Iterable[int] = ()):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.duplicate_window = duplicate_window
+        self.notice_interval = notice_interval
+        self.exempt = set(exempt)
+        self._users: "OrderedDict[int, _UserState]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def check(self, user_id: int, callback: Optional[tuple] = None, now: float = None) -> str:
+        """Списывает токен за обновление; callback — (id сообщения, callback_data) для нажатий кнопок"""
+        if user_id in self.exempt:
+            return ALLOW
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(self.burst, now)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                THROTTLE_EVICTIONS.labels("capacity").inc()
+        else:
+            self._users.move_to_end(user_id)
+            state.tokens = min(self.burst, state.tokens + (now - state.updated_at) * self.rate)
+            state.updated_at = now
+
+        if state.tokens < 1:
+            THROTTLED_UPDATES.labels(RATE_LIMITED).inc()
+            return RATE_LIMITED
+        state.tokens -= 1
+
+        if callback is not None:
+            if callback == state.callback and now - state.callback_at < self.duplicate_window:
+                THROTTLED_UPDATES.labels(DUPLICATE).inc()
+                return DUPLICATE
+            state.callback, state.callback_at = callback, now
+        return ALLOW
+
+    def should_notice(self, user_id: int, now: float = None) -> bool:
+        """Сообщать ли пользователю об ограничении (не чаще раза в notice_interval)"""
+        state = self._users.get(user_id)
+        now = time.monotonic() if now is None else now
+        if state is None or now - state.noticed_at < self.notice_interval:
+            return False
+        state.noticed_at = now
+        return True
+
+    def _evict_idle(self, now: float):
+        users = self._users
+        while users:
+            user_id, state = next(iter(users.items()))
+            if now - state.updated_at < self.idle_ttl:
+                break
+            del users[user_id]
+            THROTTLE_EVICTIONS.labels("idle").inc()
@@ -0,0 +1,65 @@
+"""Параллельная обработка обновлений разных пользователей с сохранением порядка для каждого"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных пользователей обрабатываются параллельно, одного пользователя — строго по очереди.
+
+    Так состояния ConversationHandler (NAME/BOOK/COMMENT/CONFIRM) не перепутаются,
+    а медленный запрос одного пользователя не задерживает остальных. Общее число
+    одновременно обрабатываемых обновлений ограничивает семафор базового класса
+    (max_concurrent_updates, MAX_CONCURRENT_UPDATES в book_bot); обновление,
+    ждущее своей очереди у пользователя, уже занимает слот.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Замки пользователей и число ожидающих их обновлений; пустые удаляются
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    @property
+    def active_users(self) -> int:
+        """Число пользователей, чьи обновления сейчас в работе или в очереди"""
+        return len(self._locks)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Ждет своей очереди у пользователя и обрабатывает обновление"""
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            # Семафор и asyncio.Lock будят ожидающих по порядку, поэтому порядок обновлений сохраняется
+            async with lock:
+                await coroutine
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass